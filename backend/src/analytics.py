@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from sqlalchemy import select, func, cast, text, Date
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import ANALYTICS_REFRESH_INTERVAL
+from database import engine
+from metrics import Gauge, registry
+from models import (
+    MembershipDaily,
+    MembershipStatus,
+    MembershipStatusCount,
+    RevenueDaily,
+    RollupWatermark,
+)
+from money import MoneyType
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory lock ids, see migrations.MIGRATION_LOCK_ID
+REFRESH_LOCK_ID = 7_001_002
+
+
+class RefreshStats:
+    def __init__(self):
+        self.last_run_rows = 0
+        self.last_run_seconds = 0.0
+
+
+refresh_stats = RefreshStats()
+
+registry.register(
+    'analytics_refresh_last_run_seconds',
+    'Duration of the last analytics refresh.',
+    Gauge(lambda: refresh_stats.last_run_seconds),
+)
+
+
+async def refresh_analytics() -> int | None:
+    # Daily rollups from their watermark, then the status counts. Every
+    # worker runs the loop, the first to take the lock does the work and
+    # the others skip (None). Transaction scoped, so it also holds behind
+    # a transaction pooler.
+    started = time.perf_counter()
+
+    async with engine.begin() as conn:
+        locked = await conn.scalar(
+            text('SELECT pg_try_advisory_xact_lock(:id)'), {'id': REFRESH_LOCK_ID}
+        )
+        if not locked:
+            logger.debug("analytics refresh already running elsewhere, skipped")
+            return None
+        rows = await conn.scalar(text('SELECT refresh_daily_rollups()'))
+        await conn.execute(text('REFRESH MATERIALIZED VIEW CONCURRENTLY membership_status_counts'))
+
+    refresh_stats.last_run_rows = rows
+    refresh_stats.last_run_seconds = time.perf_counter() - started
+    logger.info(
+        "analytics refreshed, %d revenue rows rebuilt in %.3fs",
+        rows, refresh_stats.last_run_seconds,
+    )
+    return rows
+
+
+async def refresh_forever() -> None:
+    while True:
+        try:
+            await refresh_analytics()
+        except Exception:
+            logger.exception("analytics refresh failed")
+        await asyncio.sleep(ANALYTICS_REFRESH_INTERVAL)
+
+
+@dataclass
+class AnalyticsReport:
+    since: date
+    refreshed_at: datetime | None
+    # (month, id_gym, currency, payments, amount)
+    revenue_by_gym: list[tuple]
+    # (month, id_membership_type, started)
+    started_by_type: list[tuple]
+    # id_membership_type -> active members
+    active_by_type: dict[int, int]
+
+
+def _month_start(months_back: int) -> date:
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - months_back
+    return date(index // 12, index % 12 + 1, 1)
+
+
+async def load_report(db: AsyncSession, months: int) -> AnalyticsReport:
+    # Reads only the aggregates, never payments or memberships
+    since = _month_start(months - 1)
+
+    revenue_month = cast(func.date_trunc('month', RevenueDaily.day), Date).label('month')
+    revenue_by_gym = (
+        await db.execute(
+            select(
+                revenue_month,
+                RevenueDaily.id_gym,
+                RevenueDaily.currency,
+                func.sum(RevenueDaily.payments),
+                cast(func.sum(RevenueDaily.amount), MoneyType),
+            )
+            .where(RevenueDaily.day >= since)
+            .group_by(revenue_month, RevenueDaily.id_gym, RevenueDaily.currency)
+            .order_by(revenue_month, RevenueDaily.id_gym, RevenueDaily.currency)
+        )
+    ).all()
+
+    started_month = cast(func.date_trunc('month', MembershipDaily.day), Date).label('month')
+    started_by_type = (
+        await db.execute(
+            select(started_month, MembershipDaily.id_membership_type, func.sum(MembershipDaily.started))
+            .where(MembershipDaily.day >= since)
+            .group_by(started_month, MembershipDaily.id_membership_type)
+            .order_by(started_month, MembershipDaily.id_membership_type)
+        )
+    ).all()
+
+    active_by_type = dict(
+        (
+            await db.execute(
+                select(MembershipStatusCount.id_membership_type, func.sum(MembershipStatusCount.members))
+                .where(MembershipStatusCount.membership_status == MembershipStatus.Active)
+                .group_by(MembershipStatusCount.id_membership_type)
+            )
+        ).all()
+    )
+
+    refreshed_at = await db.scalar(
+        select(RollupWatermark.refreshed_at).where(RollupWatermark.name == 'daily')
+    )
+
+    return AnalyticsReport(
+        since=since,
+        refreshed_at=refreshed_at,
+        revenue_by_gym=[tuple(row) for row in revenue_by_gym],
+        started_by_type=[tuple(row) for row in started_by_type],
+        active_by_type=active_by_type,
+    )
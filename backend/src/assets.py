@@ -0,0 +1,49 @@
+import hashlib
+import os
+
+from fastapi.staticfiles import StaticFiles
+
+from config import STYLES
+
+# Hashed names change with the content, so responses can be cached forever
+IMMUTABLE = 'public, max-age=31536000, immutable'
+HASH_LENGTH = 12
+
+
+class HashedStaticFiles(StaticFiles):
+    # Serves style.css both as style.css and as style.<hash>.css
+    def __init__(self, *, directory: str):
+        super().__init__(directory=directory)
+        self._hashed_names: dict[str, str] = {}
+        self._original_names: dict[str, str] = {}
+
+        for root, _, files in os.walk(directory):
+            for file_name in files:
+                full_path = os.path.join(root, file_name)
+                name = os.path.relpath(full_path, directory).replace(os.sep, '/')
+                with open(full_path, 'rb') as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()[:HASH_LENGTH]
+
+                stem, ext = os.path.splitext(name)
+                hashed = f'{stem}.{digest}{ext}'
+                self._hashed_names[name] = hashed
+                self._original_names[hashed] = name
+
+    def hashed_name(self, name: str) -> str:
+        return self._hashed_names.get(name, name)
+
+    def hashed_names(self) -> list[str]:
+        return list(self._original_names)
+
+    async def get_response(self, path: str, scope):
+        original = self._original_names.get(path)
+        if original is None:
+            return await super().get_response(path, scope)
+
+        response = await super().get_response(original, scope)
+        if response.status_code in (200, 304):
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+styles = HashedStaticFiles(directory=STYLES)
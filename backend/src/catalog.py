@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass
+
+import asyncpg
+from sqlalchemy import select, text
+from sqlalchemy.orm import joinedload
+
+from config import REFERENCE_CACHE_NOTIFY, REFERENCE_CACHE_TTL
+from database import SessionLocal, engine, raw_dsn
+from models import MembershipType, Gym, Group
+
+NOTIFY_CHANNEL = 'reference_data'
+# Seconds before reconnecting, doubled per failure up to the maximum
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Catalog:
+    version: int
+    membership_types: list[MembershipType]
+    gyms: list[Gym]
+    groups: list[Group]
+    # Content hash, identical in every worker holding the same data
+    digest: str
+    # reference_data_version when the rows were read
+    shared_version: int
+
+
+def _digest(*row_lists) -> str:
+    h = hashlib.sha256()
+    for rows in row_lists:
+        for row in rows:
+            for attr in row.__mapper__.column_attrs:
+                h.update(repr(getattr(row, attr.key)).encode())
+                h.update(b'\0')
+    return h.hexdigest()
+
+
+class ReferenceCache:
+    def __init__(self):
+        self.version = 0
+        self._catalog: Catalog | None = None
+        self._lock = asyncio.Lock()
+        self._listener: asyncio.Task | None = None
+        self._check_after = 0.0
+
+    async def get(self, fresh: bool = False) -> Catalog:
+        # fresh compares with the shared version first, for pages that must
+        # show an admin change made through another worker
+        if fresh or time.monotonic() >= self._check_after:
+            await self._check()
+
+        catalog = self._catalog
+        if catalog is not None and catalog.version == self.version:
+            return catalog
+
+        async with self._lock:
+            if self._catalog is not None and self._catalog.version == self.version:
+                return self._catalog
+
+            version = self.version
+            catalog = await self._load(version)
+            # An invalidation during the load makes the result stale
+            if version == self.version:
+                self._catalog = catalog
+
+            return catalog
+
+    async def _check(self) -> None:
+        self._check_after = time.monotonic() + REFERENCE_CACHE_TTL
+        catalog = self._catalog
+        if catalog is None:
+            return
+
+        async with engine.connect() as conn:
+            shared_version = await conn.scalar(text('SELECT version FROM reference_data_version'))
+        if shared_version != catalog.shared_version:
+            self._bump()
+
+    async def _load(self, version: int) -> Catalog:
+        # Own session, the cached rows must not be tied to a request
+        async with SessionLocal() as db:
+            shared_version = await db.scalar(text('SELECT version FROM reference_data_version'))
+            membership_types = (
+                await db.scalars(select(MembershipType).order_by(MembershipType.id_membership_type))
+            ).all()
+            gyms = (await db.scalars(select(Gym).order_by(Gym.id_gym))).all()
+            groups = (
+                await db.scalars(
+                    select(Group)
+                    .order_by(Group.id_group)
+                    .options(joinedload(Group.trainer), joinedload(Group.gym))
+                )
+            ).all()
+
+        return Catalog(
+            version=version,
+            membership_types=list(membership_types),
+            gyms=list(gyms),
+            groups=list(groups),
+            digest=_digest(membership_types, gyms, groups, [g.trainer for g in groups]),
+            shared_version=shared_version,
+        )
+
+    def _bump(self) -> None:
+        self.version += 1
+        self._catalog = None
+
+    async def invalidate(self) -> None:
+        # Call after the admin change is committed. The other workers are
+        # notified by the reference_data_version triggers.
+        self._bump()
+
+    def start_listener(self) -> None:
+        if REFERENCE_CACHE_NOTIFY and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    async def stop_listener(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+
+    async def _listen(self) -> None:
+        dsn = raw_dsn()
+        delay = RECONNECT_DELAY
+
+        while True:
+            closed = asyncio.Event()
+            try:
+                conn = await asyncpg.connect(dsn)
+                try:
+                    conn.add_termination_listener(lambda _: closed.set())
+                    await conn.add_listener(NOTIFY_CHANNEL, lambda *_: self._bump())
+                    # Changes may have been missed while disconnected
+                    self._bump()
+                    delay = RECONNECT_DELAY
+                    await closed.wait()
+                finally:
+                    await conn.close()
+                logger.warning("reference cache listener lost its connection, reconnecting")
+            except Exception:
+                # Any failure, a dead listener would leave the cache stale
+                # until the TTL check
+                logger.exception("reference cache listener failed, retrying in %ds", delay)
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+
+reference_cache = ReferenceCache()
@@ -0,0 +1,177 @@
+import zlib
+
+from config import COMPRESSION_MIN_SIZE, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:
+    # Optional, without it only gzip is offered
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    b'text/',
+    b'application/json',
+    b'application/javascript',
+    b'image/svg+xml',
+)
+
+
+class _GzipEncoder:
+    name = b'gzip'
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        # Flushed so every streamed chunk can be decoded on arrival
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    name = b'br'
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data) + self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+# In order of preference
+ENCODERS = (_BrotliEncoder, _GzipEncoder) if brotli is not None else (_GzipEncoder,)
+
+
+def _choose_encoder(scope):
+    # Highest q-value wins, br before gzip on a tie, q=0 refuses a coding
+    weights = {}
+    for name, value in scope['headers']:
+        if name != b'accept-encoding':
+            continue
+        for part in value.lower().split(b','):
+            coding, _, params = part.partition(b';')
+            q = 1.0
+            for param in params.split(b';'):
+                key, _, number = param.partition(b'=')
+                if key.strip() == b'q':
+                    try:
+                        q = float(number)
+                    except ValueError:
+                        q = 0.0
+            weights[coding.strip()] = q
+
+    chosen, best = None, 0.0
+    for encoder_class in ENCODERS:
+        q = weights.get(encoder_class.name, weights.get(b'*', 0.0))
+        if q > best:
+            chosen, best = encoder_class, q
+    return chosen
+
+
+class CompressionMiddleware:
+    # Compresses text responses of at least COMPRESSION_MIN_SIZE bytes,
+    # streamed responses are compressed chunk by chunk. Every text response
+    # varies on Accept-Encoding, compressed or not.
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoder_class = _choose_encoder(scope)
+        start = None
+        encoder = None
+        pending = []
+        passthrough = False
+
+        async def compress_send(message):
+            nonlocal start, encoder, passthrough
+
+            if message['type'] == 'http.response.start':
+                headers = dict(message.get('headers', []))
+                content_type = headers.get(b'content-type', b'')
+                passthrough = (
+                    b'content-encoding' in headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough and message['status'] != 304:
+                    await send(message)
+                    return
+                # A 304 carries the Vary of the response it stands for
+                message = {**message, 'headers': _vary_headers(message.get('headers', []))}
+                if passthrough:
+                    await send(message)
+                    return
+                if encoder_class is None:
+                    passthrough = True
+                    await send(message)
+                else:
+                    start = message
+                return
+
+            if message['type'] != 'http.response.body' or passthrough:
+                await send(message)
+                return
+
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+
+            if encoder is None:
+                # Streamed bodies are held back until the threshold is reached
+                pending.append(body)
+                body = b''.join(pending)
+                if len(body) < COMPRESSION_MIN_SIZE:
+                    if more_body:
+                        return
+                    passthrough = True
+                    await send(start)
+                    await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+                    return
+
+                encoder = encoder_class()
+                await send({**start, 'headers': _compressed_headers(start, encoder.name)})
+
+            data = encoder.compress(body)
+            if not more_body:
+                data += encoder.finish()
+            await send({'type': 'http.response.body', 'body': data, 'more_body': more_body})
+
+        await self.app(scope, receive, compress_send)
+
+
+def _vary_headers(headers) -> list[tuple[bytes, bytes]]:
+    result = []
+    vary = None
+    for name, value in headers:
+        if name == b'vary':
+            vary = value if vary is None else vary + b', ' + value
+            continue
+        result.append((name, value))
+
+    if vary is None:
+        vary = b'Accept-Encoding'
+    elif not {v.strip() for v in vary.lower().split(b',')} & {b'accept-encoding', b'*'}:
+        vary += b', Accept-Encoding'
+    result.append((b'vary', vary))
+    return result
+
+
+def _compressed_headers(start, coding: bytes) -> list[tuple[bytes, bytes]]:
+    headers = []
+    for name, value in start.get('headers', []):
+        if name == b'content-length':
+            continue
+        if name == b'etag' and not value.startswith(b'W/'):
+            # The encoded bytes differ from the identity representation
+            value = b'W/' + value
+        headers.append((name, value))
+
+    headers.append((b'content-encoding', coding))
+    return headers
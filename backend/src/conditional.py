@@ -0,0 +1,40 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+# Dashboards may be stored but must be revalidated on every navigation
+REVALIDATE = 'private, no-cache'
+
+
+def make_etag(*parts) -> str:
+    # Weak, the markup differs per render (e.g. idempotency keys). Pages
+    # with keyed forms pass idempotency.form_generation() as a part.
+    digest = hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith('W/') else tag
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return _opaque(etag) in {_opaque(tag) for tag in header.split(',')}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers={'ETag': etag, 'Cache-Control': REVALIDATE},
+    )
+
+
+def with_etag(response: Response, etag: str) -> Response:
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = REVALIDATE
+    return response
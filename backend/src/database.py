@@ -1,21 +1,115 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+import time
 
-from config import POSTGRESQL
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy import event, exc
 
-engine = create_engine(POSTGRESQL)
+from config import (
+    POSTGRESQL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT,
+    DB_EXTERNAL_POOLER,
+)
 
-SessionLocal = sessionmaker(
-    autocommit=False,
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        pool_stats.record_wait(time.perf_counter() - start)
+        return connection
+
+
+connect_args = {}
+if DB_STATEMENT_TIMEOUT and not DB_EXTERNAL_POOLER:
+    connect_args['server_settings'] = {'statement_timeout': str(DB_STATEMENT_TIMEOUT)}
+
+if DB_EXTERNAL_POOLER:
+    # The external pooler owns the connections, prepared statements
+    # do not survive across its transactions
+    connect_args['statement_cache_size'] = 0
+    connect_args['prepared_statement_cache_size'] = 0
+    engine = create_async_engine(
+        POSTGRESQL,
+        poolclass=NullPool,
+        connect_args=connect_args,
+    )
+
+    if DB_STATEMENT_TIMEOUT:
+        # PgBouncer rejects unknown startup parameters, and a session level
+        # SET would outlive the transaction on a shared server connection
+        @event.listens_for(engine.sync_engine, 'begin')
+        def _statement_timeout(conn):
+            conn.exec_driver_sql(f'SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT}')
+else:
+    engine = create_async_engine(
+        POSTGRESQL,
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
     autoflush=False,
-    bind=engine
+    expire_on_commit=False,
     )
 
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+def get_pool_metrics() -> dict:
+    pool = engine.sync_engine.pool
+    metrics = {
+        'checkouts': pool_stats.checkouts,
+        'timeouts': pool_stats.timeouts,
+        'wait_seconds_total': round(pool_stats.wait_total, 6),
+        'wait_seconds_max': round(pool_stats.wait_max, 6),
+    }
+
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        metrics.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        })
+
+    return metrics
+
+def raw_dsn() -> str:
+    # DSN for plain asyncpg connections outside the pool
+    return engine.url.set(drivername='postgresql').render_as_string(hide_password=False)
+
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -0,0 +1,82 @@
+import asyncio
+import logging
+import time
+
+from sqlalchemy import text
+
+from config import MEMBERSHIP_EXPIRY_INTERVAL, MEMBERSHIP_EXPIRY_BATCH
+from database import engine
+from metrics import Counter, Gauge, registry
+
+logger = logging.getLogger(__name__)
+
+# One batch per transaction, SKIP LOCKED lets several workers share the backlog
+EXPIRE_BATCH = text(
+    '''
+    WITH due AS (
+        SELECT id_membership
+        FROM memberships
+        WHERE membership_status = 'Active'
+          AND membership_stop <= CURRENT_DATE
+        ORDER BY membership_stop
+        LIMIT :batch
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE memberships AS m
+    SET membership_status = 'Expired'
+    FROM due
+    WHERE m.id_membership = due.id_membership
+    '''
+)
+
+
+class ExpiryStats:
+    def __init__(self):
+        self.last_run_rows = 0
+        self.last_run_seconds = 0.0
+
+
+expiry_stats = ExpiryStats()
+
+expired_total = registry.register(
+    'memberships_expired',
+    'Memberships moved from Active to Expired.',
+    Counter(),
+)
+registry.register(
+    'membership_expiry_last_run_rows',
+    'Memberships expired by the last run.',
+    Gauge(lambda: expiry_stats.last_run_rows),
+)
+registry.register(
+    'membership_expiry_last_run_seconds',
+    'Duration of the last expiry run.',
+    Gauge(lambda: expiry_stats.last_run_seconds),
+)
+
+
+async def expire_memberships() -> int:
+    started = time.perf_counter()
+    expired = 0
+
+    while True:
+        async with engine.begin() as conn:
+            result = await conn.execute(EXPIRE_BATCH, {'batch': MEMBERSHIP_EXPIRY_BATCH})
+        expired += result.rowcount
+        expired_total.inc(result.rowcount)
+        if result.rowcount < MEMBERSHIP_EXPIRY_BATCH:
+            break
+
+    expiry_stats.last_run_rows = expired
+    expiry_stats.last_run_seconds = time.perf_counter() - started
+    logger.info("expired %d memberships in %.3fs", expired, expiry_stats.last_run_seconds)
+    return expired
+
+
+async def expire_forever() -> None:
+    while True:
+        try:
+            await expire_memberships()
+        except Exception:
+            logger.exception("membership expiry failed")
+        await asyncio.sleep(MEMBERSHIP_EXPIRY_INTERVAL)
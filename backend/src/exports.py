@@ -0,0 +1,208 @@
+import csv
+import enum
+import io
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import select
+
+from config import EXPORT_BATCH_SIZE
+from database import SessionLocal
+from models import Client, Contact, Membership, Payment
+from money import Money, MoneyType
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Optional, without it only CSV exports are offered
+    pa = None
+
+
+@dataclass(frozen=True)
+class Dataset:
+    columns: list
+    # Column filtered by the since/until query parameters
+    date_column: object | None
+    order_by: object
+    # (target, onclause) pairs
+    joins: list = field(default_factory=list)
+
+
+DATASETS = {
+    'clients': Dataset(
+        columns=[
+            Client.id_client,
+            Client.name,
+            Client.surname,
+            Client.birthday,
+            Client.sex,
+            Client.discount,
+            Client.is_admin,
+            Contact.email,
+            Contact.phone_number,
+        ],
+        date_column=None,
+        order_by=Client.id_client,
+        joins=[(Contact, Contact.id_contact == Client.id_contact)],
+    ),
+    'memberships': Dataset(
+        columns=[
+            Membership.id_membership,
+            Membership.id_client,
+            Membership.id_membership_type,
+            Membership.id_gym,
+            Membership.membership_status,
+            Membership.membership_start,
+            Membership.membership_stop,
+        ],
+        date_column=Membership.membership_start,
+        order_by=Membership.id_membership,
+    ),
+    'payments': Dataset(
+        columns=[
+            Payment.id_payment,
+            Payment.id_membership,
+            Membership.id_client,
+            Payment.payment_status,
+            Payment.amount,
+            Payment.currency,
+            Payment.date_creation,
+            Payment.date_payment,
+            Payment.date_due_date,
+        ],
+        date_column=Payment.date_payment,
+        order_by=Payment.id_payment,
+        joins=[(Membership, Membership.id_membership == Payment.id_membership)],
+    ),
+}
+
+
+def _query(dataset: Dataset, since: date | None, until: date | None):
+    query = select(*dataset.columns).order_by(dataset.order_by)
+    for target, onclause in dataset.joins:
+        query = query.join(target, onclause)
+
+    if dataset.date_column is not None:
+        if since:
+            query = query.where(dataset.date_column >= since)
+        if until:
+            # Inclusive, also for timestamp columns
+            query = query.where(dataset.date_column < until + timedelta(days=1))
+
+    # Server-side cursor, rows arrive in batches instead of all at once
+    return query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+
+
+async def _partitions(dataset: Dataset, since: date | None, until: date | None):
+    # Own session, the response outlives the request's dependencies
+    async with SessionLocal() as db:
+        result = await db.stream(_query(dataset, since, until))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _csv_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+async def stream_csv(name: str, since: date | None, until: date | None):
+    dataset = DATASETS[name]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([column.key for column in dataset.columns])
+    async for partition in _partitions(dataset, since, until):
+        writer.writerows([_csv_value(v) for v in row] for row in partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _arrow_type(column):
+    if isinstance(column.type, MoneyType):
+        return pa.decimal128(18, 2)
+    python_type = column.type.python_type
+    if issubclass(python_type, enum.Enum):
+        return pa.string()
+    return {
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        str: pa.string(),
+        date: pa.date32(),
+        datetime: pa.timestamp('us'),
+    }[python_type]
+
+
+def _arrow_value(value):
+    if isinstance(value, Money):
+        return value.amount
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+class _Sink:
+    # Hands out what the Parquet writer produced so far, tell() keeps
+    # counting from the start of the file for the footer offsets
+    def __init__(self):
+        self.position = 0
+        self.closed = False
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def parquet_available() -> bool:
+    return pa is not None
+
+
+async def stream_parquet(name: str, since: date | None, until: date | None):
+    dataset = DATASETS[name]
+    schema = pa.schema([(column.key, _arrow_type(column)) for column in dataset.columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema)
+
+    try:
+        # One row group per partition
+        async for partition in _partitions(dataset, since, until):
+            columns = list(zip(*partition))
+            batch = pa.record_batch(
+                [
+                    pa.array([_arrow_value(v) for v in values], type=schema_field.type)
+                    for values, schema_field in zip(columns, schema)
+                ],
+                schema=schema,
+            )
+            writer.write_batch(batch)
+            yield sink.drain()
+    finally:
+        writer.close()
+
+    yield sink.drain()
@@ -0,0 +1,165 @@
+from dataclasses import dataclass
+from datetime import date, datetime
+
+from fastapi import HTTPException
+from sqlalchemy import select, func, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+
+from models import Membership, MembershipStatus, Payment
+from pagination import encode_cursor, decode_cursor
+
+# Entries on the dashboards, the load more endpoints allow up to MAX_PAGE
+MAX_HISTORY = 5
+MAX_PAGE = 50
+
+
+@dataclass
+class HistoryPage:
+    # Newest first
+    items: list
+    # None on the last page
+    next_cursor: str | None
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, MAX_PAGE))
+
+
+def _after(cursor: str | None, parse) -> tuple | None:
+    values = decode_cursor(cursor, (str, int))
+    if values is None:
+        return None
+    try:
+        return parse(values[0]), int(values[1])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _page(rows: list, limit: int, key) -> HistoryPage:
+    # One row more than the page tells whether there is a next one
+    if len(rows) <= limit:
+        return HistoryPage(items=rows, next_cursor=None)
+    rows = rows[:limit]
+    return HistoryPage(items=rows, next_cursor=encode_cursor(key(rows[-1])))
+
+
+async def active_membership(db: AsyncSession, id_client: int) -> Membership | None:
+    return await db.scalar(
+        select(Membership)
+        .where(
+            Membership.id_client == id_client,
+            Membership.membership_status == MembershipStatus.Active,
+            # Until the expiry worker catches up
+            Membership.membership_stop > func.current_date(),
+        )
+        .order_by(Membership.membership_start.desc())
+        .options(joinedload(Membership.membership_type), joinedload(Membership.gym))
+        .limit(1)
+    )
+
+
+async def membership_page(
+    db: AsyncSession,
+    id_client: int,
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+) -> HistoryPage:
+    # Backward scan of memberships_client_history_idx, stops after the page
+    query = select(Membership).where(Membership.id_client == id_client)
+
+    after = _after(cursor, date.fromisoformat)
+    if after:
+        query = query.where(tuple_(Membership.membership_start, Membership.id_membership) < tuple_(*after))
+
+    rows = (
+        await db.scalars(
+            query
+            .order_by(Membership.membership_start.desc(), Membership.id_membership.desc())
+            .options(joinedload(Membership.membership_type), joinedload(Membership.gym))
+            .limit(limit + 1)
+        )
+    ).all()
+
+    return _page(rows, limit, lambda m: [m.membership_start.isoformat(), m.id_membership])
+
+
+async def payment_page(
+    db: AsyncSession,
+    id_client: int,
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+) -> HistoryPage:
+    query = (
+        select(Payment)
+        .join(Membership, Membership.id_membership == Payment.id_membership)
+        .where(Membership.id_client == id_client)
+    )
+
+    after = _after(cursor, datetime.fromisoformat)
+    if after:
+        query = query.where(tuple_(Payment.date_payment, Payment.id_payment) < tuple_(*after))
+
+    rows = (
+        await db.scalars(
+            query
+            .order_by(Payment.date_payment.desc(), Payment.id_payment.desc())
+            .limit(limit + 1)
+        )
+    ).all()
+
+    return _page(rows, limit, lambda p: [p.date_payment.isoformat(), p.id_payment])
+
+
+async def latest_payments(db: AsyncSession, membership_ids: list[int]) -> dict[int, Payment]:
+    if not membership_ids:
+        return {}
+
+    # DISTINCT ON keeps the first row per membership, one index probe each
+    payments = await db.scalars(
+        select(Payment)
+        .where(Payment.id_membership.in_(membership_ids))
+        .distinct(Payment.id_membership)
+        .order_by(Payment.id_membership, Payment.date_payment.desc(), Payment.id_payment.desc())
+    )
+    return {p.id_membership: p for p in payments}
+
+
+def payment_json(payment: Payment) -> dict:
+    return {
+        "id_payment": payment.id_payment,
+        "id_membership": payment.id_membership,
+        "status": payment.payment_status.value,
+        "amount": str(payment.amount),
+        "currency": payment.currency.value,
+        "date_payment": payment.date_payment.isoformat(),
+    }
+
+
+def membership_json(membership: Membership, last_payment: Payment | None) -> dict:
+    return {
+        "id_membership": membership.id_membership,
+        "membership_type": membership.membership_type.title,
+        "id_gym": membership.id_gym,
+        "status": membership.membership_status.value,
+        "membership_start": membership.membership_start.isoformat(),
+        "membership_stop": membership.membership_stop.isoformat(),
+        "last_payment": payment_json(last_payment) if last_payment else None,
+    }
+
+
+async def membership_history_json(db: AsyncSession, id_client: int, cursor: str | None, limit: int) -> dict:
+    page = await membership_page(db, id_client, cursor, page_size(limit))
+    last_payments = await latest_payments(db, [m.id_membership for m in page.items])
+    return {
+        "items": [membership_json(m, last_payments.get(m.id_membership)) for m in page.items],
+        "next_cursor": page.next_cursor,
+    }
+
+
+async def payment_history_json(db: AsyncSession, id_client: int, cursor: str | None, limit: int) -> dict:
+    page = await payment_page(db, id_client, cursor, page_size(limit))
+    return {
+        "items": [payment_json(p) for p in page.items],
+        "next_cursor": page.next_cursor,
+    }
@@ -0,0 +1,336 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+from sqlalchemy import text
+
+from config import (
+    IDEMPOTENCY_BACKEND,
+    IDEMPOTENCY_TTL,
+    IDEMPOTENCY_CACHE_SIZE,
+    IDEMPOTENCY_WAIT,
+)
+from database import engine
+from sessions import SESSION_COOKIE
+
+IDEMPOTENCY_HEADER = b'idempotency-key'
+IDEMPOTENCY_FIELD = 'idempotency_key'
+# State-changing POST endpoints covered by the idempotency layer
+PROTECTED_PREFIXES = ('/user/', '/admin/')
+POLL_INTERVAL = 0.05
+SWEEP_INTERVAL = 60
+# Rotated by every keyed POST. Pages with forms put it in their ETag, so
+# a 304 never brings back keys that were already sent.
+FORM_GENERATION_COOKIE = 'form_gen'
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class StoredResponse:
+    status: int
+    headers: list[tuple[str, str]]
+    body: bytes
+
+
+# Returned by claim() while the first request with the key is still running
+PENDING = object()
+# Returned by claim() when the key was first used with a different body
+MISMATCH = object()
+
+
+def new_idempotency_key() -> str:
+    return uuid.uuid4().hex
+
+
+def form_generation(request) -> str:
+    return request.cookies.get(FORM_GENERATION_COOKIE, '')
+
+
+def _generation_cookie() -> tuple[bytes, bytes]:
+    value = f'{FORM_GENERATION_COOKIE}={uuid.uuid4().hex}; Path=/; HttpOnly; SameSite=lax'
+    return b'set-cookie', value.encode('latin-1')
+
+
+class MemoryIdempotencyStore:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (expires_at, fingerprint, response)
+        self._entries: OrderedDict[str, tuple[float, str, StoredResponse | None]] = OrderedDict()
+
+    async def claim(self, key: str, fingerprint: str):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            if entry[1] != fingerprint:
+                return MISMATCH
+            return PENDING if entry[2] is None else entry[2]
+
+        self._entries[key] = (time.monotonic() + IDEMPOTENCY_TTL, fingerprint, None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return None
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (time.monotonic() + IDEMPOTENCY_TTL, entry[1], response)
+
+    async def release(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    async def sweep(self) -> int:
+        now = time.monotonic()
+        expired = [k for k, (expires_at, _, _) in self._entries.items() if expires_at < now]
+        for key in expired:
+            del self._entries[key]
+        return len(expired)
+
+
+class PostgresIdempotencyStore:
+    # Shared by all workers, rows live in idempotency_keys
+
+    async def claim(self, key: str, fingerprint: str):
+        async with engine.begin() as conn:
+            # Expired keys, including abandoned pending ones, are taken over
+            claimed = await conn.scalar(
+                text(
+                    '''
+                    INSERT INTO idempotency_keys (key, fingerprint)
+                    VALUES (:key, :fingerprint)
+                    ON CONFLICT (key) DO UPDATE
+                    SET status = NULL, headers = NULL, body = NULL,
+                        fingerprint = EXCLUDED.fingerprint, created_at = LOCALTIMESTAMP
+                    WHERE idempotency_keys.created_at < LOCALTIMESTAMP - make_interval(secs => :ttl)
+                    RETURNING key
+                    '''
+                ),
+                {'key': key, 'fingerprint': fingerprint, 'ttl': IDEMPOTENCY_TTL},
+            )
+            if claimed is not None:
+                return None
+
+            row = (
+                await conn.execute(
+                    text('SELECT status, headers, body, fingerprint FROM idempotency_keys WHERE key = :key'),
+                    {'key': key},
+                )
+            ).first()
+
+        if row is not None and row.fingerprint not in (None, fingerprint):
+            return MISMATCH
+        if row is None or row.status is None:
+            return PENDING
+        return StoredResponse(
+            status=row.status,
+            headers=[tuple(h) for h in json.loads(row.headers)],
+            body=row.body,
+        )
+
+    async def complete(self, key: str, response: StoredResponse) -> None:
+        async with engine.begin() as conn:
+            await conn.execute(
+                text(
+                    '''
+                    UPDATE idempotency_keys
+                    SET status = :status, headers = :headers, body = :body
+                    WHERE key = :key
+                    '''
+                ),
+                {
+                    'key': key,
+                    'status': response.status,
+                    'headers': json.dumps(response.headers),
+                    'body': response.body,
+                },
+            )
+
+    async def release(self, key: str) -> None:
+        async with engine.begin() as conn:
+            await conn.execute(text('DELETE FROM idempotency_keys WHERE key = :key'), {'key': key})
+
+    async def sweep(self) -> int:
+        async with engine.begin() as conn:
+            result = await conn.execute(
+                text(
+                    '''
+                    DELETE FROM idempotency_keys
+                    WHERE created_at < LOCALTIMESTAMP - make_interval(secs => :ttl)
+                    '''
+                ),
+                {'ttl': IDEMPOTENCY_TTL},
+            )
+        return result.rowcount
+
+
+if IDEMPOTENCY_BACKEND == 'postgres':
+    store = PostgresIdempotencyStore()
+else:
+    store = MemoryIdempotencyStore(IDEMPOTENCY_CACHE_SIZE)
+
+
+async def sweep_forever() -> None:
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            await store.sweep()
+        except Exception:
+            logger.exception("idempotency key sweep failed")
+
+
+def _may_carry_key(scope) -> bool:
+    # The header, or a field of an urlencoded form. Other bodies, file
+    # uploads among them, are not read into memory for a key they lack.
+    content_type = dict(scope['headers']).get(b'content-type', b'')
+    return (
+        any(name == IDEMPOTENCY_HEADER for name, _ in scope['headers'])
+        or content_type.startswith(b'application/x-www-form-urlencoded')
+    )
+
+
+def _find_key(scope, body: bytes) -> str | None:
+    for name, value in scope['headers']:
+        if name == IDEMPOTENCY_HEADER:
+            return value.decode('latin-1')
+
+    content_type = dict(scope['headers']).get(b'content-type', b'')
+    if content_type.startswith(b'application/x-www-form-urlencoded'):
+        values = parse_qs(body.decode('latin-1')).get(IDEMPOTENCY_FIELD)
+        if values:
+            return values[0]
+
+    return None
+
+
+def _fingerprint(scope, body: bytes) -> str:
+    # Multipart boundaries are random per request, the parts are what counts
+    content_type = dict(scope['headers']).get(b'content-type', b'')
+    _, _, boundary = content_type.partition(b'boundary=')
+    if boundary:
+        body = body.replace(boundary.split(b';')[0].strip(b'"'), b'')
+    return hashlib.sha256(body).hexdigest()
+
+
+def _session_token(scope) -> str | None:
+    for name, value in scope['headers']:
+        if name == b'cookie':
+            for part in value.decode('latin-1').split(';'):
+                cookie_name, _, cookie_value = part.strip().partition('=')
+                if cookie_name == SESSION_COOKIE:
+                    return cookie_value
+    return None
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or scope['method'] != 'POST'
+            or not scope['path'].startswith(PROTECTED_PREFIXES)
+            or not _may_carry_key(scope)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the body so the form field can be read and replayed
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+        body = b''.join(chunks)
+
+        replayed = False
+
+        async def replay_receive():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        key = _find_key(scope, body)
+        token = _session_token(scope)
+        if key is None or token is None:
+            await self.app(scope, replay_receive, send)
+            return
+
+        # Whatever the outcome, the key is spent and the forms must re-render.
+        # Not part of the stored headers, a replay rotates it again.
+        async def rotating_send(message):
+            if message['type'] == 'http.response.start':
+                message = {**message, 'headers': [*message.get('headers', []), _generation_cookie()]}
+            await send(message)
+
+        # Keys are scoped to the session and the endpoint
+        scoped_key = hashlib.sha256(f'{token}|{scope["path"]}|{key}'.encode()).hexdigest()
+
+        fingerprint = _fingerprint(scope, body)
+
+        stored = await store.claim(scoped_key, fingerprint)
+        waited = 0.0
+        while stored is PENDING and waited < IDEMPOTENCY_WAIT:
+            await asyncio.sleep(POLL_INTERVAL)
+            waited += POLL_INTERVAL
+            stored = await store.claim(scoped_key, fingerprint)
+
+        if stored is MISMATCH:
+            await self._send(
+                rotating_send,
+                StoredResponse(
+                    422,
+                    [('content-type', 'text/plain')],
+                    b'Idempotency key was already used with a different request',
+                ),
+            )
+            return
+        if stored is PENDING:
+            await self._send(
+                rotating_send,
+                StoredResponse(409, [('content-type', 'text/plain')], b'Request is already in progress'),
+            )
+            return
+        if stored is not None:
+            await self._send(rotating_send, stored)
+            return
+
+        response = StoredResponse(500, [], b'')
+
+        async def capture_send(message):
+            if message['type'] == 'http.response.start':
+                response.status = message['status']
+                response.headers = [
+                    (name.decode('latin-1'), value.decode('latin-1'))
+                    for name, value in message.get('headers', [])
+                ]
+            elif message['type'] == 'http.response.body':
+                response.body += message.get('body', b'')
+            await rotating_send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except BaseException:
+            await store.release(scoped_key)
+            raise
+
+        # Only successes and redirects are final. A 4xx (expired session,
+        # failed validation) or a server error must run again on retry.
+        if 200 <= response.status < 400:
+            await store.complete(scoped_key, response)
+        else:
+            await store.release(scoped_key)
+
+    async def _send(self, send, response: StoredResponse) -> None:
+        headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.headers]
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.body})
@@ -0,0 +1,272 @@
+# Bulk import of clients from another system's CSV export.
+#
+#   python imports.py members.csv [--dry-run]
+#
+# Columns: name, surname, birth_date, sex, email, phone_number, password
+import argparse
+import asyncio
+import csv
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from itertools import islice
+from typing import Iterable
+
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import IMPORT_BATCH_SIZE, IMPORT_HASH_WORKERS
+from database import SessionLocal, engine
+from models import Client, Contact, Password
+from security import hash_passwords
+from validation import InvalidField, parse_birth_date, parse_email, parse_name, parse_phone, parse_sex
+
+COLUMNS = ('name', 'surname', 'birth_date', 'sex', 'email', 'phone_number', 'password')
+# Passwords per task sent to a hashing process
+HASH_CHUNK = 16
+
+# Own processes, a large import must not queue up logins
+_import_executor: Executor | None = None
+
+
+@dataclass
+class RowError:
+    line: int
+    message: str
+
+
+@dataclass
+class ImportReport:
+    rows: int = 0
+    imported: int = 0
+    errors: list[RowError] = field(default_factory=list)
+
+
+@dataclass
+class _Row:
+    line: int
+    name: str
+    surname: str
+    birthday: date
+    sex: str
+    email: str
+    phone: str
+    password: str
+
+
+def _parse(line: int, record: dict) -> _Row:
+    # Short rows leave the missing columns as None
+    value = {column: record.get(column) or '' for column in COLUMNS}
+
+    # Same rules as register_post
+    row = _Row(
+        line=line,
+        name=parse_name(value['name']),
+        surname=parse_name(value['surname']),
+        birthday=parse_birth_date(value['birth_date']),
+        sex=parse_sex(value['sex']),
+        email=parse_email(value['email']),
+        phone=parse_phone(value['phone_number']),
+        password=value['password'],
+    )
+    if not row.password:
+        raise InvalidField('password_empty', "Password is empty")
+    return row
+
+
+def _records(reader: csv.DictReader):
+    # line_num after a row is its last line, quoted values may span several
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _parse_batch(records, seen_emails: dict[str, int], seen_phones: dict[str, int]):
+    # Reads and validates the next batch, run in a thread: the upload is a
+    # file and parsing a thousand rows would hold up the event loop
+    rows = []
+    errors = []
+    count = 0
+    for line, record in islice(records, IMPORT_BATCH_SIZE):
+        count += 1
+        try:
+            row = _parse(line, record)
+        except InvalidField as e:
+            errors.append(RowError(line, str(e)))
+            continue
+
+        first = seen_emails.get(row.email) or seen_phones.get(row.phone)
+        if first:
+            errors.append(RowError(line, f"Same email or phone number as line {first}"))
+            continue
+        seen_emails[row.email] = seen_phones[row.phone] = line
+        rows.append(row)
+    return count, rows, errors
+
+
+def start_import_pool() -> None:
+    global _import_executor
+
+    if _import_executor is None:
+        _import_executor = ProcessPoolExecutor(max_workers=IMPORT_HASH_WORKERS)
+
+
+def stop_import_pool() -> None:
+    global _import_executor
+
+    if _import_executor is not None:
+        _import_executor.shutdown(wait=True)
+    _import_executor = None
+
+
+async def _drop_registered(db: AsyncSession, rows: list[_Row], report: ImportReport) -> list[_Row]:
+    existing = (
+        await db.execute(
+            select(Contact.email, Contact.phone_number).where(
+                or_(
+                    Contact.email.in_([row.email for row in rows]),
+                    Contact.phone_number.in_([row.phone for row in rows]),
+                )
+            )
+        )
+    ).all()
+    emails = {email for email, _ in existing}
+    phones = {phone for _, phone in existing}
+
+    fresh = []
+    for row in rows:
+        if row.email in emails or row.phone in phones:
+            report.errors.append(RowError(row.line, "Email or phone number is already registered"))
+        else:
+            fresh.append(row)
+    return fresh
+
+
+async def _hash(passwords: list[str]) -> list[str]:
+    if _import_executor is None:
+        start_import_pool()
+
+    loop = asyncio.get_running_loop()
+    chunks = await asyncio.gather(
+        *(
+            loop.run_in_executor(_import_executor, hash_passwords, passwords[i:i + HASH_CHUNK])
+            for i in range(0, len(passwords), HASH_CHUNK)
+        )
+    )
+    return [password_hash for chunk in chunks for password_hash in chunk]
+
+
+async def _insert(db: AsyncSession, rows: list[_Row], hashes: list[str]) -> None:
+    # Multi-row INSERT ... RETURNING, ids come back in parameter order
+    contact_ids = (
+        await db.scalars(
+            insert(Contact).returning(Contact.id_contact, sort_by_parameter_order=True),
+            [{'email': row.email, 'phone_number': row.phone} for row in rows],
+        )
+    ).all()
+    client_ids = (
+        await db.scalars(
+            insert(Client).returning(Client.id_client, sort_by_parameter_order=True),
+            [
+                {
+                    'name': row.name,
+                    'surname': row.surname,
+                    'birthday': row.birthday,
+                    'sex': row.sex,
+                    'discount': 0.0,
+                    'id_contact': id_contact,
+                }
+                for row, id_contact in zip(rows, contact_ids)
+            ],
+        )
+    ).all()
+    await db.execute(
+        insert(Password),
+        [
+            {'id_client': id_client, 'password_hash': password_hash}
+            for id_client, password_hash in zip(client_ids, hashes)
+        ],
+    )
+
+
+async def _import_batch(rows: list[_Row], report: ImportReport, dry_run: bool) -> None:
+    async with SessionLocal() as db:
+        rows = await _drop_registered(db, rows, report)
+        if not rows:
+            return
+        if dry_run:
+            report.imported += len(rows)
+            return
+
+        hashes = await _hash([row.password for row in rows])
+
+        try:
+            await _insert(db, rows, hashes)
+            await db.commit()
+            report.imported += len(rows)
+            return
+        except IntegrityError:
+            await db.rollback()
+
+        # Someone registered with the same email or phone in the meantime,
+        # retry row by row so only the conflicting rows are rejected
+        for row, password_hash in zip(rows, hashes):
+            try:
+                async with db.begin_nested():
+                    await _insert(db, [row], [password_hash])
+                report.imported += 1
+            except IntegrityError:
+                report.errors.append(RowError(row.line, "Email or phone number is already registered"))
+        await db.commit()
+
+
+async def import_clients(lines: Iterable[str], dry_run: bool = False) -> ImportReport:
+    reader = csv.DictReader(lines)
+    # Reads the header line
+    fieldnames = await asyncio.to_thread(getattr, reader, 'fieldnames')
+    missing = [column for column in COLUMNS if column not in (fieldnames or ())]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}")
+
+    report = ImportReport()
+    # Line of the first valid row with each email and phone number
+    seen_emails: dict[str, int] = {}
+    seen_phones: dict[str, int] = {}
+    records = _records(reader)
+
+    while True:
+        count, rows, errors = await asyncio.to_thread(_parse_batch, records, seen_emails, seen_phones)
+        if not count:
+            break
+        report.rows += count
+        report.errors.extend(errors)
+        if rows:
+            await _import_batch(rows, report, dry_run)
+
+    return report
+
+
+async def _main(args) -> int:
+    try:
+        with open(args.path, newline='', encoding='utf-8-sig') as f:
+            report = await import_clients(f, dry_run=args.dry_run)
+    except (ValueError, csv.Error) as e:
+        print(e, file=sys.stderr)
+        return 2
+    finally:
+        stop_import_pool()
+        await engine.dispose()
+
+    for error in report.errors:
+        print(f"line {error.line}: {error.message}")
+    verb = "would import" if args.dry_run else "imported"
+    print(f"{verb} {report.imported} of {report.rows} rows, {len(report.errors)} rejected")
+    return 1 if report.errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Import clients from a CSV file")
+    parser.add_argument('path')
+    parser.add_argument('--dry-run', action='store_true', help="validate without inserting")
+    raise SystemExit(asyncio.run(_main(parser.parse_args())))
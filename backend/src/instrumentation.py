@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from collections import Counter as StatementCounter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+import asyncpg
+from sqlalchemy import event
+
+from config import (
+    SERVER_TIMING,
+    SLOW_QUERY_SECONDS,
+    SLOW_QUERY_EXPLAIN,
+    REPEATED_QUERY_THRESHOLD,
+    QUERY_BUDGET_STRICT,
+)
+from database import engine, get_pool_metrics, raw_dsn
+from metrics import COUNT_BUCKETS, Counter, Gauge, Histogram, HistogramFamily, registry
+
+# Seconds before the plan of the same slow statement is logged again
+EXPLAIN_INTERVAL = 300
+EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'with')
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    db_seconds: float = 0.0
+    render_seconds: float = 0.0
+    started: float = field(default_factory=time.perf_counter)
+    # Executions per statement fingerprint
+    statements: StatementCounter = field(default_factory=StatementCounter)
+    # (limit, queries before it was declared), see query_budget
+    budget: tuple[int, int] | None = None
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+# Set by InstrumentationMiddleware for the duration of a request
+current_stats: ContextVar[RequestStats | None] = ContextVar('current_stats', default=None)
+
+request_seconds = registry.register(
+    'http_request_duration_seconds',
+    'Time spent in the handler, by route.',
+    HistogramFamily('route'),
+)
+request_queries = registry.register(
+    'http_request_db_queries',
+    'SQL statements executed per request, by route.',
+    HistogramFamily('route', COUNT_BUCKETS),
+)
+request_db_seconds = registry.register(
+    'http_request_db_seconds',
+    'Time spent in SQL statements per request, by route.',
+    HistogramFamily('route'),
+)
+query_seconds = registry.register(
+    'db_query_duration_seconds',
+    'Duration of single SQL statements.',
+    Histogram(),
+)
+queries_total = registry.register(
+    'db_queries',
+    'SQL statements executed, inside and outside requests.',
+    Counter(),
+)
+slow_queries_total = registry.register(
+    'db_slow_queries',
+    'SQL statements slower than SLOW_QUERY_SECONDS.',
+    Counter(),
+)
+repeated_queries_total = registry.register(
+    'db_repeated_queries',
+    'Requests that ran one statement REPEATED_QUERY_THRESHOLD times or more.',
+    Counter(),
+)
+template_seconds = registry.register(
+    'template_render_seconds',
+    'Template render time, by template.',
+    HistogramFamily('template'),
+)
+for _name in ('checked_out', 'overflow', 'timeouts', 'wait_seconds_max'):
+    registry.register(
+        f'db_pool_{_name}',
+        f'Connection pool {_name.replace("_", " ")}.',
+        Gauge(lambda name=_name: get_pool_metrics().get(name, 0)),
+    )
+
+
+_PARAMETER_LIST = re.compile(r'\$\d+(?:\s*,\s*\$\d+)*')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement: str) -> str:
+    # Statements are already parameterised, only expanded IN lists and
+    # formatting differ between executions of the same query
+    return _WHITESPACE.sub(' ', _PARAMETER_LIST.sub('?', statement)).strip()
+
+
+def _short_id(fingerprint_: str) -> str:
+    return hashlib.sha1(fingerprint_.encode()).hexdigest()[:10]
+
+
+_explained: dict[str, float] = {}
+_explain_tasks: set[asyncio.Task] = set()
+
+
+async def _explain(statement: str, parameters, elapsed: float) -> None:
+    # Separate connection, a failing EXPLAIN must not abort the request's transaction
+    try:
+        conn = await asyncpg.connect(raw_dsn())
+        try:
+            rows = await conn.fetch('EXPLAIN ' + statement, *parameters)
+        finally:
+            await conn.close()
+        plan = '\n'.join(row[0] for row in rows)
+    except (OSError, asyncpg.PostgresError) as e:
+        plan = f'(EXPLAIN failed: {e})'
+
+    logger.warning("slow query (%.3fs): %s\n%s", elapsed, statement, plan)
+
+
+def _report_slow(statement: str, parameters, elapsed: float, executemany: bool) -> None:
+    slow_queries_total.inc()
+
+    key = fingerprint(statement)
+    now = time.monotonic()
+    explain = (
+        SLOW_QUERY_EXPLAIN
+        and not executemany
+        and statement.lstrip().lower().startswith(EXPLAINABLE)
+        and now - _explained.get(key, -EXPLAIN_INTERVAL) >= EXPLAIN_INTERVAL
+    )
+    if not explain:
+        logger.warning("slow query (%.3fs): %s", elapsed, statement)
+        return
+
+    _explained[key] = now
+    # Runs in the event loop thread, inside SQLAlchemy's greenlet
+    task = asyncio.get_running_loop().create_task(_explain(statement, tuple(parameters or ()), elapsed))
+    _explain_tasks.add(task)
+    task.add_done_callback(_explain_tasks.discard)
+
+
+@event.listens_for(engine.sync_engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.query_started = time.perf_counter()
+
+
+@event.listens_for(engine.sync_engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.query_started
+    query_seconds.observe(elapsed)
+    queries_total.inc()
+
+    if elapsed >= SLOW_QUERY_SECONDS:
+        _report_slow(statement, parameters, elapsed, executemany)
+
+    stats = current_stats.get()
+    if stats is None:
+        return
+
+    stats.queries += 1
+    stats.db_seconds += elapsed
+    stats.statements[fingerprint(statement)] += 1
+
+    if stats.budget is not None and QUERY_BUDGET_STRICT:
+        limit, before = stats.budget
+        if stats.queries - before > limit:
+            raise QueryBudgetExceeded(
+                f"{stats.queries - before} statements, budget is {limit}: {statement}"
+            )
+
+
+def query_budget(limit: int):
+    # Route dependency, dependencies=[Depends(query_budget(4))]
+    async def dependency():
+        stats = current_stats.get()
+        if stats is None:
+            yield
+            return
+
+        stats.budget = (limit, stats.queries)
+        try:
+            yield
+        finally:
+            used = stats.queries - stats.budget[1]
+            stats.budget = None
+            if used > limit:
+                logger.warning("query budget exceeded: %d statements, budget is %d", used, limit)
+
+    return dependency
+
+
+def _report_repeated(label: str, stats: RequestStats) -> None:
+    repeated = [
+        (count, statement)
+        for statement, count in stats.statements.items()
+        if count >= REPEATED_QUERY_THRESHOLD
+    ]
+    if not repeated:
+        return
+
+    repeated_queries_total.inc()
+    for count, statement in repeated:
+        logger.warning(
+            "possible N+1 on %s: %d x [%s] %s",
+            label, count, _short_id(statement), statement,
+        )
+
+
+def record_render(template: str, seconds: float) -> None:
+    template_seconds.observe(template, seconds)
+    stats = current_stats.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+def _server_timing(stats: RequestStats, total: float) -> bytes:
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f'render;dur={stats.render_seconds * 1000:.1f}, '
+        f'app;dur={total * 1000:.1f}'
+    ).encode('latin-1')
+
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_stats.set(stats)
+
+        async def timing_send(message):
+            if message['type'] == 'http.response.start' and SERVER_TIMING:
+                # Work after the headers (streamed rendering) is only in the metrics
+                total = time.perf_counter() - stats.started
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', _server_timing(stats, total)))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            current_stats.reset(token)
+            # Route templates keep the label set small
+            route = scope.get('route')
+            label = getattr(route, 'path', None) or 'unmatched'
+            request_seconds.observe(label, time.perf_counter() - stats.started)
+            request_queries.observe(label, stats.queries)
+            request_db_seconds.observe(label, stats.db_seconds)
+            _report_repeated(label, stats)
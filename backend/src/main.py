@@ -1,24 +1,41 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
+from sqlalchemy import select
 from datetime import date, timedelta
 
-from config import STYLES
+from assets import styles
 from routers.register import register_router
 from routers.login import login_router
 from routers.user import user_router
 from routers.admin import admin_router
 from routers.logout import logout_router
-from security import hash_password
-from database import SessionLocal
+from routers.metrics import metrics_router
+from security import hash_password_async, start_hash_pool, stop_hash_pool
+from sessions import check_session_config
+from database import SessionLocal, engine
+from catalog import reference_cache
+from migrations import run_migrations
+from idempotency import IdempotencyMiddleware, sweep_forever
+from expiry import expire_forever
+from analytics import refresh_forever
+from imports import start_import_pool, stop_import_pool
+from compression import CompressionMiddleware
+from instrumentation import InstrumentationMiddleware
+from templating import precompile_templates
 from models import Client, Contact, Password, MembershipType, Gym, Group
+from money import Money
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    db: Session = SessionLocal()
-    try:
-        admin_exists = db.query(Client).filter(Client.is_admin == True).first()
+    check_session_config()
+    await run_migrations()
+    precompile_templates()
+    start_hash_pool()
+    start_import_pool()
+
+    async with SessionLocal() as db:
+        admin_exists = await db.scalar(select(Client).where(Client.is_admin == True).limit(1))
 
         if not admin_exists:
             admin_contact = Contact(
@@ -27,7 +44,7 @@ async def lifespan(app: FastAPI):
             )
             
             db.add(admin_contact)
-            db.flush()
+            await db.flush()
             
             admin = Client(
                 name='Admin',
@@ -40,46 +57,46 @@ async def lifespan(app: FastAPI):
             )
             
             db.add(admin)
-            db.flush()
+            await db.flush()
             
             admin_password = Password(
                 id_client = admin.id_client,
-                password_hash=hash_password('admin123'),
+                password_hash=await hash_password_async('admin123'),
             )
             
             db.add(admin_password)
-            db.commit()
+            await db.commit()
             
-        has_membership_types = db.query(MembershipType).first()
+        has_membership_types = await db.scalar(select(MembershipType).limit(1))
             
         today = date.today()
             
         if not has_membership_types:
             basic = MembershipType(
                 title='Basic 1 month',
-                price=300,
+                price=Money.parse(300),
                 currency='CZK',
                 duration=30,
                 description='Basic access to the gym for 1 month.',
             )
             standard = MembershipType(
                 title='Standard 1 month',
-                price=500,
+                price=Money.parse(500),
                 currency='CZK',
                 duration=30,
                 description='Standard membership with extended hours.',
             )
             premium = MembershipType(
                 title='Premium 1 month',
-                price=800,
+                price=Money.parse(800),
                 currency='CZK',
                 duration=30,
                 description='Premium membership with all-day access and group classes.',
             )
             db.add_all([basic, standard, premium])
-            db.commit()
+            await db.commit()
                 
-        has_gyms = db.query(Gym).first()
+        has_gyms = await db.scalar(select(Gym).limit(1))
         
         if not has_gyms:
             gym1 = Gym(
@@ -97,22 +114,38 @@ async def lifespan(app: FastAPI):
                 building="2",
             )
             db.add_all([gym1, gym2])
-            db.commit()
-            
-    finally:
-        db.close()
+            await db.commit()
     
-    yield
+    reference_cache.start_listener()
+    idempotency_sweeper = asyncio.create_task(sweep_forever())
+    membership_expiry = asyncio.create_task(expire_forever())
+    analytics_refresh = asyncio.create_task(refresh_forever())
+    try:
+        yield
+    finally:
+        idempotency_sweeper.cancel()
+        membership_expiry.cancel()
+        analytics_refresh.cancel()
+        await reference_cache.stop_listener()
+        stop_hash_pool()
+        stop_import_pool()
+        await engine.dispose()
 
 app = FastAPI(lifespan=lifespan)
 
-app.mount('/css', StaticFiles(directory=STYLES), name='css')
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(InstrumentationMiddleware)
+# Outermost, idempotent replays are stored uncompressed
+app.add_middleware(CompressionMiddleware)
+
+app.mount('/css', styles, name='css')
 app.include_router(register_router)
 app.include_router(login_router)
 app.include_router(logout_router)
 app.include_router(user_router)
 app.include_router(admin_router)
+app.include_router(metrics_router)
 
 @app.get('/')
 async def root():
-    return {"message": "Hello World"}
\ No newline at end of file
+    return {"message": "Hello World"}
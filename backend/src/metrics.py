@@ -0,0 +1,136 @@
+import bisect
+import threading
+
+# Seconds, upper bounds of the histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+# Statements per request
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    parts = []
+    for name, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _format_bound(bound: float) -> str:
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        # Observed from the event loop and from the threadpool
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> dict:
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            cumulative.append(('+Inf' if bound == float('inf') else bound, total))
+
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': cumulative,
+        }
+
+    def samples(self, name: str, labels: dict | None = None) -> list[str]:
+        labels = labels or {}
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            bucket_labels = _format_labels({**labels, 'le': _format_bound(bound)})
+            lines.append(f'{name}_bucket{bucket_labels} {total}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_format_labels(labels)} {self.count}')
+        return lines
+
+
+class HistogramFamily:
+    # One histogram per label value, e.g. per template name
+    type = 'histogram'
+
+    def __init__(self, label: str = 'label', buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.label = label
+        self.buckets = buckets
+        self.histograms: dict[str, Histogram] = {}
+
+    def observe(self, label: str, value: float) -> None:
+        histogram = self.histograms.get(label)
+        if histogram is None:
+            histogram = self.histograms.setdefault(label, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        return {label: h.snapshot() for label, h in sorted(self.histograms.items())}
+
+    def samples(self, name: str) -> list[str]:
+        lines = []
+        for label, histogram in sorted(self.histograms.items()):
+            lines.extend(histogram.samples(name, {self.label: label}))
+        return lines
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name: str) -> list[str]:
+        return [f'{name}_total {self.value}']
+
+
+class Gauge:
+    # Read from a callback when scraped
+    type = 'gauge'
+
+    def __init__(self, read):
+        self.read = read
+
+    def samples(self, name: str) -> list[str]:
+        return [f'{name} {self.read()}']
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, tuple[str, object]] = {}
+
+    def register(self, name: str, help_text: str, metric):
+        self._metrics[name] = (help_text, metric)
+        return metric
+
+    def exposition(self) -> str:
+        # Prometheus text format 0.0.4
+        lines = []
+        for name, (help_text, metric) in self._metrics.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            lines.extend(metric.samples(name))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import re
+from pathlib import Path
+
+import asyncpg
+
+from config import MIGRATIONS
+from database import raw_dsn
+
+# Serialises concurrent workers starting at the same time
+MIGRATION_LOCK_ID = 7_001_001
+NO_TRANSACTION = '-- migrate: no-transaction'
+# Seconds between attempts to take the lock
+LOCK_POLL_INTERVAL = 0.5
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)',
+    re.IGNORECASE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def pending_files(applied: set[str]) -> list[Path]:
+    files = sorted(Path(MIGRATIONS).glob('*.sql'))
+    return [f for f in files if f.stem not in applied]
+
+
+async def _lock(conn: asyncpg.Connection) -> None:
+    # Polled, not pg_advisory_lock: a waiter blocked inside a statement keeps
+    # a snapshot open, which CREATE INDEX CONCURRENTLY in the lock holder
+    # waits for, and the two deadlock
+    waiting = False
+    while not await conn.fetchval('SELECT pg_try_advisory_lock($1)', MIGRATION_LOCK_ID):
+        if not waiting:
+            logger.info("waiting for another worker to finish the migrations")
+            waiting = True
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+
+async def _drop_invalid_index(conn: asyncpg.Connection, statement: str) -> None:
+    # An interrupted CREATE INDEX CONCURRENTLY leaves the index behind as
+    # invalid, IF NOT EXISTS would skip it and the migration would go on to
+    # drop the index it replaces. Rebuilt instead.
+    match = CONCURRENT_INDEX.search(statement)
+    if match is None:
+        return
+    name = match.group(1)
+    invalid = await conn.fetchval(
+        'SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1)', name
+    )
+    if invalid:
+        logger.warning("rebuilding index %s, an earlier build did not finish", name)
+        await conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+async def run_migrations() -> list[str]:
+    conn = await asyncpg.connect(raw_dsn())
+    locked = False
+    try:
+        await _lock(conn)
+        locked = True
+        await conn.execute(
+            '''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version TEXT PRIMARY KEY,
+                applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+            '''
+        )
+
+        rows = await conn.fetch('SELECT version FROM schema_migrations')
+        applied = []
+
+        for path in pending_files({r['version'] for r in rows}):
+            sql = path.read_text()
+
+            if sql.startswith(NO_TRANSACTION):
+                # CREATE INDEX CONCURRENTLY and friends
+                for statement in filter(None, (s.strip() for s in sql.split(';'))):
+                    await _drop_invalid_index(conn, statement)
+                    await conn.execute(statement)
+                await conn.execute('INSERT INTO schema_migrations (version) VALUES ($1)', path.stem)
+            else:
+                async with conn.transaction():
+                    await conn.execute(sql)
+                    await conn.execute('INSERT INTO schema_migrations (version) VALUES ($1)', path.stem)
+
+            applied.append(path.stem)
+
+        return applied
+    finally:
+        if locked:
+            await conn.execute('SELECT pg_advisory_unlock($1)', MIGRATION_LOCK_ID)
+        await conn.close()
+
+
+if __name__ == '__main__':
+    for version in asyncio.run(run_migrations()):
+        print(f'applied {version}')
@@ -1,7 +1,7 @@
-from sqlalchemy import Boolean, Column, Integer, String, ForeignKey, Date, Time, Enum, Float, TIMESTAMP, Text, DateTime, func
-from sqlalchemy.dialects.postgresql import MONEY
+from sqlalchemy import BigInteger, Boolean, Column, Integer, String, ForeignKey, Date, Time, Enum, Float, TIMESTAMP, Text, DateTime, func
 from sqlalchemy.orm import relationship
 from database import Base
+from money import MoneyType
 import enum
 
 class WeekDay(enum.Enum):
@@ -23,6 +23,7 @@ class MembershipStatus(enum.Enum):
     Active = "Active"
     Suspended = "Suspended"
     Cancelled = "Cancelled"
+    Expired = "Expired"
 
 
 class PaymentStatus(enum.Enum):
@@ -53,6 +54,8 @@ class Client(Base):
     discount = Column(Float, nullable=False)
     id_contact = Column(Integer, ForeignKey("contacts.id_contact"), nullable=False)
     is_admin = Column(Boolean, nullable=False, default=False)
+    # Bumped by triggers whenever the client's dashboard data changes
+    data_version = Column(BigInteger, nullable=False, server_default='0')
 
     contact = relationship("Contact", back_populates="clients")
     registrations = relationship("Registered", back_populates="client")
@@ -122,7 +125,7 @@ class Group(Base):
     max_capacity = Column(Integer, nullable=False)
     time_start = Column(Time, nullable=False)
     time_finish = Column(Time, nullable=False)
-    week_day = Column(Enum(WeekDay), nullable=False)
+    week_day = Column(Enum(WeekDay, name='week_day'), nullable=False)
 
     trainer = relationship("Trainer", back_populates="groups")
     gym = relationship("Gym", back_populates="groups")
@@ -145,7 +148,7 @@ class OpeningHours(Base):
 
     id_opening_hours = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_gyms = Column(Integer, ForeignKey("gyms.id_gym"))
-    week_day = Column(Enum(WeekDay), nullable=False)
+    week_day = Column(Enum(WeekDay, name='week_day'), nullable=False)
     time_open = Column(Time, nullable=False)
     time_close = Column(Time, nullable=False)
 
@@ -157,7 +160,7 @@ class MembershipType(Base):
 
     id_membership_type = Column(Integer, primary_key=True, index=True, autoincrement=True)
     title = Column(Text, nullable=False)
-    price = Column(MONEY, nullable=False)
+    price = Column(MoneyType, nullable=False)
     currency = Column(Enum(PaymentCurrency, name='payment_currency'), nullable=False)
     duration = Column(Integer, nullable=False)
     description = Column(Text, nullable=False)
@@ -172,7 +175,7 @@ class Membership(Base):
     id_client = Column(Integer, ForeignKey("clients.id_client"), nullable=False)
     id_membership_type = Column(Integer, ForeignKey("membership_types.id_membership_type"), nullable=False)
     id_gym = Column(Integer, ForeignKey("gyms.id_gym"), nullable=False)
-    membership_status = Column(Enum(MembershipStatus), nullable=False)
+    membership_status = Column(Enum(MembershipStatus, name='membership_statuses'), nullable=False)
     membership_start = Column(Date, nullable=False)
     membership_stop = Column(Date, nullable=False)
 
@@ -186,8 +189,8 @@ class Payment(Base):
     __tablename__ = "payments"
 
     id_payment = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    payment_status = Column(Enum(PaymentStatus), nullable=False)
-    amount = Column(MONEY, nullable=False)
+    payment_status = Column(Enum(PaymentStatus, name='payment_status'), nullable=False)
+    amount = Column(MoneyType, nullable=False)
     currency = Column(Enum(PaymentCurrency, name='payment_currency'), nullable=False)
     date_creation = Column(TIMESTAMP, nullable=False)
     date_payment = Column(TIMESTAMP, nullable=False)
@@ -196,4 +199,42 @@ class Payment(Base):
 
     membership = relationship("Membership", back_populates="payments")
 
-    
\ No newline at end of file
+    
+
+class RevenueDaily(Base):
+    # Rollup of successful payments, see analytics.py
+    __tablename__ = "revenue_daily"
+
+    day = Column(Date, primary_key=True)
+    id_gym = Column(Integer, primary_key=True)
+    id_membership_type = Column(Integer, primary_key=True)
+    currency = Column(Enum(PaymentCurrency, name='payment_currency'), primary_key=True)
+    payments = Column(BigInteger, nullable=False)
+    amount = Column(MoneyType, nullable=False)
+
+
+class MembershipDaily(Base):
+    __tablename__ = "memberships_daily"
+
+    day = Column(Date, primary_key=True)
+    id_gym = Column(Integer, primary_key=True)
+    id_membership_type = Column(Integer, primary_key=True)
+    started = Column(BigInteger, nullable=False)
+
+
+class MembershipStatusCount(Base):
+    # Materialized view
+    __tablename__ = "membership_status_counts"
+
+    id_gym = Column(Integer, primary_key=True)
+    id_membership_type = Column(Integer, primary_key=True)
+    membership_status = Column(Enum(MembershipStatus, name='membership_statuses'), primary_key=True)
+    members = Column(BigInteger, nullable=False)
+
+
+class RollupWatermark(Base):
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(Text, primary_key=True)
+    open_from = Column(Date)
+    refreshed_at = Column(TIMESTAMP)
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from sqlalchemy import BigInteger
+from sqlalchemy.types import TypeDecorator
+
+MINOR_UNITS = 100
+
+
+@dataclass(frozen=True, order=True)
+class Money:
+    # Amount in minor units (cents, halere), the currency lives next to it
+    minor: int
+
+    @classmethod
+    def parse(cls, value) -> 'Money':
+        if isinstance(value, Money):
+            return value
+        try:
+            amount = Decimal(str(value).strip())
+        except InvalidOperation:
+            raise ValueError(f"Invalid amount: {value!r}")
+        if not amount.is_finite():
+            raise ValueError(f"Invalid amount: {value!r}")
+
+        minor = (amount * MINOR_UNITS).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+        return cls(int(minor))
+
+    @property
+    def amount(self) -> Decimal:
+        return Decimal(self.minor) / MINOR_UNITS
+
+    def __str__(self) -> str:
+        return f'{self.amount:.2f}'
+
+
+class MoneyType(TypeDecorator):
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return Money.parse(value).minor
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Money(value)
@@ -0,0 +1,43 @@
+import base64
+import json
+
+from fastapi import HTTPException
+
+# Keys are integer columns
+_INT_RANGE = range(-2**31, 2**31)
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def _valid(value, kind: type) -> bool:
+    # bool is an int subclass, and Postgres rejects NUL in text
+    if isinstance(value, bool):
+        return False
+    if kind is int:
+        return isinstance(value, int) and value in _INT_RANGE
+    if kind is float:
+        return isinstance(value, (int, float))
+    if kind is str:
+        return isinstance(value, str) and '\x00' not in value
+    return isinstance(value, kind)
+
+
+def decode_cursor(cursor: str | None, types: tuple[type, ...]) -> list | None:
+    # Cursors come back from clients, a crafted one must be a 400
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        values = None
+
+    if (
+        not isinstance(values, list)
+        or len(values) != len(types)
+        or not all(map(_valid, values, types))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return values
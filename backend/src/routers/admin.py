@@ -1,17 +1,39 @@
-from fastapi import APIRouter, HTTPException, Request, Depends, status, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-
-from config import TEMPLATES
+from fastapi import APIRouter, HTTPException, Request, Depends, status, Form, File, UploadFile
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, contains_eager
+from sqlalchemy import select, func, or_, and_, tuple_, cast
+
+from templating import templates, page_version, stream_template
+from conditional import make_etag, is_not_modified, not_modified, with_etag
+from instrumentation import query_budget
+from idempotency import form_generation
 from database import get_db
-from models import Contact, Client, MembershipStatus, Membership, MembershipType, Gym, PaymentCurrency, Payment
+from models import Contact, Client, Membership, MembershipType, Gym, PaymentCurrency, Payment, PaymentStatus
+from catalog import reference_cache
 from security import get_current_user
+from sessions import Principal, invalidate_principal
+from money import Money, MoneyType
+from analytics import load_report, refresh_analytics
+from exports import DATASETS, stream_csv, stream_parquet, parquet_available
+from imports import import_clients
+from pagination import encode_cursor, decode_cursor
+from history import (
+    active_membership,
+    membership_page,
+    payment_page,
+    latest_payments,
+    membership_history_json,
+    payment_history_json,
+    MAX_HISTORY,
+)
 
+import csv
+import io
 from datetime import date
 
-LIMIT_USERS_COUNT = 5
-MAX_HISTORY = 5
+LIMIT_USERS_COUNT = 20
+ANALYTICS_MAX_MONTHS = 60
 
 
 admin_router = APIRouter(
@@ -19,60 +41,119 @@ admin_router = APIRouter(
     tags=['admin'],
 )
 
-templates = Jinja2Templates(directory=TEMPLATES)
+def parse_price(value: str) -> Money:
+    try:
+        price = Money.parse(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid price")
+    if price.minor < 0:
+        raise HTTPException(status_code=400, detail="Invalid price")
+    return price
+
 
-@admin_router.get("/dashboard", response_class=HTMLResponse, name='admin_dashboard_get')
+def parse_currency(value: str) -> PaymentCurrency:
+    try:
+        return PaymentCurrency(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid currency")
+
+
+@admin_router.get(
+    "/dashboard",
+    response_class=HTMLResponse,
+    name='admin_dashboard_get',
+    dependencies=[Depends(query_budget(3))],
+)
 async def admin_dashboard_get(
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
     name: str | None = None,
     surname: str | None = None,
     phone: str | None = None,
     email: str | None = None,
     admins_only: bool = False,
+    q: str | None = None,
+    cursor: str | None = None,
     selected: int | None = None,
 ):
 
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    no_filters = not any([name, surname, phone, email, admins_only])
+    no_filters = not any([name, surname, phone, email, admins_only, q])
+    # (rank, id_client) for the search, else (surname, name, id_client)
+    after = decode_cursor(cursor, (float, int) if q else (str, str, int))
+    next_cursor = None
 
     if no_filters:
         clients = None
     else:
-        clients_query = db.query(Client).join(Contact)
+        clients_query = select(Client).join(Contact).options(contains_eager(Client.contact))
 
         if name:
-            clients_query = clients_query.filter(Client.name.ilike(f"%{name}%"))
+            clients_query = clients_query.where(Client.name.ilike(f"%{name}%"))
         if surname:
-            clients_query = clients_query.filter(Client.surname.ilike(f"%{surname}%"))
+            clients_query = clients_query.where(Client.surname.ilike(f"%{surname}%"))
         if phone:
-            clients_query = clients_query.filter(Contact.phone_number.ilike(f"%{phone}%"))
+            clients_query = clients_query.where(Contact.phone_number.ilike(f"%{phone}%"))
         if email:
-            clients_query = clients_query.filter(Contact.email.ilike(f"%{email}%"))
+            clients_query = clients_query.where(Contact.email.ilike(f"%{email}%"))
 
         if admins_only:
-            clients_query = clients_query.filter(Client.is_admin == True)
-
-        clients = (
-            clients_query
-            .order_by(Client.surname, Client.name)
-            .limit(LIMIT_USERS_COUNT)
-            .all()
-        )
+            clients_query = clients_query.where(Client.is_admin == True)
+
+        if q:
+            # Every branch of the OR is served by a pg_trgm index
+            pattern = f"%{q}%"
+            clients_query = clients_query.where(
+                or_(
+                    Client.name.ilike(pattern),
+                    Client.surname.ilike(pattern),
+                    Contact.phone_number.ilike(pattern),
+                    Contact.email.ilike(pattern),
+                )
+            )
+            rank = func.greatest(
+                func.similarity(Client.name, q),
+                func.similarity(Client.surname, q),
+                func.similarity(Contact.phone_number, q),
+                func.similarity(Contact.email, q),
+            )
+            if after:
+                clients_query = clients_query.where(
+                    or_(rank < after[0], and_(rank == after[0], Client.id_client > after[1]))
+                )
+            clients_query = clients_query.add_columns(rank).order_by(rank.desc(), Client.id_client)
+        else:
+            if after:
+                clients_query = clients_query.where(
+                    tuple_(Client.surname, Client.name, Client.id_client) > tuple_(*after)
+                )
+            clients_query = clients_query.order_by(Client.surname, Client.name, Client.id_client)
+
+        rows = (await db.execute(clients_query.limit(LIMIT_USERS_COUNT + 1))).all()
+        has_more = len(rows) > LIMIT_USERS_COUNT
+        rows = rows[:LIMIT_USERS_COUNT]
+        clients = [row[0] for row in rows]
+
+        if has_more:
+            last = rows[-1]
+            if q:
+                next_cursor = encode_cursor([last[1], last[0].id_client])
+            else:
+                next_cursor = encode_cursor([last[0].surname, last[0].name, last[0].id_client])
 
     selected_client = None
     if selected:
-        selected_client = (
-            db.query(Client)
+        selected_client = await db.scalar(
+            select(Client)
             .join(Contact)
-            .filter(Client.id_client == selected)
-            .first()
+            .options(contains_eager(Client.contact))
+            .where(Client.id_client == selected)
         )
 
-    return templates.TemplateResponse(
+    return stream_template(
         "admin_dashboard.html",
         {
             "request": request,
@@ -83,6 +164,8 @@ async def admin_dashboard_get(
             "surname": surname,
             "phone": phone,
             "email": email,
+            "q": q,
+            "next_cursor": next_cursor,
             "selected_client": selected_client,
         },
         status_code=200,
@@ -91,14 +174,14 @@ async def admin_dashboard_get(
 @admin_router.post("/toggle-admin/{client_id}", name="admin_toggle_admin_post")
 async def admin_toggle_admin_post(
     client_id: int,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
 
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    target = db.query(Client).filter(Client.id_client == client_id).first()
+    target = await db.get(Client, client_id)
 
     if not target:
         raise HTTPException(status_code=404, detail="Client not found")
@@ -107,27 +190,33 @@ async def admin_toggle_admin_post(
         raise HTTPException(status_code=400, detail="Admin cannot remove himself")
 
     target.is_admin = not target.is_admin
-    db.commit()
+    await db.commit()
+    await invalidate_principal(target.id_client)
 
     return RedirectResponse(
         f"/admin/dashboard?selected={client_id}",
         status_code=303
     )
 
-@admin_router.get("/clients/{client_id}", response_class=HTMLResponse, name="admin_client_detail_get")
+@admin_router.get(
+    "/clients/{client_id}",
+    response_class=HTMLResponse,
+    name="admin_client_detail_get",
+    dependencies=[Depends(query_budget(7))],
+)
 async def admin_client_details_get(
     client_id: int,
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    client = (
-        db.query(Client)
-        .filter(Client.id_client == client_id)
-        .first()
+    client = await db.scalar(
+        select(Client)
+        .where(Client.id_client == client_id)
+        .options(joinedload(Client.contact))
     )
     if not client:
         return RedirectResponse(
@@ -135,40 +224,79 @@ async def admin_client_details_get(
             status_code=status.HTTP_303_SEE_OTHER,
         )
 
-    active_membership = None
-    for m in client.memberships:
-        if m.membership_status == MembershipStatus.Active:
-            active_membership = m
-            break
-
-    membership_history = sorted(
-        client.memberships,
-        key=lambda m: m.membership_start,
-        reverse=False,
-    )[-MAX_HISTORY:]
-
-    last_payment_by_membership: dict[int, Payment] = {}
-    for m in client.memberships:
-        if m.payments:
-            last_payment = sorted(
-                m.payments,
-                key=lambda p: p.date_payment or p.date_creation
-            )[-1]
-            last_payment_by_membership[m.id_membership] = last_payment
+    # Pages of the history, older entries through the load more endpoints
+    active = await active_membership(db, client_id)
+    memberships = await membership_page(db, client_id)
+    payments = await payment_page(db, client_id)
+    last_payment_by_membership = await latest_payments(
+        db, [m.id_membership for m in memberships.items]
+    )
+
+    # Summed by the database, amounts are integer minor units
+    payment_totals = {
+        currency: total
+        for currency, total in await db.execute(
+            select(Payment.currency, cast(func.sum(Payment.amount), MoneyType))
+            .join(Membership, Membership.id_membership == Payment.id_membership)
+            .where(
+                Membership.id_client == client_id,
+                Payment.payment_status == PaymentStatus.Successful,
+            )
+            .group_by(Payment.currency)
+        )
+    }
 
-    return templates.TemplateResponse(
+    return stream_template(
         "admin_client_detail.html",
         {
             "request": request,
             "admin": admin,
             "client": client,
-            "active_membership": active_membership,
-            "membership_history": membership_history,
+            "active_membership": active,
+            "membership_history": list(reversed(memberships.items)),
+            "next_history_cursor": memberships.next_cursor,
             "last_payment_by_membership": last_payment_by_membership,
+            "payment_history": payments.items,
+            "next_payments_cursor": payments.next_cursor,
+            "payment_totals": payment_totals,
         },
         status_code=200,
     )
 
+@admin_router.get(
+    "/clients/{client_id}/history/memberships",
+    name="admin_client_membership_history_get",
+    dependencies=[Depends(query_budget(3))],
+)
+async def admin_client_membership_history_get(
+    client_id: int,
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return await membership_history_json(db, client_id, cursor, limit)
+
+@admin_router.get(
+    "/clients/{client_id}/history/payments",
+    name="admin_client_payment_history_get",
+    dependencies=[Depends(query_budget(2))],
+)
+async def admin_client_payment_history_get(
+    client_id: int,
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    return await payment_history_json(db, client_id, cursor, limit)
+
 @admin_router.post(
     "/clients/{client_id}/discount",
     name="admin_update_discount_post",
@@ -177,17 +305,13 @@ async def admin_update_discount_post(
     client_id: int,
     request: Request,
     discount: float = Form(...),
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    client = (
-        db.query(Client)
-        .filter(Client.id_client == client_id)
-        .first()
-    )
+    client = await db.get(Client, client_id)
     if not client:
         raise HTTPException(status_code=404, detail="Client not found")
 
@@ -196,7 +320,7 @@ async def admin_update_discount_post(
 
     client.discount = discount
 
-    db.commit()
+    await db.commit()
 
     return RedirectResponse(
         url=request.url_for("admin_client_detail_get", client_id=client_id),
@@ -209,22 +333,32 @@ async def admin_update_discount_post(
     "/membership-types",
     response_class=HTMLResponse,
     name="admin_membership_types_get",
+    dependencies=[Depends(query_budget(6))],
 )
 async def admin_membership_types_get(
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    membership_types = (
-        db.query(MembershipType)
-        .order_by(MembershipType.title)
-        .all()
+    # Served from the reference cache after one check of its shared version
+    catalog = await reference_cache.get(fresh=True)
+    etag = make_etag(
+        page_version(),
+        catalog.digest,
+        admin.id_client,
+        admin.name,
+        admin.surname,
+        form_generation(request),
     )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    return templates.TemplateResponse(
+    membership_types = sorted(catalog.membership_types, key=lambda t: t.title)
+
+    response = templates.TemplateResponse(
         "admin_membership_types.html",
         {
             "request": request,
@@ -233,6 +367,7 @@ async def admin_membership_types_get(
         },
         status_code=200,
     )
+    return with_etag(response, etag)
 
 
 @admin_router.post(
@@ -245,21 +380,22 @@ async def admin_membership_type_create_post(
     currency: str = Form(...),
     duration: int = Form(...),
     description: str = Form(...),
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
     mt = MembershipType(
         title=title,
-        price=price,
-        currency=PaymentCurrency(currency),
+        price=parse_price(price),
+        currency=parse_currency(currency),
         duration=duration,
         description=description,
     )
     db.add(mt)
-    db.commit()
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/membership-types",
@@ -275,17 +411,13 @@ async def admin_membership_type_create_post(
 async def admin_membership_type_edit_get(
     membership_type_id: int,
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    membership_type = (
-        db.query(MembershipType)
-        .filter(MembershipType.id_membership_type == membership_type_id)
-        .first()
-    )
+    membership_type = await db.get(MembershipType, membership_type_id)
     if not membership_type:
         raise HTTPException(status_code=404, detail="Membership type not found")
 
@@ -311,27 +443,24 @@ async def admin_membership_type_edit_post(
     currency: str = Form(...),
     duration: int = Form(...),
     description: str = Form(...),
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    membership_type = (
-        db.query(MembershipType)
-        .filter(MembershipType.id_membership_type == membership_type_id)
-        .first()
-    )
+    membership_type = await db.get(MembershipType, membership_type_id)
     if not membership_type:
         raise HTTPException(status_code=404, detail="Membership type not found")
 
     membership_type.title = title
-    membership_type.price = price
-    membership_type.currency = PaymentCurrency(currency)
+    membership_type.price = parse_price(price)
+    membership_type.currency = parse_currency(currency)
     membership_type.duration = duration
     membership_type.description = description
 
-    db.commit()
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/membership-types",
@@ -345,22 +474,19 @@ async def admin_membership_type_edit_post(
 )
 async def admin_membership_type_delete_post(
     membership_type_id: int,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    membership_type = (
-        db.query(MembershipType)
-        .filter(MembershipType.id_membership_type == membership_type_id)
-        .first()
-    )
+    membership_type = await db.get(MembershipType, membership_type_id)
     if not membership_type:
         raise HTTPException(status_code=404, detail="Membership type not found")
 
-    db.delete(membership_type)
-    db.commit()
+    await db.delete(membership_type)
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/membership-types",
@@ -371,22 +497,31 @@ async def admin_membership_type_delete_post(
     "/gyms",
     response_class=HTMLResponse,
     name="admin_gyms_get",
+    dependencies=[Depends(query_budget(6))],
 )
 async def admin_gyms_get(
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    gyms = (
-        db.query(Gym)
-        .order_by(Gym.city, Gym.street, Gym.building)
-        .all()
+    catalog = await reference_cache.get(fresh=True)
+    etag = make_etag(
+        page_version(),
+        catalog.digest,
+        admin.id_client,
+        admin.name,
+        admin.surname,
+        form_generation(request),
     )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    return templates.TemplateResponse(
+    gyms = sorted(catalog.gyms, key=lambda g: (g.city, g.street, g.building))
+
+    response = templates.TemplateResponse(
         "admin_gyms.html",
         {
             "request": request,
@@ -395,6 +530,7 @@ async def admin_gyms_get(
         },
         status_code=200,
     )
+    return with_etag(response, etag)
 
 
 @admin_router.post(
@@ -407,8 +543,8 @@ async def admin_gym_create_post(
     postcode: str = Form(...),
     street: str = Form(...),
     building: str = Form(...),
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
@@ -421,7 +557,8 @@ async def admin_gym_create_post(
         building=building,
     )
     db.add(gym)
-    db.commit()
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/gyms",
@@ -437,17 +574,13 @@ async def admin_gym_create_post(
 async def admin_gym_edit_get(
     gym_id: int,
     request: Request,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    gym = (
-        db.query(Gym)
-        .filter(Gym.id_gym == gym_id)
-        .first()
-    )
+    gym = await db.get(Gym, gym_id)
     if not gym:
         raise HTTPException(status_code=404, detail="Gym not found")
 
@@ -473,17 +606,13 @@ async def admin_gym_edit_post(
     postcode: str = Form(...),
     street: str = Form(...),
     building: str = Form(...),
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    gym = (
-        db.query(Gym)
-        .filter(Gym.id_gym == gym_id)
-        .first()
-    )
+    gym = await db.get(Gym, gym_id)
     if not gym:
         raise HTTPException(status_code=404, detail="Gym not found")
 
@@ -493,7 +622,8 @@ async def admin_gym_edit_post(
     gym.street = street
     gym.building = building
 
-    db.commit()
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/gyms",
@@ -507,24 +637,134 @@ async def admin_gym_edit_post(
 )
 async def admin_gym_delete_post(
     gym_id: int,
-    db: Session = Depends(get_db),
-    admin: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
 ):
     if not admin.is_admin:
         raise HTTPException(status_code=403, detail="Not enough permissions")
 
-    gym = (
-        db.query(Gym)
-        .filter(Gym.id_gym == gym_id)
-        .first()
-    )
+    gym = await db.get(Gym, gym_id)
     if not gym:
         raise HTTPException(status_code=404, detail="Gym not found")
 
-    db.delete(gym)
-    db.commit()
+    await db.delete(gym)
+    await db.commit()
+    await reference_cache.invalidate()
 
     return RedirectResponse(
         url="/admin/gyms",
         status_code=status.HTTP_303_SEE_OTHER,
     )
+
+
+@admin_router.get(
+    "/analytics",
+    response_class=HTMLResponse,
+    name="admin_analytics_get",
+    dependencies=[Depends(query_budget(10))],
+)
+async def admin_analytics_get(
+    request: Request,
+    months: int = 12,
+    db: AsyncSession = Depends(get_db),
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    report = await load_report(db, max(1, min(months, ANALYTICS_MAX_MONTHS)))
+    catalog = await reference_cache.get()
+
+    return templates.TemplateResponse(
+        "admin_analytics.html",
+        {
+            "request": request,
+            "admin": admin,
+            "report": report,
+            "gyms_by_id": {g.id_gym: g for g in catalog.gyms},
+            "membership_types_by_id": {t.id_membership_type: t for t in catalog.membership_types},
+        },
+        status_code=200,
+    )
+
+
+@admin_router.post(
+    "/analytics/refresh",
+    name="admin_analytics_refresh_post",
+)
+async def admin_analytics_refresh_post(
+    request: Request,
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    await refresh_analytics()
+
+    return RedirectResponse(
+        url=request.url_for("admin_analytics_get"),
+        status_code=status.HTTP_303_SEE_OTHER,
+    )
+
+
+@admin_router.get(
+    "/export/{dataset}",
+    name="admin_export_get",
+)
+async def admin_export_get(
+    dataset: str,
+    format: str = 'csv',
+    since: date | None = None,
+    until: date | None = None,
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+
+    if format == 'csv':
+        body = stream_csv(dataset, since, until)
+        media_type = 'text/csv'
+    elif format == 'parquet':
+        if not parquet_available():
+            raise HTTPException(status_code=501, detail="Parquet export requires the 'pyarrow' package")
+        body = stream_parquet(dataset, since, until)
+        media_type = 'application/vnd.apache.parquet'
+    else:
+        raise HTTPException(status_code=400, detail="Unknown format")
+
+    filename = f"{dataset}-{date.today():%Y%m%d}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@admin_router.post(
+    "/import/clients",
+    name="admin_import_clients_post",
+)
+async def admin_import_clients_post(
+    file: UploadFile = File(...),
+    dry_run: bool = Form(False),
+    admin: Principal = Depends(get_current_user),
+):
+    if not admin.is_admin:
+        raise HTTPException(status_code=403, detail="Not enough permissions")
+
+    # Rows are read from the spooled upload batch by batch
+    lines = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+    try:
+        report = await import_clients(lines, dry_run=dry_run)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "rows": report.rows,
+        "imported": report.imported,
+        "dry_run": dry_run,
+        "errors": [{"line": error.line, "message": error.message} for error in report.errors],
+    }
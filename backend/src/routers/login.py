@@ -1,81 +1,77 @@
-import http
 from fastapi import APIRouter, Request, Depends, status
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 
-from security import verify_password
-from config import TEMPLATES
+from security import verify_password_async
+from sessions import SESSION_COOKIE, Principal, create_session
+from config import SESSION_TTL
+from templating import templates
 from database import get_db
 from models import Contact, Client, Password
+from validation import normalize_email
 
 login_router = APIRouter(
     prefix='/auth',
     tags=['auth'],
 )
 
-templates = Jinja2Templates(directory=TEMPLATES)
-
 @login_router.get('/login')
 async def login_get(request: Request):
     return templates.TemplateResponse('login.html', {'request': request})
 
 @login_router.post('/login')
-async def login_post(request: Request, db: Session = Depends(get_db)):
+async def login_post(request: Request, db: AsyncSession = Depends(get_db)):
     form = await request.form()
-    contact = db.query(Contact).filter(Contact.email == form['email']).first()
-    
-    if not contact:
-        login_url = request.url_for('login_get')
-        print('contact')
-        
-        return RedirectResponse(
-            f"{login_url}?invalid=1",
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-        
-    client = db.query(Client).filter(Client.id_contact == contact.id_contact).first()
-    
-    if not client:
-        login_url = request.url_for('login_get')
-        print('client')
-        
-        return RedirectResponse(
-            f"{login_url}?invalid=1",
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-        
-    pwd = db.query(Password).filter(Password.id_client == client.id_client).first()
-    
-    if not pwd:
-        print('password')
-        login_url = request.url_for('login_get')
-        
-        return RedirectResponse(
-            f"{login_url}?invalid=1",
-            status_code=status.HTTP_303_SEE_OTHER,
+
+    # Contact, client, admin flag and hash in one round trip
+    account = (
+        await db.execute(
+            select(
+                Client.id_client,
+                Client.name,
+                Client.surname,
+                Client.is_admin,
+                Password.password_hash,
+            )
+            .join(Contact, Contact.id_contact == Client.id_contact)
+            .join(Password, Password.id_client == Client.id_client)
+            .where(Contact.email == normalize_email(form['email']))
+            .limit(1)
         )
-        
-    if not verify_password(form['password'], pwd.password_hash):
+    ).first()
+
+    # Unknown accounts still pay for one Argon2 verification
+    password_hash = account.password_hash if account else None
+
+    if not await verify_password_async(form['password'], password_hash):
         login_url = request.url_for('login_get')
-        print('verify')
         
         return RedirectResponse(
             f"{login_url}?invalid=1",
             status_code=status.HTTP_303_SEE_OTHER,
         )
     
-    if client.is_admin:
+    principal = Principal(
+        id_client=account.id_client,
+        name=account.name,
+        surname=account.surname,
+        is_admin=account.is_admin,
+    )
+
+    if principal.is_admin:
         dashboard_url = request.url_for('admin_dashboard_get')
     else:
         dashboard_url = request.url_for('user_dashboard_get')
     
+    token = await create_session(principal)
+
     response = RedirectResponse(dashboard_url, status_code=status.HTTP_303_SEE_OTHER)
     response.set_cookie(
-        key='client_id',
-        value=str(client.id_client),
+        key=SESSION_COOKIE,
+        value=token,
         httponly=True,
-        max_age=60*60,
-    ) 
+        samesite='lax',
+        max_age=SESSION_TTL,
+    )
     return response
\ No newline at end of file
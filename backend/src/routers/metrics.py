@@ -0,0 +1,58 @@
+import hmac
+
+from fastapi import APIRouter, HTTPException, Request, Depends
+from fastapi.responses import PlainTextResponse
+
+from config import METRICS_TOKEN
+from database import get_pool_metrics
+from instrumentation import template_seconds
+from metrics import registry
+from templating import fragment_cache
+
+LOOPBACK = {'127.0.0.1', '::1'}
+
+
+def require_metrics_access(request: Request) -> None:
+    # Not found rather than forbidden, the endpoints are not advertised
+    if METRICS_TOKEN:
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            return
+    elif (
+        request.client is not None
+        and request.client.host in LOOPBACK
+        # A local reverse proxy forwards public requests from loopback
+        and 'x-forwarded-for' not in request.headers
+        and 'forwarded' not in request.headers
+    ):
+        return
+    raise HTTPException(status_code=404, detail="Not Found")
+
+
+metrics_router = APIRouter(
+    prefix='/metrics',
+    tags=['metrics'],
+    dependencies=[Depends(require_metrics_access)],
+    include_in_schema=False,
+)
+
+
+@metrics_router.get('', response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(
+        registry.exposition(),
+        media_type='text/plain; version=0.0.4',
+    )
+
+
+@metrics_router.get('/pool')
+async def pool_metrics():
+    return get_pool_metrics()
+
+
+@metrics_router.get('/templates')
+async def template_metrics():
+    return {
+        'render_seconds': template_seconds.snapshot(),
+        'fragments': fragment_cache.stats(),
+    }
@@ -1,79 +1,160 @@
 from fastapi import APIRouter, Request, Depends, status, Form
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from datetime import date, timedelta
-from decimal import Decimal
-
-from config import TEMPLATES
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy import select, func
+from dataclasses import dataclass
+
+from templating import templates, page_version
+from conditional import make_etag, is_not_modified, not_modified, with_etag
+from instrumentation import query_budget
+from idempotency import form_generation
 from database import get_db
+from catalog import reference_cache
 from security import get_current_user
-from models import Payment, Client, MembershipStatus, MembershipType, Gym, Group, Membership, PaymentStatus, Registered
-
-MAX_HISTORY = 5
+from sessions import Principal
+from models import Client, MembershipStatus, MembershipType, Gym, Group, Membership, Payment, Registered
+from history import (
+    active_membership,
+    membership_page,
+    latest_payments,
+    membership_history_json,
+    payment_history_json,
+    MAX_HISTORY,
+)
 
 user_router = APIRouter(
     prefix='/user',
     tags=['user'],
 )
 
-templates = Jinja2Templates(directory=TEMPLATES)
+@dataclass
+class UserDashboard:
+    client: Client
+    active_membership: Membership | None
+    membership_history: list[Membership]
+    # Cursor for /user/history/memberships, None when there is nothing older
+    next_history_cursor: str | None
+    last_payment_by_membership: dict[int, Payment]
+    membership_types: list[MembershipType]
+    gyms: list[Gym]
+    groups: list[Group]
+    # Key for the shared catalog fragments of the template
+    catalog_version: int
+    registered_group_ids: set[int]
+
+
+async def load_user_dashboard(db: AsyncSession, id_client: int) -> UserDashboard:
+    # Fixed number of queries however long the client's history is,
+    # the catalogs come from the reference data cache
+    client = await db.scalar(
+        select(Client)
+        .where(Client.id_client == id_client)
+        .options(joinedload(Client.contact))
+    )
+
+    active = await active_membership(db, id_client)
+    history = await membership_page(db, id_client)
+    last_payments = await latest_payments(db, [m.id_membership for m in history.items])
 
-def parse_money(value) -> Decimal:
-    raw = str(value)
+    registered_group_ids = set(
+        (
+            await db.scalars(
+                select(Registered.id_group).where(Registered.id_client == id_client)
+            )
+        ).all()
+    )
 
-    cleaned = (
-        raw.replace('$', '')
-           .replace('€', '')
-           .replace('£', '')
-           .replace('Kč', '')
-           .replace('CZK', '')
-           .replace(',', '')
-           .strip()
+    catalog = await reference_cache.get()
+
+    return UserDashboard(
+        client=client,
+        active_membership=active,
+        membership_history=list(reversed(history.items)),
+        next_history_cursor=history.next_cursor,
+        last_payment_by_membership=last_payments,
+        membership_types=catalog.membership_types,
+        gyms=catalog.gyms,
+        groups=catalog.groups,
+        catalog_version=catalog.version,
+        registered_group_ids=registered_group_ids,
     )
 
-    return Decimal(cleaned)
-    
-@user_router.get("/dashboard", response_class=HTMLResponse, name='user_dashboard_get')
+# Principal, data version, cold reference cache (3, plus its version row
+# and periodic check) and the dashboard (5)
+@user_router.get(
+    "/dashboard",
+    response_class=HTMLResponse,
+    name='user_dashboard_get',
+    dependencies=[Depends(query_budget(12))],
+)
 async def user_dashboard_get(
     request: Request,
-    db: Session = Depends(get_db),
-    user: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
-    active_membership = None
-    for m in user.memberships:
-        if m.membership_status == MembershipStatus.Active:
-            active_membership = m
-            break
-
-    membership_history = sorted(
-        user.memberships,
-        key=lambda m: m.membership_start,
-        reverse=False,
-    )[-MAX_HISTORY:]
-
-
-    membership_types = db.query(MembershipType).all()
-    gyms = db.query(Gym).all()
-    groups = db.query(Group).all()
+    # One column read decides whether the cached page is still current
+    data_version = await db.scalar(
+        select(Client.data_version).where(Client.id_client == user.id_client)
+    )
+    catalog = await reference_cache.get()
+    etag = make_etag(
+        page_version(),
+        catalog.digest,
+        user.id_client,
+        data_version,
+        request.url.query,
+        form_generation(request),
+    )
+    if is_not_modified(request, etag):
+        return not_modified(etag)
 
-    registered_group_ids = {r.id_group for r in user.registrations}
+    dashboard = await load_user_dashboard(db, user.id_client)
 
-    return templates.TemplateResponse(
+    response = templates.TemplateResponse(
         "user_dashboard.html",
         {
             "request": request,
-            "client": user,
-            "active_membership": active_membership,
-            "membership_history": membership_history,
-            "membership_types": membership_types,
-            "gyms": gyms,
-            "groups": groups,
-            "registered_group_ids": registered_group_ids,
+            "client": dashboard.client,
+            "active_membership": dashboard.active_membership,
+            "membership_history": dashboard.membership_history,
+            "next_history_cursor": dashboard.next_history_cursor,
+            "last_payment_by_membership": dashboard.last_payment_by_membership,
+            "membership_types": dashboard.membership_types,
+            "gyms": dashboard.gyms,
+            "groups": dashboard.groups,
+            "catalog_version": dashboard.catalog_version,
+            "registered_group_ids": dashboard.registered_group_ids,
         },
         status_code=200,
     )
+    return with_etag(response, etag)
+
+@user_router.get(
+    "/history/memberships",
+    name="user_membership_history_get",
+    dependencies=[Depends(query_budget(3))],
+)
+async def user_membership_history_get(
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    return await membership_history_json(db, user.id_client, cursor, limit)
+
+@user_router.get(
+    "/history/payments",
+    name="user_payment_history_get",
+    dependencies=[Depends(query_budget(2))],
+)
+async def user_payment_history_get(
+    cursor: str | None = None,
+    limit: int = MAX_HISTORY,
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    return await payment_history_json(db, user.id_client, cursor, limit)
 
 @user_router.post(
     "/membership/buy",
@@ -84,76 +165,21 @@ async def user_membership_buy_post(
     request: Request,
     membership_type_id: int = Form(...),
     gym_id: int = Form(...),
-    db: Session = Depends(get_db),
-    user: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
-    mtype = (
-        db.query(MembershipType)
-        .filter(MembershipType.id_membership_type == membership_type_id)
-        .first()
+    # Validation, membership and payment in one statement, see buy_membership
+    outcome = await db.scalar(
+        select(func.buy_membership(user.id_client, membership_type_id, gym_id))
     )
+    await db.commit()
 
-    gym = db.query(Gym).filter(Gym.id_gym == gym_id).first()
-
-    if not mtype or not gym:
-        return RedirectResponse(
-            url=request.url_for("user_dashboard_get"),
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-
-    existing_active = (
-        db.query(Membership)
-        .filter(
-            Membership.id_client == user.id_client,
-            Membership.membership_status == MembershipStatus.Active,
-        )
-        .first()
-    )
-
-    if existing_active:
-        redirect_url = request.url_for("user_dashboard_get").include_query_params(
-            has_active="1"
-        )
-        return RedirectResponse(
-            url=redirect_url,
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-
-    personal_discount = Decimal(str(user.discount or 0))
-    base_price = parse_money(mtype.price) 
-
-    final_price = base_price * (Decimal("1") - personal_discount / Decimal("100"))
-
-    start = date.today()
-    stop = start + timedelta(days=mtype.duration)
-
-    new_membership = Membership(
-        id_client=user.id_client,
-        id_membership_type=mtype.id_membership_type,
-        id_gym=gym.id_gym,
-        membership_status=MembershipStatus.Active,
-        membership_start=start,
-        membership_stop=stop,
-    )
-
-    db.add(new_membership)
-    db.flush() 
-
-    payment = Payment(
-        id_membership=new_membership.id_membership,
-        payment_status='Successful',
-        amount=final_price,        
-        currency=mtype.currency,
-        date_creation=date.today(),
-        date_payment=date.today(),
-        date_due_date=date.today(),
-    )
-    db.add(payment)
-
-    db.commit()
+    redirect_url = request.url_for("user_dashboard_get")
+    if outcome == 'has_active':
+        redirect_url = redirect_url.include_query_params(has_active="1")
 
     return RedirectResponse(
-        url=request.url_for("user_dashboard_get"),
+        url=redirect_url,
         status_code=status.HTTP_303_SEE_OTHER,
     )
             
@@ -165,21 +191,21 @@ async def user_membership_buy_post(
 async def user_membership_cancel_post(
     request: Request,
     membership_id: int = Form(...),
-    db: Session = Depends(get_db),
-    user: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
-    membership = (
-        db.query(Membership)
-        .filter(
+    membership = await db.scalar(
+        select(Membership)
+        .where(
             Membership.id_membership == membership_id,
             Membership.id_client == user.id_client,
         )
-        .first()
+        .limit(1)
     )
 
     if membership:
         membership.membership_status = MembershipStatus.Cancelled
-        db.commit()
+        await db.commit()
 
     return RedirectResponse(
         url=request.url_for("user_dashboard_get"),
@@ -194,47 +220,18 @@ async def user_membership_cancel_post(
 async def user_group_register_post(
     request: Request,
     group_id: int = Form(...),
-    db: Session = Depends(get_db),
-    user: Client = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
-    group = db.query(Group).filter(Group.id_group == group_id).first()
-    if not group:
-        return RedirectResponse(
-            url=request.url_for("user_dashboard_get"),
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
+    # Capacity and duplicate checks happen in the database, see book_group
+    outcome = await db.scalar(select(func.book_group(group_id, user.id_client)))
+    await db.commit()
 
-    already = (
-        db.query(Registered)
-        .filter(
-            Registered.id_group == group.id_group,
-            Registered.id_client == user.id_client,
-        )
-        .first()
-    )
-    if already:
-        return RedirectResponse(
-            url=request.url_for("user_dashboard_get"),
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-
-    current_count = db.query(Registered).filter(
-        Registered.id_group == group.id_group
-    ).count()
-    if current_count >= group.max_capacity:
-        return RedirectResponse(
-            url=request.url_for("user_dashboard_get"),
-            status_code=status.HTTP_303_SEE_OTHER,
-        )
-
-    registration = Registered(
-        id_group=group.id_group,
-        id_client=user.id_client,
-    )
-    db.add(registration)
-    db.commit()
+    redirect_url = request.url_for("user_dashboard_get")
+    if outcome == 'full':
+        redirect_url = redirect_url.include_query_params(group_full="1")
 
     return RedirectResponse(
-        url=request.url_for("user_dashboard_get"),
+        url=redirect_url,
         status_code=status.HTTP_303_SEE_OTHER,
-    )
\ No newline at end of file
+    )
@@ -1,34 +1,164 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
 from passlib.context import CryptContext
 from fastapi import Request, HTTPException, status, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import (
+    ARGON2_TIME_COST,
+    ARGON2_MEMORY_COST,
+    ARGON2_PARALLELISM,
+    HASH_EXECUTOR,
+    HASH_WORKERS,
+    HASH_MAX_PENDING,
+    HASH_MAX_WAITING,
+    HASH_QUEUE_TIMEOUT,
+)
 from database import get_db
 from models import Client
+from sessions import (
+    SESSION_COOKIE,
+    Principal,
+    resolve_session,
+    get_cached_principal,
+    cache_principal,
+)
 
 pwd_context = CryptContext(
     schemes=["argon2"],
     deprecated="auto",
+    argon2__time_cost=ARGON2_TIME_COST,
+    argon2__memory_cost=ARGON2_MEMORY_COST,
+    argon2__parallelism=ARGON2_PARALLELISM,
 )
 
+_hash_executor: Executor | None = None
+_hash_slots: asyncio.Semaphore | None = None
+# Callers waiting for a slot
+_hash_waiting = 0
+
 def hash_password(password: str) -> str:
     if password is None:
         password = ""
     return pwd_context.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+def hash_passwords(passwords: list[str]) -> list[str]:
+    # One task per chunk keeps the pickling overhead of process pools low
+    return [hash_password(password) for password in passwords]
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    return pwd_context.hash("dummy-password")
+
+
+def verify_password(plain_password: str, hashed_password: str | None) -> bool:
     if plain_password is None:
         plain_password = ""
+    if hashed_password is None:
+        # Same cost as a real check so unknown emails cannot be told apart
+        pwd_context.verify(plain_password, _dummy_hash())
+        return False
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_current_user(request: Request, db=Depends(get_db)):
-    client_id = request.cookies.get("client_id")
-    if not client_id:
+
+def start_hash_pool() -> None:
+    global _hash_executor, _hash_slots
+
+    if _hash_executor is not None:
+        return
+
+    if HASH_EXECUTOR == 'process':
+        _hash_executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+    else:
+        _hash_executor = ThreadPoolExecutor(
+            max_workers=HASH_WORKERS,
+            thread_name_prefix='argon2',
+        )
+    _hash_slots = asyncio.Semaphore(HASH_MAX_PENDING)
+
+
+def stop_hash_pool() -> None:
+    global _hash_executor, _hash_slots
+
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=True)
+    _hash_executor = None
+    _hash_slots = None
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, try again later",
+    )
+
+
+async def _run_in_hash_pool(func, *args):
+    global _hash_waiting
+
+    if _hash_executor is None:
+        start_hash_pool()
+
+    # The wait is bounded in length and in time, beyond it a login burst
+    # is refused instead of queueing up
+    if _hash_slots.locked() and _hash_waiting >= HASH_MAX_WAITING:
+        raise _busy()
+
+    _hash_waiting += 1
+    try:
+        await asyncio.wait_for(_hash_slots.acquire(), timeout=HASH_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise _busy()
+    finally:
+        _hash_waiting -= 1
+
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_slots.release()
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_hash_pool(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str | None) -> bool:
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_db)) -> Principal:
+    token = request.cookies.get(SESSION_COOKIE)
+    if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    user = db.query(Client).filter(Client.id_client == int(client_id)).first()
+    client_id = await resolve_session(token)
+    if client_id is None:
+        raise HTTPException(status_code=401, detail="Unknown session")
+
+    principal = await get_cached_principal(client_id)
+    if principal:
+        return principal
+
+    user = await db.get(Client, client_id)
     if not user:
         raise HTTPException(status_code=401, detail="Unknown session")
 
-    return user
+    principal = principal_from_client(user)
+    await cache_principal(principal)
+
+    return principal
+
+
+def principal_from_client(client: Client) -> Principal:
+    return Principal(
+        id_client=client.id_client,
+        name=client.name,
+        surname=client.surname,
+        is_admin=client.is_admin,
+    )
 
 
@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+
+from config import (
+    SESSION_SECRET,
+    SESSION_TTL,
+    SESSION_BACKEND,
+    SESSION_CACHE_SIZE,
+    SESSION_REDIS_URL,
+    PRINCIPAL_TTL,
+    WEB_CONCURRENCY,
+)
+
+SESSION_COOKIE = 'session'
+
+
+@dataclass(frozen=True)
+class Principal:
+    id_client: int
+    name: str
+    surname: str
+    is_admin: bool
+
+
+class MemorySessionStore:
+    # Local to one worker, so only for single-worker deployments. A miss
+    # means the session is gone, logout and eviction both end it.
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def get(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict, ttl: int) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+class RedisSessionStore:
+    # Shared by all workers, a miss means the session is gone
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package") from e
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> dict | None:
+        raw = await self._redis.get(key)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, key: str, value: dict, ttl: int) -> None:
+        await self._redis.set(key, json.dumps(value), ex=ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(key)
+
+
+if SESSION_BACKEND == 'redis':
+    store = principals = RedisSessionStore(SESSION_REDIS_URL)
+else:
+    store = MemorySessionStore(SESSION_CACHE_SIZE)
+    # Separate LRU, cached principals must not evict sessions
+    principals = MemorySessionStore(SESSION_CACHE_SIZE)
+
+
+def check_session_config() -> None:
+    # Called at startup, a known secret lets anyone sign an admin session
+    if not SESSION_SECRET:
+        raise RuntimeError("SESSION_SECRET must be set")
+    if SESSION_BACKEND != 'redis' and WEB_CONCURRENCY > 1:
+        raise RuntimeError("SESSION_BACKEND=memory only works with a single worker, use redis")
+
+
+def _sign(payload: bytes) -> str:
+    digest = hmac.new(SESSION_SECRET.encode(), payload, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+
+def _encode_token(session_id: str, id_client: int, expires: int) -> str:
+    payload = f'{session_id}:{id_client}:{expires}'.encode()
+    body = base64.urlsafe_b64encode(payload).rstrip(b'=').decode()
+    return f'{body}.{_sign(payload)}'
+
+
+def _decode_token(token: str) -> tuple[str, int] | None:
+    try:
+        body, signature = token.split('.', 1)
+        payload = base64.urlsafe_b64decode(body + '=' * (-len(body) % 4))
+        session_id, id_client, expires = payload.decode().split(':')
+        id_client, expires = int(id_client), int(expires)
+    except ValueError:
+        return None
+
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    if expires < time.time():
+        return None
+
+    return session_id, id_client
+
+
+def _principal_key(id_client: int) -> str:
+    return f'principal:{id_client}'
+
+
+async def create_session(principal: Principal) -> str:
+    session_id = secrets.token_urlsafe(24)
+    expires = int(time.time()) + SESSION_TTL
+
+    await store.set(f'session:{session_id}', {'id_client': principal.id_client}, SESSION_TTL)
+    await cache_principal(principal)
+
+    return _encode_token(session_id, principal.id_client, expires)
+
+
+async def resolve_session(token: str) -> int | None:
+    decoded = _decode_token(token)
+    if decoded is None:
+        return None
+
+    session_id, id_client = decoded
+    if await store.get(f'session:{session_id}') is None:
+        return None
+
+    return id_client
+
+
+async def revoke_session(token: str) -> None:
+    decoded = _decode_token(token)
+    if decoded is None:
+        return
+
+    session_id, id_client = decoded
+    await store.delete(f'session:{session_id}')
+    await invalidate_principal(id_client)
+
+
+async def get_cached_principal(id_client: int) -> Principal | None:
+    data = await principals.get(_principal_key(id_client))
+    if data is None:
+        return None
+    return Principal(**data)
+
+
+async def cache_principal(principal: Principal) -> None:
+    await principals.set(_principal_key(principal.id_client), asdict(principal), PRINCIPAL_TTL)
+
+
+async def invalidate_principal(id_client: int) -> None:
+    await principals.delete(_principal_key(id_client))
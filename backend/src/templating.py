@@ -0,0 +1,237 @@
+import contextvars
+import hashlib
+import os
+import uuid
+import threading
+import time
+from functools import cache
+from collections import OrderedDict
+
+from fastapi.responses import StreamingResponse
+from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, Template, nodes, pass_context
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from config import TEMPLATES, TEMPLATE_CACHE_DIR, TEMPLATE_AUTO_RELOAD, FRAGMENT_CACHE_BYTES, STREAM_CHUNK_SIZE
+from assets import styles
+from idempotency import new_idempotency_key
+from instrumentation import record_render
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs) -> str:
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            record_render(self.name, time.perf_counter() - start)
+
+    def generate(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            yield from super().generate(*args, **kwargs)
+        finally:
+            record_render(self.name, time.perf_counter() - start)
+
+
+class FragmentCache:
+    # LRU bounded by the total size of the cached markup, locked since
+    # streamed templates render in the threadpool
+    def __init__(self, max_chars: int):
+        self.max_chars = max_chars
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, Markup] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Markup | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: tuple, value: Markup) -> None:
+        if len(value) > self.max_chars:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_chars:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'chars': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_BYTES)
+
+
+# Stands in for idempotency_key() while a fragment renders for the cache,
+# random per process so page content cannot forge it
+KEY_SLOT = f'idempotency-key-{uuid.uuid4().hex}'
+
+# True while the body of a {% cache %} section renders
+_rendering_fragment = contextvars.ContextVar('rendering_fragment', default=False)
+
+
+def idempotency_key() -> str:
+    # Forms render a fresh key into a hidden idempotency_key field
+    if _rendering_fragment.get():
+        return KEY_SLOT
+    return new_idempotency_key()
+
+
+def _fill_keys(value: Markup) -> Markup:
+    if KEY_SLOT not in value:
+        return value
+    parts = value.split(KEY_SLOT)
+    filled = [parts[0]]
+    for part in parts[1:]:
+        filled.append(new_idempotency_key())
+        filled.append(part)
+    return Markup(''.join(filled))
+
+
+class FragmentCacheExtension(Extension):
+    """Caches the rendered body of a template section.
+
+    {% cache "membership_types", catalog_version %}...{% endcache %}
+
+    The fragment is rendered once per name and version, so a new
+    version (e.g. after an admin edit) renders it again. It is shared by
+    every visitor and must not contain per-user data. Forms inside may
+    call idempotency_key(): the cached markup holds a slot and each
+    render fills in fresh keys, a cached key would replay another
+    visitor's outcome.
+    """
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method('_render_cached', args), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_cached(self, name, version, caller):
+        key = (name, version)
+        value = fragment_cache.get(key)
+        if value is None:
+            token = _rendering_fragment.set(True)
+            try:
+                value = caller()
+            finally:
+                _rendering_fragment.reset(token)
+            fragment_cache.set(key, value)
+
+        # A nested fragment leaves its slots to the outermost one
+        if _rendering_fragment.get():
+            return value
+        return _fill_keys(value)
+
+
+def _bytecode_cache() -> FileSystemBytecodeCache | None:
+    if not TEMPLATE_CACHE_DIR:
+        return None
+    os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+    return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+
+
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES),
+    autoescape=True,
+    auto_reload=TEMPLATE_AUTO_RELOAD,
+    bytecode_cache=_bytecode_cache(),
+    extensions=[FragmentCacheExtension],
+)
+env.template_class = TimedTemplate
+env.globals['idempotency_key'] = idempotency_key
+
+
+@pass_context
+def url_for(context, name: str, /, **path_params):
+    # Stylesheets are linked by their content-hashed names
+    if name == 'css' and 'path' in path_params:
+        path_params['path'] = styles.hashed_name(path_params['path'])
+    return context['request'].url_for(name, **path_params)
+
+
+env.globals['url_for'] = url_for
+
+# Shared by every router, one template cache per worker
+templates = Jinja2Templates(env=env)
+
+
+@cache
+def _page_version() -> str:
+    h = hashlib.sha256()
+    for name in sorted(env.list_templates(extensions=['html'])):
+        source, _, _ = env.loader.get_source(env, name)
+        h.update(name.encode())
+        h.update(source.encode())
+    for name in sorted(styles.hashed_names()):
+        h.update(name.encode())
+    return h.hexdigest()
+
+
+def page_version() -> str:
+    # Part of every page ETag, a deploy with new templates or styles
+    # must not be answered with 304
+    if TEMPLATE_AUTO_RELOAD:
+        return _page_version.__wrapped__()
+    return _page_version()
+
+
+def _chunked(parts, size: int):
+    # generate() yields many tiny strings, send them in larger pieces
+    buffer = []
+    buffered = 0
+    for part in parts:
+        buffer.append(part)
+        buffered += len(part)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_template(name: str, context: dict, status_code: int = 200) -> StreamingResponse:
+    # For large pages, the head of the page is sent while the rest renders.
+    # The context must be fully loaded, rendering runs in the threadpool.
+    template = env.get_template(name)
+    return StreamingResponse(
+        _chunked(template.generate(context), STREAM_CHUNK_SIZE),
+        status_code=status_code,
+        media_type='text/html',
+    )
+
+
+def precompile_templates() -> int:
+    names = env.list_templates(extensions=['html'])
+    for name in names:
+        env.get_template(name)
+    return len(names)
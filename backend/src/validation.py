@@ -0,0 +1,63 @@
+from datetime import date, datetime
+
+SEX_MAP = {
+    'male': 'M',
+    'female': 'F',
+    'other': 'O',
+}
+
+
+class InvalidField(ValueError):
+    # code doubles as the query flag the register page shows an error for
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+def parse_phone(raw: str) -> str:
+    phone = raw.strip()
+    digits = phone[1:] if phone.startswith('+') else phone
+
+    if not digits.isdigit():
+        raise InvalidField('phone_invalid', "Phone number may only contain digits and a leading '+'")
+    if not (9 <= len(phone) <= 15):
+        raise InvalidField('phone_length', "Phone number must be 9 to 15 characters long")
+    return phone
+
+
+def parse_birth_date(raw: str) -> date:
+    try:
+        birth_date = datetime.strptime(raw.strip(), '%Y-%m-%d').date()
+    except ValueError:
+        raise InvalidField('date_invalid', "Birth date must be YYYY-MM-DD")
+    if not (1900 <= birth_date.year <= 2025):
+        raise InvalidField('date_invalid', "Birth date must be between 1900 and 2025")
+    return birth_date
+
+
+def normalize_email(raw: str) -> str:
+    # As stored by register and the import, login looks it up the same way
+    return raw.strip()
+
+
+def parse_email(raw: str) -> str:
+    email = normalize_email(raw)
+    local, at, domain = email.partition('@')
+    if not (local and at and domain) or any(c.isspace() for c in email):
+        raise InvalidField('email_invalid', "Invalid email address")
+    return email
+
+
+def parse_sex(raw: str) -> str:
+    try:
+        return SEX_MAP[raw.strip().lower()]
+    except KeyError:
+        raise InvalidField('sex_invalid', "Sex must be male, female or other")
+
+
+def parse_name(raw: str, max_length: int = 20) -> str:
+    # clients.name and clients.surname are VARCHAR(20)
+    name = raw.strip()
+    if not (1 <= len(name) <= max_length):
+        raise InvalidField('name_invalid', f"Name and surname must be 1 to {max_length} characters long")
+    return name
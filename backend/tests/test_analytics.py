@@ -0,0 +1,15 @@
+import pytest
+
+from analytics import REFRESH_LOCK_ID, refresh_analytics
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_refresh_skips_while_another_worker_holds_the_lock(db, app):
+    await db.execute('SELECT pg_advisory_lock($1)', REFRESH_LOCK_ID)
+    try:
+        assert await refresh_analytics() is None
+    finally:
+        await db.execute('SELECT pg_advisory_unlock($1)', REFRESH_LOCK_ID)
+
+    assert await refresh_analytics() is not None
@@ -0,0 +1,57 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from conftest import PARALLELISM
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def make_group(db, catalog):
+    async def make(max_capacity: int) -> int:
+        return await db.fetchval(
+            '''
+            INSERT INTO groups (id_trainer, id_gym, max_capacity, time_start, time_finish, week_day)
+            VALUES ($1, $2, $3, '18:00', '19:00', 'Monday')
+            RETURNING id_group
+            ''',
+            catalog['trainer'], catalog['gym'], max_capacity,
+        )
+
+    return make
+
+
+async def _book(pool, calls: list[tuple[int, int]]) -> Counter:
+    async def book(id_group: int, id_client: int) -> str:
+        async with pool.acquire() as conn:
+            return await conn.fetchval('SELECT book_group($1, $2)', id_group, id_client)
+
+    return Counter(await asyncio.gather(*(book(*call) for call in calls)))
+
+
+async def test_parallel_bookings_do_not_overbook(db, pool, make_group, make_client):
+    capacity = 5
+    id_group = await make_group(capacity)
+    clients = [(await make_client())['id_client'] for _ in range(PARALLELISM * 2)]
+
+    # Every client twice, in parallel
+    outcomes = await _book(pool, [(id_group, id_client) for id_client in clients * 2])
+
+    assert outcomes['booked'] == capacity
+    assert outcomes['booked'] + outcomes['full'] + outcomes['duplicate'] == len(clients) * 2
+    assert await db.fetchval('SELECT count(*) FROM registered WHERE id_group = $1', id_group) == capacity
+
+
+async def test_parallel_bookings_of_one_client_register_once(db, pool, make_group, make_client):
+    id_group = await make_group(PARALLELISM)
+    client = await make_client()
+
+    outcomes = await _book(pool, [(id_group, client['id_client'])] * PARALLELISM)
+
+    assert outcomes == Counter({'booked': 1, 'duplicate': PARALLELISM - 1})
+    assert await db.fetchval(
+        'SELECT count(*) FROM registered WHERE id_group = $1 AND id_client = $2',
+        id_group, client['id_client'],
+    ) == 1
@@ -0,0 +1,122 @@
+import asyncio
+from collections import Counter
+
+import pytest
+
+from conftest import PARALLELISM
+
+pytestmark = pytest.mark.anyio
+
+
+async def _purchases(db, id_client: int) -> tuple[int, int]:
+    row = await db.fetchrow(
+        '''
+        SELECT count(DISTINCT m.id_membership) AS active, count(p.id_payment) AS payments
+        FROM memberships m
+        LEFT JOIN payments p ON p.id_membership = m.id_membership
+        WHERE m.id_client = $1 AND m.membership_status = 'Active'
+        ''',
+        id_client,
+    )
+    return row['active'], row['payments']
+
+
+async def test_parallel_purchases_leave_one_active_membership(db, pool, catalog, make_client):
+    client = await make_client()
+
+    async def buy() -> str:
+        async with pool.acquire() as conn:
+            return await conn.fetchval(
+                'SELECT buy_membership($1, $2, $3)',
+                client['id_client'], catalog['membership_type'], catalog['gym'],
+            )
+
+    outcomes = Counter(await asyncio.gather(*(buy() for _ in range(PARALLELISM))))
+
+    assert outcomes == Counter({'bought': 1, 'has_active': PARALLELISM - 1})
+    assert await _purchases(db, client['id_client']) == (1, 1)
+
+
+async def test_parallel_requests_with_one_key_run_once(db, http, login, catalog, make_client):
+    # A burst of double clicks, all carrying the key of the rendered form
+    client = await make_client()
+    await login(http, client['email'])
+    form = {
+        'membership_type_id': catalog['membership_type'],
+        'gym_id': catalog['gym'],
+        'idempotency_key': 'buy-once',
+    }
+
+    responses = await asyncio.gather(
+        *(http.post('/user/membership/buy', data=form) for _ in range(PARALLELISM))
+    )
+
+    # The first one ran, the rest replayed it or found it still running
+    assert {r.status_code for r in responses} <= {303, 409}
+    redirects = {r.headers['location'] for r in responses if r.status_code == 303}
+    assert len(redirects) == 1
+    assert 'has_active' not in redirects.pop()
+    assert await _purchases(db, client['id_client']) == (1, 1)
+
+
+async def test_parallel_requests_with_distinct_keys_buy_once(db, http, login, catalog, make_client):
+    client = await make_client()
+    await login(http, client['email'])
+
+    responses = await asyncio.gather(
+        *(
+            http.post(
+                '/user/membership/buy',
+                data={
+                    'membership_type_id': catalog['membership_type'],
+                    'gym_id': catalog['gym'],
+                    'idempotency_key': f'buy-{i}',
+                },
+            )
+            for i in range(PARALLELISM)
+        )
+    )
+
+    locations = Counter('has_active' in r.headers['location'] for r in responses)
+    assert locations == Counter({False: 1, True: PARALLELISM - 1})
+    assert await _purchases(db, client['id_client']) == (1, 1)
+
+
+async def _data_version(db, id_client: int) -> int:
+    return await db.fetchval('SELECT data_version FROM clients WHERE id_client = $1', id_client)
+
+
+async def test_checkout_bumps_the_data_version_once(db, catalog, make_client):
+    client = await make_client()
+    before = await _data_version(db, client['id_client'])
+
+    outcome = await db.fetchval(
+        'SELECT buy_membership($1, $2, $3)',
+        client['id_client'], catalog['membership_type'], catalog['gym'],
+    )
+
+    # A membership and a payment, one write of the client row
+    assert outcome == 'bought'
+    assert await _data_version(db, client['id_client']) == before + 1
+
+
+async def test_batch_updates_bump_each_client_once(db, make_client, add_memberships):
+    clients = [await make_client(), await make_client()]
+    for client in clients:
+        await add_memberships(client['id_client'], 3)
+    ids = [c['id_client'] for c in clients]
+    before = [await _data_version(db, i) for i in ids]
+
+    # One statement over six memberships, then one over their payments
+    await db.execute(
+        "UPDATE memberships SET membership_status = 'Cancelled' WHERE id_client = ANY($1)", ids
+    )
+    await db.execute(
+        '''
+        UPDATE payments SET payment_status = 'Failed'
+        WHERE id_membership IN (SELECT id_membership FROM memberships WHERE id_client = ANY($1))
+        ''',
+        ids,
+    )
+
+    assert [await _data_version(db, i) for i in ids] == [b + 2 for b in before]
@@ -0,0 +1,156 @@
+import gzip
+import zlib
+
+import anyio
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import compression
+from compression import CompressionMiddleware, _choose_encoder, _BrotliEncoder, _GzipEncoder
+from config import COMPRESSION_MIN_SIZE
+
+pytestmark = pytest.mark.anyio
+
+LARGE = 'x' * COMPRESSION_MIN_SIZE
+SMALL = 'x' * (COMPRESSION_MIN_SIZE - 1)
+
+
+async def stream():
+    for _ in range(4):
+        yield LARGE[: COMPRESSION_MIN_SIZE // 2]
+
+
+async def encoded(request):
+    return Response(gzip.compress(LARGE.encode()), media_type='text/plain', headers={'Content-Encoding': 'gzip'})
+
+
+async def not_modified(request):
+    return Response(status_code=304, headers={'ETag': '"v1"'})
+
+
+sample = Starlette(routes=[
+    Route('/large', lambda request: PlainTextResponse(LARGE, headers={'ETag': '"v1"', 'Vary': 'Cookie'})),
+    Route('/small', lambda request: PlainTextResponse(SMALL)),
+    Route('/stream', lambda request: StreamingResponse(stream(), media_type='text/html')),
+    Route('/image', lambda request: Response(LARGE.encode(), media_type='image/png')),
+    Route('/encoded', encoded),
+    Route('/not-modified', not_modified),
+])
+
+
+@pytest.fixture
+async def http():
+    transport = httpx.ASGITransport(app=CompressionMiddleware(sample))
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        yield client
+
+
+def scope(accept: str) -> dict:
+    return {'headers': [(b'accept-encoding', accept.encode())]}
+
+
+@pytest.mark.parametrize(
+    'accept, chosen',
+    [
+        ('gzip, br', _BrotliEncoder),
+        ('br;q=0.5, gzip', _GzipEncoder),
+        ('br;q=0, gzip;q=0.1', _GzipEncoder),
+        ('BR; Q=1.0', _BrotliEncoder),
+        ('gzip;q=0, br;q=0', None),
+        ('*;q=0.5', _BrotliEncoder),
+        ('*, br;q=0', _GzipEncoder),
+        ('identity', None),
+        ('gzip;q=oops', None),
+        ('', None),
+    ],
+)
+def test_encoder_follows_q_values(monkeypatch, accept, chosen):
+    monkeypatch.setattr(compression, 'ENCODERS', (_BrotliEncoder, _GzipEncoder))
+    assert _choose_encoder(scope(accept)) is chosen
+
+
+async def test_large_responses_are_compressed(http):
+    response = await http.get('/large', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert response.headers['vary'] == 'Cookie, Accept-Encoding'
+    assert response.headers['etag'] == 'W/"v1"'
+    assert response.text == LARGE
+
+
+async def test_refused_coding_is_not_used(http):
+    response = await http.get('/large', headers={'Accept-Encoding': 'gzip;q=0'})
+
+    assert 'content-encoding' not in response.headers
+    assert response.headers['vary'] == 'Cookie, Accept-Encoding'
+    assert response.headers['etag'] == '"v1"'
+
+
+@pytest.mark.parametrize('accept', ['gzip', 'identity'])
+async def test_responses_below_the_threshold_still_vary(http, accept):
+    response = await http.get('/small', headers={'Accept-Encoding': accept})
+
+    assert 'content-encoding' not in response.headers
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert response.text == SMALL
+
+
+async def test_streamed_responses_are_compressed_chunk_by_chunk():
+    # Straight through the middleware, the test transport buffers the body
+    messages = []
+    requests = [{'type': 'http.request', 'body': b'', 'more_body': False}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        # The client stays connected
+        await anyio.sleep_forever()
+
+    async def send(message):
+        messages.append(message)
+
+    await CompressionMiddleware(sample)(
+        {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/stream',
+            'query_string': b'',
+            'headers': [(b'accept-encoding', b'gzip')],
+        },
+        receive,
+        send,
+    )
+
+    start, *bodies = messages
+    headers = dict(start['headers'])
+    assert headers[b'content-encoding'] == b'gzip'
+    assert b'content-length' not in headers
+    assert headers[b'vary'] == b'Accept-Encoding'
+    # Held back until the threshold, then one compressed chunk per chunk and
+    # the gzip trailer with the closing empty one
+    chunks = [m['body'] for m in bodies]
+    assert len(chunks) == 4
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert decompressor.decompress(chunks[0]).decode() == LARGE
+    assert gzip.decompress(b''.join(chunks)).decode() == LARGE[: COMPRESSION_MIN_SIZE // 2] * 4
+
+
+async def test_encoded_and_binary_responses_pass_through(http):
+    encoded = await http.get('/encoded', headers={'Accept-Encoding': 'gzip'})
+    image = await http.get('/image', headers={'Accept-Encoding': 'gzip'})
+
+    # Decoded once by the client, so it was not compressed a second time
+    assert encoded.headers['content-encoding'] == 'gzip'
+    assert encoded.text == LARGE
+    assert 'content-encoding' not in image.headers
+    assert 'vary' not in image.headers
+
+
+async def test_not_modified_carries_vary(http):
+    response = await http.get('/not-modified', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 304
+    assert response.headers['vary'] == 'Accept-Encoding'
@@ -0,0 +1,78 @@
+import re
+
+import pytest
+
+from catalog import reference_cache
+from database import SessionLocal
+from routers.user import load_user_dashboard
+from templating import KEY_SLOT, fragment_cache
+
+pytestmark = pytest.mark.anyio
+
+# client, active membership, history page, latest payments, registrations
+DASHBOARD_QUERIES = 5
+
+IDEMPOTENCY_KEY = re.compile(r'name="idempotency_key" value="([^"]+)"')
+
+
+async def _dashboard_queries(count_queries, id_client: int) -> int:
+    await reference_cache.get()
+    async with SessionLocal() as db:
+        with count_queries() as stats:
+            dashboard = await load_user_dashboard(db, id_client)
+    assert dashboard.client.id_client == id_client
+    return stats.queries
+
+
+async def test_dashboard_queries_do_not_grow_with_history(make_client, add_memberships, count_queries):
+    client = await make_client()
+    await add_memberships(client['id_client'], 1)
+    short = await _dashboard_queries(count_queries, client['id_client'])
+
+    await add_memberships(client['id_client'], 40)
+    long = await _dashboard_queries(count_queries, client['id_client'])
+
+    assert short == long == DASHBOARD_QUERIES
+
+
+async def test_dashboard_history_is_bounded(make_client, add_memberships):
+    client = await make_client()
+    await add_memberships(client['id_client'], 12)
+
+    async with SessionLocal() as db:
+        dashboard = await load_user_dashboard(db, client['id_client'])
+
+    history = dashboard.membership_history
+    assert len(history) == 5
+    assert dashboard.next_history_cursor is not None
+    # Oldest first within the page, the newest membership is last
+    assert [m.membership_start for m in history] == sorted(m.membership_start for m in history)
+    assert set(dashboard.last_payment_by_membership) == {m.id_membership for m in history}
+
+
+async def test_dashboard_renders_without_lazy_loads(http, login, make_client, add_memberships):
+    # Lazy loads from the template fail under asyncio, the view model must be complete
+    client = await make_client()
+    await add_memberships(client['id_client'], 8)
+    await login(http, client['email'])
+
+    response = await http.get('/user/dashboard')
+
+    assert response.status_code == 200
+
+
+async def test_cached_buy_forms_get_fresh_keys(http, login, make_client):
+    client = await make_client()
+    await login(http, client['email'])
+
+    first = await http.get('/user/dashboard')
+    hits = fragment_cache.hits
+    second = await http.get('/user/dashboard')
+
+    assert fragment_cache.hits > hits
+    first_keys = IDEMPOTENCY_KEY.findall(first.text)
+    second_keys = IDEMPOTENCY_KEY.findall(second.text)
+    assert first_keys and len(second_keys) == len(first_keys)
+    # A key is never rendered twice, from the cache or otherwise
+    assert len(set(first_keys) | set(second_keys)) == len(first_keys) * 2
+    assert KEY_SLOT not in second.text
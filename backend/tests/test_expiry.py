@@ -0,0 +1,98 @@
+from datetime import date, timedelta
+
+import pytest
+
+import expiry
+from expiry import expire_memberships, expiry_stats
+
+pytestmark = pytest.mark.anyio
+
+# Days past membership_stop of the active memberships, 0 ends today
+OVERDUE = [30, 5, 1, 1, 0, 0]
+
+
+@pytest.fixture
+async def memberships(db, catalog, make_client):
+    # Earlier tests may have left memberships to expire
+    await expire_memberships()
+
+    async def add(stop: date) -> dict:
+        client = await make_client()
+        id_membership = await db.fetchval(
+            '''
+            INSERT INTO memberships
+                (id_client, id_membership_type, id_gym, membership_status, membership_start, membership_stop)
+            VALUES ($1, $2, $3, 'Active', $4, $5)
+            RETURNING id_membership
+            ''',
+            client['id_client'], catalog['membership_type'], catalog['gym'], stop - timedelta(days=30), stop,
+        )
+        return {**client, 'id_membership': id_membership}
+
+    today = date.today()
+    return {
+        'due': [await add(today - timedelta(days=days)) for days in OVERDUE],
+        'running': [await add(today + timedelta(days=1)), await add(today + timedelta(days=30))],
+    }
+
+
+async def _statuses(db, rows: list[dict]) -> list[str]:
+    return [
+        await db.fetchval('SELECT membership_status::text FROM memberships WHERE id_membership = $1', r['id_membership'])
+        for r in rows
+    ]
+
+
+async def _data_versions(db, rows: list[dict]) -> list[int]:
+    return [
+        await db.fetchval('SELECT data_version FROM clients WHERE id_client = $1', r['id_client'])
+        for r in rows
+    ]
+
+
+@pytest.mark.parametrize(
+    'batch, statements',
+    [
+        # A full last batch needs one more, empty, round to see the end
+        (2, 4),
+        (3, 3),
+        (4, 2),
+        (len(OVERDUE), 2),
+        (100, 1),
+    ],
+)
+async def test_expires_in_batches(db, memberships, count_queries, monkeypatch, batch, statements):
+    monkeypatch.setattr(expiry, 'MEMBERSHIP_EXPIRY_BATCH', batch)
+
+    with count_queries() as stats:
+        expired = await expire_memberships()
+
+    assert expired == len(OVERDUE)
+    assert stats.queries == statements
+    assert expiry_stats.last_run_rows == len(OVERDUE)
+    assert await _statuses(db, memberships['due']) == ['Expired'] * len(OVERDUE)
+    assert await _statuses(db, memberships['running']) == ['Active', 'Active']
+
+
+async def test_rerun_changes_nothing(db, memberships, monkeypatch):
+    monkeypatch.setattr(expiry, 'MEMBERSHIP_EXPIRY_BATCH', 4)
+    await expire_memberships()
+    versions = await _data_versions(db, memberships['due'] + memberships['running'])
+
+    assert await expire_memberships() == 0
+    assert expiry_stats.last_run_rows == 0
+    assert await _statuses(db, memberships['due']) == ['Expired'] * len(OVERDUE)
+    assert await _statuses(db, memberships['running']) == ['Active', 'Active']
+    assert await _data_versions(db, memberships['due'] + memberships['running']) == versions
+
+
+async def test_membership_ending_today_is_expired(db, memberships, catalog):
+    # The client can buy the next one on the day the last one ends
+    ends_today = memberships['due'][-1]
+    await expire_memberships()
+
+    assert await _statuses(db, [ends_today]) == ['Expired']
+    assert await db.fetchval(
+        'SELECT buy_membership($1, $2, $3)',
+        ends_today['id_client'], catalog['membership_type'], catalog['gym'],
+    ) == 'bought'
@@ -0,0 +1,47 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import security
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_saturated_pool_answers_503(app, monkeypatch):
+    # One slot, one waiter, a short wait
+    monkeypatch.setattr(security, '_hash_slots', asyncio.Semaphore(1))
+    monkeypatch.setattr(security, 'HASH_MAX_WAITING', 1)
+    monkeypatch.setattr(security, 'HASH_QUEUE_TIMEOUT', 0.1)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(security._run_in_hash_pool(time.sleep, 0.5) for _ in range(4)),
+        return_exceptions=True,
+    )
+
+    refused = [r for r in results if isinstance(r, HTTPException)]
+    assert results.count(None) == 1
+    assert len(refused) == 3
+    assert {r.status_code for r in refused} == {503}
+    # Nobody waited for the running job to finish before being refused
+    assert time.perf_counter() - started < 1
+    assert security._hash_waiting == 0
+
+
+async def test_login_burst_is_refused_not_queued(http, make_client, monkeypatch):
+    client = await make_client()
+    monkeypatch.setattr(security, '_hash_slots', asyncio.Semaphore(1))
+    monkeypatch.setattr(security, 'HASH_MAX_WAITING', 0)
+    monkeypatch.setattr(security, 'HASH_QUEUE_TIMEOUT', 0.1)
+
+    responses = await asyncio.gather(
+        *(
+            http.post('/auth/login', data={'email': client['email'], 'password': 'wrong'})
+            for _ in range(8)
+        )
+    )
+
+    assert {r.status_code for r in responses} <= {303, 503}
+    assert any(r.status_code == 503 for r in responses)
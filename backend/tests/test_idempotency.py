@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+
+from idempotency import MISMATCH, PENDING, PostgresIdempotencyStore, StoredResponse
+
+pytestmark = pytest.mark.anyio
+
+
+def _buy_form(catalog, key: str, **fields) -> dict:
+    return {
+        'membership_type_id': catalog['membership_type'],
+        'gym_id': catalog['gym'],
+        'idempotency_key': key,
+        **fields,
+    }
+
+
+async def _active(db, id_client: int) -> int:
+    return await db.fetchval(
+        "SELECT count(*) FROM memberships WHERE id_client = $1 AND membership_status = 'Active'",
+        id_client,
+    )
+
+
+async def test_retry_replays_the_outcome(db, http, login, catalog, make_client):
+    client = await make_client()
+    await login(http, client['email'])
+
+    first = await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy'))
+    retry = await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy'))
+
+    assert first.status_code == retry.status_code == 303
+    assert retry.headers['location'] == first.headers['location']
+    assert await _active(db, client['id_client']) == 1
+
+
+async def test_key_reused_with_another_body_is_rejected(db, http, login, catalog, make_client):
+    client = await make_client()
+    await login(http, client['email'])
+
+    await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy'))
+    reused = await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy', gym_id=-1))
+
+    assert reused.status_code == 422
+
+
+async def test_client_errors_are_not_stored(db, http, login, catalog, make_client):
+    client = await make_client()
+    await login(http, client['email'])
+
+    # gym_id missing, the corrected retry must run instead of replaying the 422
+    invalid = await http.post(
+        '/user/membership/buy',
+        data={'membership_type_id': catalog['membership_type'], 'idempotency_key': 'buy'},
+    )
+    corrected = await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy'))
+
+    assert invalid.status_code == 422
+    assert corrected.status_code == 303
+    assert await _active(db, client['id_client']) == 1
+
+
+async def test_postgres_store_checks_the_fingerprint(db, app):
+    store = PostgresIdempotencyStore()
+    key = uuid.uuid4().hex
+    try:
+        assert await store.claim(key, 'a') is None
+        assert await store.claim(key, 'a') is PENDING
+        assert await store.claim(key, 'b') is MISMATCH
+
+        await store.complete(key, StoredResponse(303, [('location', '/user/dashboard')], b''))
+
+        stored = await store.claim(key, 'a')
+        assert stored.status == 303
+        assert stored.headers == [('location', '/user/dashboard')]
+        assert await store.claim(key, 'b') is MISMATCH
+    finally:
+        await store.release(key)
+
+
+async def test_spent_keys_are_not_revalidated(db, http, login, catalog, make_client):
+    # A failed purchase changes no data, the page must still re-render with new keys
+    client = await make_client()
+    await login(http, client['email'])
+    page = await http.get('/user/dashboard')
+    etag = page.headers['etag']
+    assert (await http.get('/user/dashboard', headers={'if-none-match': etag})).status_code == 304
+
+    failed = await http.post('/user/membership/buy', data=_buy_form(catalog, 'buy', gym_id=-1))
+    revalidated = await http.get('/user/dashboard', headers={'if-none-match': etag})
+
+    assert failed.status_code == 303
+    assert 'form_gen' in failed.cookies
+    assert revalidated.status_code == 200
+    assert revalidated.headers['etag'] != etag
@@ -0,0 +1,207 @@
+import uuid
+
+import pytest
+
+import imports
+from conftest import TEST_DOMAIN, TEST_PASSWORD
+from idempotency import IdempotencyMiddleware
+from imports import import_clients
+
+pytestmark = pytest.mark.anyio
+
+HEADER = 'name,surname,birth_date,sex,email,phone_number,password'
+
+
+@pytest.fixture
+async def people(db):
+    # Fresh emails and phone numbers, the imported clients are removed again
+    tag = uuid.uuid4().hex[:12]
+    numbers = iter(range(1, 1000))
+
+    def person(email: str | None = None, phone: str | None = None, **fields) -> dict:
+        n = next(numbers)
+        return {
+            'name': 'Imported',
+            'surname': f'Person{n}',
+            'birth_date': '1991-02-03',
+            'sex': 'female',
+            'email': email or f'import-{tag}-{n}@{TEST_DOMAIN}',
+            'phone_number': phone or f'+6{uuid.uuid4().int % 10**10:010d}',
+            'password': 'imported-password',
+            **fields,
+        }
+
+    yield person
+
+    pattern = f'import-{tag}-%'
+    clients = await db.fetch(
+        '''
+        SELECT c.id_client, c.id_contact FROM clients c
+        JOIN contacts ct ON ct.id_contact = c.id_contact
+        WHERE ct.email LIKE $1
+        ''',
+        pattern,
+    )
+    await db.execute('DELETE FROM passwords WHERE id_client = ANY($1)', [r['id_client'] for r in clients])
+    await db.execute('DELETE FROM clients WHERE id_client = ANY($1)', [r['id_client'] for r in clients])
+    await db.execute('DELETE FROM contacts WHERE email LIKE $1', pattern)
+
+
+def csv_lines(*rows: dict) -> list[str]:
+    return [HEADER + '\n'] + [','.join(row[c] for c in imports.COLUMNS) + '\n' for row in rows]
+
+
+async def imported(db, rows: list[dict]) -> list[str]:
+    return [
+        r['email']
+        for r in await db.fetch(
+            '''
+            SELECT ct.email FROM contacts ct
+            JOIN clients c ON c.id_contact = ct.id_contact
+            JOIN passwords p ON p.id_client = c.id_client
+            WHERE ct.email = ANY($1)
+            ORDER BY ct.email
+            ''',
+            [row['email'] for row in rows],
+        )
+    ]
+
+
+async def test_invalid_rows_are_reported_by_line(db, app, people):
+    good = [people(), people()]
+    rows = [
+        good[0],
+        people(email='not-an-email'),
+        people(birth_date='03/02/1991'),
+        people(sex='unknown'),
+        people(password=''),
+        people(phone_number='12ab'),
+        good[1],
+    ]
+
+    report = await import_clients(csv_lines(*rows))
+
+    assert (report.rows, report.imported) == (7, 2)
+    assert [(e.line, e.message) for e in report.errors] == [
+        (3, "Invalid email address"),
+        (4, "Birth date must be YYYY-MM-DD"),
+        (5, "Sex must be male, female or other"),
+        (6, "Password is empty"),
+        (7, "Phone number may only contain digits and a leading '+'"),
+    ]
+    assert await imported(db, good) == sorted(row['email'] for row in good)
+
+
+async def test_missing_columns_are_refused(app):
+    with pytest.raises(ValueError, match='Missing columns: password'):
+        await import_clients(['name,surname,birth_date,sex,email,phone_number\n'])
+
+
+async def test_duplicates_are_rejected(db, app, people, make_client):
+    registered = await make_client()
+    first = people()
+    rows = [
+        first,
+        people(email=first['email']),
+        people(phone=first['phone_number']),
+        people(email=registered['email']),
+    ]
+
+    report = await import_clients(csv_lines(*rows))
+
+    assert report.imported == 1
+    assert [(e.line, e.message) for e in report.errors] == [
+        (3, "Same email or phone number as line 2"),
+        (4, "Same email or phone number as line 2"),
+        (5, "Email or phone number is already registered"),
+    ]
+    assert await imported(db, [first]) == [first['email']]
+
+
+async def test_dry_run_neither_hashes_nor_inserts(db, app, people, monkeypatch):
+    async def no_hashing(passwords):
+        raise AssertionError("a dry run hashed passwords")
+
+    monkeypatch.setattr(imports, '_hash', no_hashing)
+    rows = [people(), people(email='broken')]
+
+    report = await import_clients(csv_lines(*rows), dry_run=True)
+
+    assert (report.rows, report.imported, len(report.errors)) == (2, 1, 1)
+    assert await imported(db, rows) == []
+
+
+async def test_conflicting_rows_are_retried_one_by_one(db, app, people, monkeypatch):
+    # Another registration takes one of the emails after the batch was checked
+    rows = [people(), people(), people()]
+    taken = rows[1]
+    check = imports._drop_registered
+
+    async def drop_registered_then_race(session, batch, report):
+        fresh = await check(session, batch, report)
+        await db.execute(
+            'INSERT INTO contacts (phone_number, email) VALUES ($1, $2)',
+            f'+5{uuid.uuid4().int % 10**10:010d}',
+            taken['email'],
+        )
+        return fresh
+
+    monkeypatch.setattr(imports, '_drop_registered', drop_registered_then_race)
+
+    report = await import_clients(csv_lines(*rows))
+
+    assert report.imported == 2
+    assert [(e.line, e.message) for e in report.errors] == [
+        (3, "Email or phone number is already registered"),
+    ]
+    assert await imported(db, rows) == sorted([rows[0]['email'], rows[2]['email']])
+
+
+async def test_upload_reports_the_import(db, http, login, make_client, people):
+    admin = await make_client(is_admin=True)
+    await login(http, admin['email'])
+    rows = [people(), people(sex='?')]
+
+    response = await http.post(
+        '/admin/import/clients',
+        files={'file': ('members.csv', ''.join(csv_lines(*rows)).encode(), 'text/csv')},
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        'rows': 2,
+        'imported': 1,
+        'dry_run': False,
+        'errors': [{'line': 3, 'message': "Sex must be male, female or other"}],
+    }
+    assert await imported(db, rows) == [rows[0]['email']]
+
+
+@pytest.mark.parametrize(
+    'headers, buffered',
+    [
+        ([(b'content-type', b'multipart/form-data; boundary=x')], False),
+        ([(b'content-type', b'multipart/form-data; boundary=x'), (b'idempotency-key', b'k')], True),
+        ([(b'content-type', b'application/x-www-form-urlencoded')], True),
+    ],
+)
+async def test_uploads_without_a_key_are_not_buffered(headers, buffered):
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def app(scope, app_receive, send):
+        assert (app_receive is not receive) == buffered
+
+    scope = {'type': 'http', 'method': 'POST', 'path': '/admin/import/clients', 'headers': headers}
+    await IdempotencyMiddleware(app)(scope, receive, None)
+
+
+async def test_login_strips_the_email(http, make_client):
+    client = await make_client()
+
+    response = await http.post(
+        '/auth/login', data={'email': f"  {client['email']}\t", 'password': TEST_PASSWORD}
+    )
+
+    assert response.status_code == 303
+    assert 'invalid' not in response.headers['location']
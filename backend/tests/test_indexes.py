@@ -0,0 +1,110 @@
+# The hot lookups must be servable by an index. The test tables are small,
+# so sequential scans are switched off and the plan shows which index the
+# planner can use; a missing index leaves a Seq Scan in the plan.
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+LOOKUPS = [
+    pytest.param(
+        'SELECT id_contact FROM contacts WHERE email = $1',
+        ('someone@tests.invalid',),
+        {'contacts_email_key'},
+        id='login_email',
+    ),
+    pytest.param(
+        'SELECT id_contact FROM contacts WHERE phone_number = $1 OR email = $2',
+        ('+70000000000', 'someone@tests.invalid'),
+        {'contacts_phone_number_key', 'contacts_email_key'},
+        id='register_phone_or_email',
+    ),
+    pytest.param(
+        'SELECT id_client FROM clients WHERE id_contact = $1',
+        (1,),
+        {'clients_id_contact_idx'},
+        id='client_by_contact',
+    ),
+    pytest.param(
+        'SELECT count(*) FROM registered WHERE id_group = $1',
+        (1,),
+        {'registered_group_client_key'},
+        id='group_capacity_count',
+    ),
+    pytest.param(
+        '''
+        SELECT id_membership FROM memberships
+        WHERE id_client = $1 AND membership_status = 'Active' AND membership_stop > current_date
+        ''',
+        (1,),
+        {'memberships_one_active_key'},
+        id='active_membership',
+    ),
+    pytest.param(
+        '''
+        SELECT id_membership FROM memberships
+        WHERE id_client = $1
+        ORDER BY membership_start DESC, id_membership DESC
+        LIMIT 6
+        ''',
+        (1,),
+        {'memberships_client_history_idx'},
+        id='membership_history_page',
+    ),
+    pytest.param(
+        '''
+        SELECT DISTINCT ON (id_membership) id_payment FROM payments
+        WHERE id_membership = ANY($1::int[])
+        ORDER BY id_membership, date_payment DESC, id_payment DESC
+        ''',
+        ([1, 2, 3],),
+        {'payments_membership_paid_idx'},
+        id='latest_payments',
+    ),
+]
+
+
+def _indexes(plan: dict) -> set[str]:
+    found = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', ()):
+        found |= _indexes(child)
+    return found
+
+
+def _node_types(plan: dict) -> set[str]:
+    found = {plan['Node Type']}
+    for child in plan.get('Plans', ()):
+        found |= _node_types(child)
+    return found
+
+
+async def _plan(db, query: str, args: tuple) -> dict:
+    async with db.transaction():
+        await db.execute('SET LOCAL enable_seqscan = off')
+        result = await db.fetchval(f'EXPLAIN (FORMAT JSON) {query}', *args)
+    return json.loads(result)[0]['Plan']
+
+
+@pytest.mark.parametrize('query, args, indexes', LOOKUPS)
+async def test_lookup_uses_index(db, app, query, args, indexes):
+    plan = await _plan(db, query, args)
+
+    assert 'Seq Scan' not in _node_types(plan)
+    assert indexes <= _indexes(plan)
+
+
+async def test_client_search_uses_trigram_indexes(db, app):
+    if await db.fetchval("SELECT to_regclass('clients_name_trgm_idx')") is None:
+        pytest.skip("pg_trgm is not installed")
+
+    plan = await _plan(
+        db,
+        '''
+        SELECT c.id_client FROM clients c JOIN contacts ct ON ct.id_contact = c.id_contact
+        WHERE c.name ILIKE $1 OR c.surname ILIKE $1
+        ''',
+        ('%nov%',),
+    )
+
+    assert {'clients_name_trgm_idx', 'clients_surname_trgm_idx'} <= _indexes(plan)
@@ -0,0 +1,29 @@
+import pytest
+
+import routers.metrics
+
+pytestmark = pytest.mark.anyio
+
+ENDPOINTS = ['/metrics', '/metrics/pool', '/metrics/templates']
+
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+async def test_served_to_a_local_scraper(http, path):
+    response = await http.get(path)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('path', ENDPOINTS)
+async def test_hidden_from_proxied_requests(http, path):
+    response = await http.get(path, headers={'x-forwarded-for': '203.0.113.7'})
+
+    assert response.status_code == 404
+
+
+async def test_token_required_when_configured(http, monkeypatch):
+    monkeypatch.setattr(routers.metrics, 'METRICS_TOKEN', 'scrape-token')
+
+    assert (await http.get('/metrics')).status_code == 404
+    assert (await http.get('/metrics', headers={'authorization': 'Bearer wrong'})).status_code == 404
+    assert (await http.get('/metrics', headers={'authorization': 'Bearer scrape-token'})).status_code == 200
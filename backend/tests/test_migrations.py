@@ -0,0 +1,98 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+import migrations
+from conftest import DATABASE
+
+pytestmark = pytest.mark.anyio
+
+LOOKUP_INDEXES = DATABASE / 'migrations' / '0001_lookup_indexes.sql'
+LOOKUP_TABLES = ('contacts', 'clients', 'registered', 'memberships', 'groups', 'payments')
+
+
+async def test_concurrent_startups_with_concurrent_index(db, app, tmp_path, monkeypatch):
+    # Two workers start together, the first builds an index concurrently
+    # while the second waits for the migration lock
+    (tmp_path / '9999_test_concurrent_index.sql').write_text(
+        '''-- migrate: no-transaction
+        SELECT pg_sleep(0.5);
+        CREATE TABLE test_concurrent_index (x INT);
+        CREATE INDEX CONCURRENTLY test_concurrent_index_idx ON test_concurrent_index (x)
+        '''
+    )
+    monkeypatch.setattr(migrations, 'MIGRATIONS', str(tmp_path))
+    monkeypatch.setattr(migrations, 'LOCK_POLL_INTERVAL', 0.05)
+    try:
+        first, second = await asyncio.wait_for(
+            asyncio.gather(migrations.run_migrations(), migrations.run_migrations()),
+            timeout=20,
+        )
+
+        assert sorted([first, second]) == [[], ['9999_test_concurrent_index']]
+        assert await db.fetchval(
+            "SELECT indisvalid FROM pg_index WHERE indexrelid = 'test_concurrent_index_idx'::regclass"
+        )
+    finally:
+        await db.execute('DROP TABLE IF EXISTS test_concurrent_index')
+        await db.execute("DELETE FROM schema_migrations WHERE version = '9999_test_concurrent_index'")
+
+
+async def _run_lookup_indexes(pool, contacts: list[tuple[str, str]]) -> None:
+    # On empty temporary copies of the tables, they shadow the real ones
+    async with pool.acquire() as conn:
+        tx = conn.transaction()
+        await tx.start()
+        try:
+            for table in LOOKUP_TABLES:
+                await conn.execute(f'CREATE TEMP TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS INCLUDING IDENTITY)')
+            await conn.executemany('INSERT INTO contacts (phone_number, email) VALUES ($1, $2)', contacts)
+            await conn.execute(LOOKUP_INDEXES.read_text())
+        finally:
+            await tx.rollback()
+
+
+async def test_lookup_indexes_stop_on_duplicate_contacts(pool):
+    with pytest.raises(asyncpg.RaiseError, match='email shared@tests.invalid'):
+        await _run_lookup_indexes(
+            pool,
+            [('+10000000001', 'shared@tests.invalid'), ('+10000000002', 'shared@tests.invalid')],
+        )
+
+
+async def test_lookup_indexes_apply_to_distinct_contacts(pool):
+    await _run_lookup_indexes(
+        pool,
+        [('+10000000001', 'one@tests.invalid'), ('+10000000002', 'two@tests.invalid')],
+    )
+
+
+async def test_interrupted_concurrent_index_is_rebuilt(db, app, tmp_path, monkeypatch):
+    # The new index replaces an old one. Its first build fails on duplicate
+    # values and leaves it invalid, the old index must survive until a
+    # rerun has built it for real.
+    (tmp_path / '9998_test_invalid_index.sql').write_text(
+        '''-- migrate: no-transaction
+        CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS test_invalid_index_new ON test_invalid_index (x);
+        DROP INDEX CONCURRENTLY IF EXISTS test_invalid_index_old
+        '''
+    )
+    monkeypatch.setattr(migrations, 'MIGRATIONS', str(tmp_path))
+    await db.execute('CREATE TABLE test_invalid_index (x INT)')
+    await db.execute('CREATE INDEX test_invalid_index_old ON test_invalid_index (x)')
+    await db.execute('INSERT INTO test_invalid_index VALUES (1), (1)')
+    valid = "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass('test_invalid_index_new')"
+    try:
+        with pytest.raises(asyncpg.UniqueViolationError):
+            await migrations.run_migrations()
+        assert await db.fetchval(valid) is False
+
+        await db.execute('DELETE FROM test_invalid_index WHERE ctid = (SELECT min(ctid) FROM test_invalid_index)')
+        assert await migrations.run_migrations() == ['9998_test_invalid_index']
+
+        assert await db.fetchval(valid) is True
+        assert await db.fetchval("SELECT to_regclass('test_invalid_index_old')") is None
+    finally:
+        await db.execute('DROP TABLE IF EXISTS test_invalid_index')
+        await db.execute("DELETE FROM schema_migrations WHERE version = '9998_test_invalid_index'")
@@ -0,0 +1,98 @@
+from decimal import Decimal
+
+import pytest
+
+from money import Money
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize(
+    'value, minor',
+    [
+        ('300', 30000),
+        ('300.5', 30050),
+        (' 12.34 ', 1234),
+        ('0.005', 1),
+        ('0.004', 0),
+        ('1.005', 101),
+        ('2.675', 268),
+        ('-0.005', -1),
+        ('-1.50', -150),
+        (Decimal('99.999'), 10000),
+        (7, 700),
+    ],
+)
+def test_parse_rounds_half_up_to_minor_units(value, minor):
+    assert Money.parse(value) == Money(minor)
+
+
+@pytest.mark.parametrize('value', ['', 'abc', '1,50', '300 CZK', '$5', 'NaN', 'inf', '-Infinity', None])
+def test_parse_rejects_invalid_amounts(value):
+    with pytest.raises(ValueError):
+        Money.parse(value)
+
+
+def test_formats_with_two_decimals():
+    assert str(Money(30000)) == '300.00'
+    assert str(Money(5)) == '0.05'
+    assert str(Money(-150)) == '-1.50'
+    assert Money(1234).amount == Decimal('12.34')
+
+
+def test_parse_keeps_money_as_is():
+    money = Money(42)
+    assert Money.parse(money) is money
+
+
+@pytest.fixture
+async def admin(http, login, make_client):
+    admin = await make_client(is_admin=True)
+    await login(http, admin['email'])
+    return admin
+
+
+@pytest.mark.parametrize(
+    'price, currency',
+    [('abc', 'CZK'), ('-1', 'CZK'), ('NaN', 'CZK'), ('100', 'USD'), ('100', 'czk')],
+)
+async def test_membership_type_forms_refuse_bad_input(db, http, admin, catalog, price, currency):
+    form = {'title': 'Invalid', 'price': price, 'currency': currency, 'duration': 30, 'description': '-'}
+    before = await db.fetchrow(
+        'SELECT price, currency FROM membership_types WHERE id_membership_type = $1',
+        catalog['membership_type'],
+    )
+
+    created = await http.post('/admin/membership-types', data=form)
+    edited = await http.post(f'/admin/membership-types/{catalog["membership_type"]}/edit', data=form)
+
+    assert created.status_code == 400
+    assert edited.status_code == 400
+    assert await db.fetchval("SELECT count(*) FROM membership_types WHERE title = 'Invalid'") == 0
+    assert await db.fetchrow(
+        'SELECT price, currency FROM membership_types WHERE id_membership_type = $1',
+        catalog['membership_type'],
+    ) == before
+
+
+async def test_payment_totals_are_kept_per_currency(db, http, admin, make_client, add_memberships):
+    client = await make_client()
+    await add_memberships(client['id_client'], 2)
+    # One of the two CZK payments was taken in euros
+    await db.execute(
+        '''
+        UPDATE payments SET amount = 1250, currency = 'EUR'
+        WHERE id_payment = (
+            SELECT min(p.id_payment) FROM payments p
+            JOIN memberships m ON m.id_membership = p.id_membership
+            WHERE m.id_client = $1
+        )
+        ''',
+        client['id_client'],
+    )
+
+    response = await http.get(f'/admin/clients/{client["id_client"]}')
+
+    assert response.status_code == 200
+    assert 'CZK:300.00' in response.text
+    assert 'EUR:12.50' in response.text
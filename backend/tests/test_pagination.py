@@ -0,0 +1,51 @@
+import base64
+
+import pytest
+from fastapi import HTTPException
+
+from pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(['Novak', 'Jan', 42])
+
+    assert decode_cursor(cursor, (str, str, int)) == ['Novak', 'Jan', 42]
+    assert decode_cursor(None, (str, str, int)) is None
+
+
+@pytest.mark.parametrize(
+    'cursor',
+    [
+        encode_cursor(['Novak', 'Jan']),
+        encode_cursor([['Novak'], {'name': 'Jan'}, 42]),
+        encode_cursor(['Novak', 'Jan', '42']),
+        encode_cursor(['Novak', 'Jan', True]),
+        encode_cursor(['Novak', 'Jan', 2**40]),
+        encode_cursor(['Novak\x00', 'Jan', 42]),
+        encode_cursor({'surname': 'Novak'}),
+        base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+        'not base64!',
+    ],
+)
+def test_crafted_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        decode_cursor(cursor, (str, str, int))
+
+    assert e.value.status_code == 400
+
+
+def test_search_rank_accepts_integral_json_numbers():
+    assert decode_cursor(encode_cursor([1, 7]), (float, int)) == [1, 7]
+
+
+@pytest.mark.anyio
+async def test_admin_search_with_crafted_cursor_is_a_bad_request(http, login, make_client):
+    admin = await make_client(is_admin=True)
+    await login(http, admin['email'])
+
+    response = await http.get(
+        '/admin/dashboard',
+        params={'q': 'nov', 'cursor': encode_cursor([{'rank': 1}, 'x'])},
+    )
+
+    assert response.status_code == 400
@@ -0,0 +1,72 @@
+import pytest
+from sqlalchemy import text
+
+from catalog import reference_cache
+from database import engine
+from instrumentation import QueryBudgetExceeded, query_budget
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_strict_budget_fails_the_statement_over_it(app, count_queries):
+    with count_queries():
+        budget = query_budget(1)()
+        await budget.__anext__()
+        async with engine.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+            with pytest.raises(QueryBudgetExceeded):
+                await conn.execute(text('SELECT 2'))
+        await budget.aclose()
+
+
+@pytest.fixture
+async def member(http, login, make_client, add_memberships):
+    client = await make_client()
+    await add_memberships(client['id_client'], 12)
+    await login(http, client['email'])
+    return client
+
+
+@pytest.fixture
+async def admin(http, login, make_client, add_memberships):
+    client = await make_client()
+    await add_memberships(client['id_client'], 12)
+    admin = await make_client(is_admin=True)
+    await login(http, admin['email'])
+    return client
+
+
+@pytest.mark.parametrize(
+    'path',
+    ['/user/dashboard', '/user/history/memberships', '/user/history/payments'],
+)
+@pytest.mark.parametrize('cold', [True, False], ids=['cold', 'warm'])
+async def test_user_pages_stay_within_budget(http, member, path, cold):
+    if cold:
+        await reference_cache.invalidate()
+
+    response = await http.get(path)
+
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize(
+    'path',
+    [
+        '/admin/dashboard?surname=Client',
+        '/admin/clients/{id}',
+        '/admin/clients/{id}/history/memberships',
+        '/admin/clients/{id}/history/payments',
+        '/admin/membership-types',
+        '/admin/gyms',
+        '/admin/analytics',
+    ],
+)
+@pytest.mark.parametrize('cold', [True, False], ids=['cold', 'warm'])
+async def test_admin_pages_stay_within_budget(http, admin, path, cold):
+    if cold:
+        await reference_cache.invalidate()
+
+    response = await http.get(path.format(id=admin['id_client']))
+
+    assert response.status_code == 200
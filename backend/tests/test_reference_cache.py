@@ -0,0 +1,48 @@
+import asyncio
+
+import asyncpg
+import pytest
+
+import catalog
+from catalog import ReferenceCache, reference_cache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_fresh_get_sees_changes_from_other_workers(db, app):
+    # A write through another connection, as another worker or psql would
+    current = await reference_cache.get()
+    gym = current.gyms[0]
+    try:
+        await db.execute('UPDATE gyms SET building = building || $1 WHERE id_gym = $2', ' (moved)', gym.id_gym)
+
+        fresh = await reference_cache.get(fresh=True)
+
+        assert fresh.shared_version > current.shared_version
+        assert fresh.digest != current.digest
+    finally:
+        await db.execute('UPDATE gyms SET building = $1 WHERE id_gym = $2', gym.building, gym.id_gym)
+
+
+async def test_listener_survives_unexpected_errors(app, monkeypatch):
+    real_connect = catalog.asyncpg.connect
+    failures = [asyncpg.InterfaceError('connection is closed'), RuntimeError('unexpected')]
+    connected = asyncio.Event()
+
+    async def flaky_connect(*args, **kwargs):
+        if failures:
+            raise failures.pop(0)
+        conn = await real_connect(*args, **kwargs)
+        connected.set()
+        return conn
+
+    monkeypatch.setattr(catalog.asyncpg, 'connect', flaky_connect)
+    monkeypatch.setattr(catalog, 'RECONNECT_DELAY', 0.01)
+    cache = ReferenceCache()
+    monkeypatch.setattr(catalog, 'REFERENCE_CACHE_NOTIFY', True)
+    cache.start_listener()
+    try:
+        await asyncio.wait_for(connected.wait(), timeout=5)
+        assert not cache._listener.done()
+    finally:
+        await cache.stop_listener()
@@ -0,0 +1,49 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import sessions
+from config import SESSION_TTL
+from sessions import SESSION_COOKIE
+
+pytestmark = pytest.mark.anyio
+
+
+async def _session_cookie(http, login, make_client) -> str:
+    client = await make_client()
+    await login(http, client['email'])
+    assert (await http.get('/user/dashboard')).status_code == 200
+    return http.cookies[SESSION_COOKIE]
+
+
+async def test_logout_revokes_the_session(http, login, make_client):
+    token = await _session_cookie(http, login, make_client)
+
+    response = await http.post('/auth/logout')
+    assert response.status_code == 303
+
+    # A copy of the cookie kept from before the logout
+    http.cookies.set(SESSION_COOKIE, token)
+    assert (await http.get('/user/dashboard')).status_code == 401
+
+
+async def test_expired_session_is_rejected(http, login, make_client, monkeypatch):
+    await _session_cookie(http, login, make_client)
+
+    later = SESSION_TTL + 1
+    monkeypatch.setattr(
+        sessions,
+        'time',
+        SimpleNamespace(time=lambda: time.time() + later, monotonic=lambda: time.monotonic() + later),
+    )
+
+    assert (await http.get('/user/dashboard')).status_code == 401
+
+
+async def test_tampered_token_is_rejected(http, login, make_client):
+    token = await _session_cookie(http, login, make_client)
+    body, signature = token.split('.', 1)
+
+    http.cookies.set(SESSION_COOKIE, f'{body}.{signature[::-1]}')
+    assert (await http.get('/user/dashboard')).status_code == 401
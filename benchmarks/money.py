@@ -0,0 +1,57 @@
+# Micro-benchmark of the money handling on the purchase path: the old
+# string-scrubbing parse of MONEY values against Money, which the database
+# hands over as integer minor units. Needs the app's requirements.
+#
+#   python benchmarks/money.py --number 200000
+import argparse
+import os
+import sys
+import timeit
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'src'))
+
+from money import Money, MoneyType  # noqa: E402
+
+
+def legacy_parse_money(value) -> Decimal:
+    # routers/user.parse_money before MONEY became BIGINT minor units
+    raw = str(value)
+    cleaned = (
+        raw.replace('$', '')
+           .replace('€', '')
+           .replace('£', '')
+           .replace('Kč', '')
+           .replace('CZK', '')
+           .replace(',', '')
+           .strip()
+    )
+    return Decimal(cleaned)
+
+
+def cases() -> dict:
+    column = MoneyType()
+    # One discounted purchase: read the price, apply the discount, round to
+    # minor units and render it
+    return {
+        'legacy: parse MONEY text': lambda: legacy_parse_money('1,234.50 Kč'),
+        'legacy: discount and format': lambda: f"{(legacy_parse_money('1,234.50 Kč') * Decimal('0.85')).quantize(Decimal('0.01'))}",
+        'Money: load BIGINT': lambda: column.process_result_value(123450, None),
+        'Money: discount and format': lambda: str(Money(123450 * 85 // 100)),
+        'Money.parse: form input': lambda: Money.parse('1234.50'),
+        'MoneyType: bind': lambda: column.process_bind_param(Money(123450), None),
+    }
+
+
+def main(args) -> None:
+    print(f"{'case':32} {'ns/op':>10}")
+    for name, fn in cases().items():
+        best = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+        print(f'{name:32} {best / args.number * 1e9:10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the money parsing paths")
+    parser.add_argument('--number', type=int, default=100_000, help="calls per timing")
+    parser.add_argument('--repeat', type=int, default=5, help="timings, the best one is reported")
+    main(parser.parse_args())
@@ -0,0 +1,466 @@
+# Drives the real endpoints of a running app at a fixed concurrency and
+# reports throughput and latency percentiles per scenario.
+#
+#   python benchmarks/seed.py
+#   python benchmarks/run.py --base-url http://localhost:8000 --save
+#   python benchmarks/run.py --compare benchmarks/baselines/<commit>.json
+#
+# With --app-pid (Linux), the peak RSS of the app and its worker processes
+# is sampled during every scenario.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from collections import Counter
+from contextlib import AsyncExitStack
+from datetime import datetime, timezone
+
+import asyncpg
+import httpx
+
+from common import BENCH_DOMAIN, BENCH_PASSWORD, bench_email, default_dsn
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+PERCENTILES = (50, 90, 95, 99)
+# Reported by the scenarios that have them
+EXTRA_COLUMNS = ('rows_per_s', 'mb_per_s', 'peak_rss_mb')
+RSS_INTERVAL = 0.05
+
+
+class Scenario:
+    # One measured request per step, reset() undoes its effect unmeasured
+    name = ''
+    admin = False
+    expected = (200,)
+    # Upper bound on --concurrency, for scenarios with heavy requests
+    max_workers = None
+
+    def __init__(self, bench: 'Bench', worker: int):
+        self.bench = bench
+        self.worker = worker
+        # Volume moved by successful steps, e.g. rows and bytes
+        self.counters = Counter()
+
+    async def setup(self, client: httpx.AsyncClient) -> None:
+        if self.admin:
+            await login(client, self.bench.args.admin_email, self.bench.args.admin_password)
+        else:
+            self.email = bench_email(self.bench.user_index(self))
+            self.id_client = await self.bench.db.fetchval(
+                '''
+                SELECT c.id_client FROM clients AS c
+                JOIN contacts AS ct ON ct.id_contact = c.id_contact
+                WHERE ct.email = $1
+                ''',
+                self.email,
+            )
+            await login(client, self.email, BENCH_PASSWORD)
+
+    async def step(self, client: httpx.AsyncClient) -> httpx.Response:
+        raise NotImplementedError
+
+    async def reset(self) -> None:
+        pass
+
+
+class Login(Scenario):
+    name = 'login'
+    expected = (303,)
+
+    async def step(self, client):
+        return await client.post('/auth/login', data={'email': self.email, 'password': BENCH_PASSWORD})
+
+
+class Register(Scenario):
+    name = 'register'
+    expected = (303,)
+
+    async def setup(self, client):
+        self.count = 0
+
+    async def step(self, client):
+        self.count += 1
+        # Unique per run, worker and request, removed by seed.py --reset
+        suffix = f'{self.bench.run_id:04d}{self.worker:03d}{self.count:06d}'
+        return await client.post(
+            '/auth/register',
+            data={
+                'email': f'reg{suffix}@{BENCH_DOMAIN}',
+                'phone_number': f'+9{suffix}',
+                'birth_date': '1990-05-17',
+                'password': BENCH_PASSWORD,
+                'password_confirm': BENCH_PASSWORD,
+                'name': 'Bench',
+                'surname': 'Register',
+                'sex': 'male',
+            },
+        )
+
+
+class Dashboard(Scenario):
+    name = 'user_dashboard'
+
+    async def step(self, client):
+        return await client.get('/user/dashboard')
+
+
+class Buy(Scenario):
+    name = 'buy'
+    expected = (303,)
+
+    async def setup(self, client):
+        await super().setup(client)
+        self.type_id, self.gym_id = await self.bench.db.fetchrow(
+            'SELECT (SELECT min(id_membership_type) FROM membership_types), (SELECT min(id_gym) FROM gyms)'
+        )
+        await self.reset()
+
+    async def step(self, client):
+        return await client.post(
+            '/user/membership/buy',
+            data={'membership_type_id': self.type_id, 'gym_id': self.gym_id},
+        )
+
+    async def reset(self):
+        # Plain deletes with the triggers on: disabling them locks the tables
+        # ACCESS EXCLUSIVE, and the purchases being measured would queue
+        async with self.bench.db.acquire() as conn, conn.transaction():
+            await conn.execute(
+                '''
+                DELETE FROM payments WHERE id_membership IN (
+                    SELECT id_membership FROM memberships
+                    WHERE id_client = $1 AND membership_status = 'Active'
+                )
+                ''',
+                self.id_client,
+            )
+            await conn.execute(
+                "DELETE FROM memberships WHERE id_client = $1 AND membership_status = 'Active'",
+                self.id_client,
+            )
+
+
+class GroupRegister(Scenario):
+    name = 'group_register'
+    expected = (303,)
+
+    async def setup(self, client):
+        await super().setup(client)
+        self.group_ids = [
+            row[0] for row in await self.bench.db.fetch('SELECT id_group FROM groups ORDER BY id_group')
+        ]
+        await self.reset()
+
+    async def step(self, client):
+        return await client.post('/user/groups/register', data={'group_id': random.choice(self.group_ids)})
+
+    async def reset(self):
+        await self.bench.db.execute('DELETE FROM registered WHERE id_client = $1', self.id_client)
+
+
+class AdminSearch(Scenario):
+    name = 'admin_search'
+    admin = True
+
+    async def step(self, client):
+        surname = random.choice(self.bench.surnames)
+        return await client.get('/admin/dashboard', params={'q': surname[:random.randint(3, len(surname))]})
+
+
+class ClientDetail(Scenario):
+    name = 'client_detail'
+    admin = True
+
+    async def step(self, client):
+        low, high = self.bench.client_ids
+        return await client.get(f'/admin/clients/{random.randint(low, high)}')
+
+
+class Export(Scenario):
+    # Streams the whole payments dataset, millions of rows with the
+    # default seed
+    admin = True
+    format = ''
+    max_workers = 2
+
+    async def setup(self, client):
+        await super().setup(client)
+        self.rows = await self.bench.db.fetchval('SELECT count(*) FROM payments')
+
+    async def step(self, client):
+        size = 0
+        # Uncompressed, the export is measured rather than gzip
+        async with client.stream(
+            'GET',
+            '/admin/export/payments',
+            params={'format': self.format},
+            headers={'accept-encoding': 'identity'},
+        ) as response:
+            async for chunk in response.aiter_raw():
+                size += len(chunk)
+
+        if response.status_code == 200:
+            self.counters['bytes'] += size
+            self.counters['rows'] += self.rows
+        return response
+
+
+class ExportCsv(Export):
+    name = 'export_csv'
+    format = 'csv'
+
+
+class ExportParquet(Export):
+    name = 'export_parquet'
+    format = 'parquet'
+
+
+SCENARIOS = {
+    s.name: s
+    for s in (
+        Login, Register, Dashboard, Buy, GroupRegister, AdminSearch, ClientDetail, ExportCsv, ExportParquet,
+    )
+}
+
+
+def rss_bytes(pid: int) -> int:
+    # The process and its direct children, i.e. the uvicorn workers
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        return 0
+
+    total = 0
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            pass
+    return total
+
+
+async def sample_peak_rss(pid: int, peak: list[int]) -> None:
+    while True:
+        peak[0] = max(peak[0], rss_bytes(pid))
+        await asyncio.sleep(RSS_INTERVAL)
+
+
+async def login(client: httpx.AsyncClient, email: str, password: str) -> None:
+    response = await client.post('/auth/login', data={'email': email, 'password': password})
+    if response.status_code != 303 or 'invalid' in response.headers.get('location', ''):
+        raise SystemExit(f"login as {email} failed, is the database seeded?")
+
+
+class Bench:
+    def __init__(self, args, db: asyncpg.Pool):
+        self.args = args
+        self.db = db
+        self.run_id = random.randint(0, 9999)
+        self.client_ids = (0, 0)
+        self.surnames: list[str] = []
+
+    async def prepare(self) -> None:
+        self.client_ids = tuple(
+            await self.db.fetchrow(
+                f'''
+                SELECT min(c.id_client), max(c.id_client) FROM clients AS c
+                JOIN contacts AS ct ON ct.id_contact = c.id_contact
+                WHERE ct.email LIKE 'bench%@{BENCH_DOMAIN}'
+                '''
+            )
+        )
+        if self.client_ids[0] is None:
+            raise SystemExit("no benchmark clients, run benchmarks/seed.py first")
+        self.surnames = [
+            row[0] for row in await self.db.fetch('SELECT DISTINCT surname FROM clients LIMIT 500')
+        ]
+
+    def user_index(self, scenario: Scenario) -> int:
+        # Every scenario and worker logs in as its own client
+        position = list(SCENARIOS).index(scenario.name)
+        return 1 + position * self.args.concurrency + scenario.worker
+
+    async def run_scenario(self, scenario_class) -> dict:
+        latencies: list[float] = []
+        errors = 0
+
+        async def worker(scenario: Scenario, client: httpx.AsyncClient, deadline: float) -> None:
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await scenario.step(client)
+                    ok = response.status_code in scenario.expected
+                except httpx.HTTPError:
+                    ok = False
+                elapsed = time.perf_counter() - start
+
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+                await scenario.reset()
+
+        concurrency = min(self.args.concurrency, scenario_class.max_workers or self.args.concurrency)
+        async with AsyncExitStack() as stack:
+            clients = [
+                await stack.enter_async_context(httpx.AsyncClient(base_url=self.args.base_url, timeout=30))
+                for _ in range(concurrency)
+            ]
+            scenarios = [scenario_class(self, i) for i in range(concurrency)]
+            # Logins during setup are not part of the measurement
+            await asyncio.gather(*(s.setup(c) for s, c in zip(scenarios, clients)))
+
+            peak_rss = [0]
+            sampler = None
+            if self.args.app_pid:
+                sampler = asyncio.create_task(sample_peak_rss(self.args.app_pid, peak_rss))
+
+            started = time.perf_counter()
+            deadline = started + self.args.duration
+            try:
+                await asyncio.gather(*(worker(s, c, deadline) for s, c in zip(scenarios, clients)))
+            finally:
+                if sampler:
+                    sampler.cancel()
+            seconds = time.perf_counter() - started
+
+        summary = summarize(latencies, errors, seconds)
+        moved = sum((s.counters for s in scenarios), Counter())
+        if moved:
+            summary['rows_per_s'] = round(moved['rows'] / seconds)
+            summary['mb_per_s'] = round(moved['bytes'] / seconds / 1e6, 2)
+        if sampler:
+            summary['peak_rss_mb'] = round(peak_rss[0] / 2**20, 1)
+        return summary
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest rank
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(p / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict:
+    values = sorted(latencies)
+    summary = {
+        'requests': len(values),
+        'errors': errors,
+        'throughput': round(len(values) / seconds, 2) if seconds else 0.0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+        'max_ms': round(values[-1] * 1000, 2) if values else 0.0,
+    }
+    for p in PERCENTILES:
+        summary[f'p{p}_ms'] = round(percentile(values, p) * 1000, 2)
+    return summary
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(results: dict) -> None:
+    columns = ['requests', 'errors', 'throughput'] + [f'p{p}_ms' for p in PERCENTILES] + ['max_ms']
+    columns += [c for c in EXTRA_COLUMNS if any(c in summary for summary in results.values())]
+    print(f"{'scenario':<16}" + ''.join(f'{c:>12}' for c in columns))
+    for name, summary in results.items():
+        print(f'{name:<16}' + ''.join(f"{summary.get(c, '-'):>12}" for c in columns))
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    print(f"\ncompared with {baseline['commit']} ({baseline['date']})")
+    regressed = False
+    for name, summary in results.items():
+        before = baseline['scenarios'].get(name)
+        if before is None or not before['p95_ms'] or not before['throughput']:
+            continue
+        p95 = (summary['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+        throughput = (summary['throughput'] - before['throughput']) / before['throughput'] * 100
+        flag = p95 > tolerance or -throughput > tolerance
+        regressed = regressed or flag
+        print(
+            f"{name:<16} p95 {before['p95_ms']:>9} -> {summary['p95_ms']:<9} ({p95:+.1f}%)"
+            f"  throughput {before['throughput']:>9} -> {summary['throughput']:<9} ({throughput:+.1f}%)"
+            + ('  REGRESSION' if flag else '')
+        )
+    return not regressed
+
+
+async def main(args) -> int:
+    names = list(SCENARIOS) if args.scenario == ['all'] else args.scenario
+    db = await asyncpg.create_pool(args.dsn, min_size=1, max_size=4)
+    try:
+        bench = Bench(args, db)
+        await bench.prepare()
+
+        results = {}
+        for name in names:
+            workers = min(args.concurrency, SCENARIOS[name].max_workers or args.concurrency)
+            print(f"running {name} ({workers} workers, {args.duration}s)")
+            results[name] = await bench.run_scenario(SCENARIOS[name])
+    finally:
+        await db.close()
+
+    print()
+    print_table(results)
+
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = args.save if isinstance(args.save, str) else os.path.join(BASELINES, f'{git_commit()}.json')
+        with open(path, 'w') as f:
+            json.dump(
+                {
+                    'commit': git_commit(),
+                    'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'base_url': args.base_url,
+                    'concurrency': args.concurrency,
+                    'duration': args.duration,
+                    'scenarios': results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"\nsaved {path}")
+
+    if args.compare and not compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the running app")
+    parser.add_argument('--base-url', default='http://localhost:8000')
+    parser.add_argument('--dsn', default=default_dsn())
+    parser.add_argument('--scenario', nargs='+', default=['all'], choices=['all', *SCENARIOS])
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=20, help="seconds per scenario")
+    parser.add_argument('--admin-email', default='admin@gym.local')
+    parser.add_argument('--admin-password', default='admin123')
+    parser.add_argument(
+        '--save', nargs='?', const=True, default=False,
+        help="store the results as a baseline, by default baselines/<commit>.json",
+    )
+    parser.add_argument('--compare', help="baseline to compare with, exits 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=20, help="allowed regression in percent")
+    parser.add_argument('--app-pid', type=int, help="sample the peak RSS of this process and its workers")
+    raise SystemExit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,206 @@
+# Seeds the database with benchmark volumes. Start the app once first, it
+# applies the migrations the benchmark relies on.
+#
+#   python benchmarks/seed.py --clients 300000 --history 7
+import argparse
+import asyncio
+import time
+
+import asyncpg
+from argon2 import PasswordHasher
+
+from common import BENCH_DOMAIN, BENCH_PASSWORD, BULK_TABLES, default_dsn, triggers_disabled
+
+BATCH_SIZE = 20_000
+GROUPS = 40
+GROUP_CAPACITY = 100
+
+FIRST_NAMES = [
+    'Jan', 'Petr', 'Jiri', 'Pavel', 'Tomas', 'Martin', 'Jakub', 'Lukas', 'Ondrej', 'David',
+    'Eva', 'Jana', 'Hana', 'Lucie', 'Petra', 'Tereza', 'Katerina', 'Veronika', 'Anna', 'Marie',
+]
+SURNAMES = [
+    'Novak', 'Svoboda', 'Novotny', 'Dvorak', 'Cerny', 'Prochazka', 'Kucera', 'Vesely',
+    'Horak', 'Nemec', 'Marek', 'Pospisil', 'Pokorny', 'Hajek', 'Kral', 'Jelinek',
+    'Ruzicka', 'Benes', 'Fiala', 'Sedlacek', 'Dolezal', 'Zeman', 'Kolar', 'Navratil',
+]
+
+# One statement per batch: contacts, clients, passwords, membership history
+# and one payment per membership. The newest membership of 60 % of the
+# clients is active and halfway through its term, so the expiry worker
+# leaves it alone.
+SEED_BATCH = '''
+WITH new_contacts AS (
+    INSERT INTO contacts (phone_number, email)
+    SELECT '+999' || lpad(i::text, 9, '0'), 'bench' || i || '@' || $3
+    FROM generate_series($1::int, $2::int) AS i
+    RETURNING id_contact, split_part(split_part(email, '@', 1), 'bench', 2)::int AS i
+),
+new_clients AS (
+    INSERT INTO clients (name, surname, birthday, sex, discount, id_contact)
+    SELECT
+        ($4::text[])[1 + i % cardinality($4::text[])],
+        ($5::text[])[1 + (i / 7) % cardinality($5::text[])] || (i % 97)::text,
+        DATE '1960-01-01' + (i % 15000),
+        CASE WHEN i % 2 = 0 THEN 'M' ELSE 'F' END,
+        (i % 4) * 5,
+        id_contact
+    FROM new_contacts
+    RETURNING id_client
+),
+new_passwords AS (
+    INSERT INTO passwords (id_client, password_hash)
+    SELECT id_client, $6 FROM new_clients
+),
+types AS (
+    SELECT array_agg(id_membership_type ORDER BY id_membership_type) AS ids FROM membership_types
+),
+gyms_ AS (
+    SELECT array_agg(id_gym ORDER BY id_gym) AS ids FROM gyms
+),
+new_memberships AS (
+    INSERT INTO memberships (
+        id_client, id_membership_type, id_gym, membership_status, membership_start, membership_stop
+    )
+    SELECT
+        c.id_client,
+        types.ids[1 + (c.id_client + k) % cardinality(types.ids)],
+        gyms_.ids[1 + c.id_client % cardinality(gyms_.ids)],
+        CASE
+            WHEN k = $7 AND c.id_client % 10 < 6 THEN 'Active'
+            ELSE 'Cancelled'
+        END::membership_statuses,
+        current_date - ($7 - k) * 30 - 15,
+        current_date - ($7 - k) * 30 + 15
+    FROM new_clients AS c
+    CROSS JOIN generate_series(1, $7::int) AS k
+    CROSS JOIN types
+    CROSS JOIN gyms_
+    RETURNING id_membership, id_membership_type, membership_start
+)
+INSERT INTO payments (
+    payment_status, amount, currency, date_creation, date_payment, date_due_date, id_membership
+)
+SELECT
+    'Successful',
+    t.price,
+    t.currency,
+    m.membership_start,
+    m.membership_start + INTERVAL '1 hour',
+    m.membership_start + INTERVAL '14 days',
+    m.id_membership
+FROM new_memberships AS m
+JOIN membership_types AS t ON t.id_membership_type = m.id_membership_type
+'''
+
+RESET = f'''
+CREATE TEMP TABLE bench_clients ON COMMIT DROP AS
+    SELECT c.id_client, c.id_contact
+    FROM clients AS c
+    JOIN contacts AS ct ON ct.id_contact = c.id_contact
+    WHERE ct.email LIKE '%@{BENCH_DOMAIN}';
+
+DELETE FROM payments WHERE id_membership IN (
+    SELECT id_membership FROM memberships WHERE id_client IN (SELECT id_client FROM bench_clients)
+);
+DELETE FROM memberships WHERE id_client IN (SELECT id_client FROM bench_clients);
+DELETE FROM registered WHERE id_client IN (SELECT id_client FROM bench_clients);
+DELETE FROM passwords WHERE id_client IN (SELECT id_client FROM bench_clients);
+DELETE FROM clients WHERE id_client IN (SELECT id_client FROM bench_clients);
+DELETE FROM contacts WHERE id_contact IN (SELECT id_contact FROM bench_clients);
+'''
+
+
+async def seed_groups(conn: asyncpg.Connection) -> None:
+    trainer_email = f'trainer@{BENCH_DOMAIN}'
+    if await conn.fetchval('SELECT 1 FROM contacts WHERE email = $1', trainer_email):
+        return
+
+    async with conn.transaction():
+        id_contact = await conn.fetchval(
+            "INSERT INTO contacts (phone_number, email) VALUES ('+998000000001', $1) RETURNING id_contact",
+            trainer_email,
+        )
+        id_trainer = await conn.fetchval(
+            '''
+            INSERT INTO trainers (name, surname, birthday, sex, id_contact)
+            VALUES ('Bench', 'Trainer', DATE '1990-01-01', 'M', $1)
+            RETURNING id_trainer
+            ''',
+            id_contact,
+        )
+        await conn.execute(
+            '''
+            INSERT INTO groups (id_trainer, id_gym, max_capacity, time_start, time_finish, week_day)
+            SELECT
+                $1,
+                (SELECT min(id_gym) FROM gyms),
+                $2,
+                TIME '07:00' + (g % 12) * INTERVAL '1 hour',
+                TIME '08:00' + (g % 12) * INTERVAL '1 hour',
+                (enum_range(NULL::week_day))[1 + g % 7]
+            FROM generate_series(1, $3) AS g
+            ''',
+            id_trainer, GROUP_CAPACITY, GROUPS,
+        )
+
+
+async def main(args) -> None:
+    conn = await asyncpg.connect(args.dsn)
+    try:
+        if not await conn.fetchval("SELECT to_regclass('schema_migrations') IS NOT NULL"):
+            raise SystemExit("schema_migrations is missing, start the app once to apply the migrations")
+        if not await conn.fetchval('SELECT 1 FROM membership_types LIMIT 1'):
+            raise SystemExit("no membership types, start the app once to seed the reference data")
+
+        if args.reset:
+            async with conn.transaction(), triggers_disabled(conn, (*BULK_TABLES, 'registered')):
+                await conn.execute(RESET)
+            print("removed previous benchmark data")
+
+        await seed_groups(conn)
+
+        existing = await conn.fetchval(
+            '''
+            SELECT count(*) FROM clients AS c
+            JOIN contacts AS ct ON ct.id_contact = c.id_contact
+            WHERE ct.email LIKE 'bench%@' || $1
+            ''',
+            BENCH_DOMAIN,
+        )
+        if existing >= args.clients:
+            print(f"{existing} benchmark clients present, nothing to do (use --reset to reseed)")
+            return
+        if existing:
+            raise SystemExit(f"{existing} benchmark clients from an earlier run, use --reset")
+
+        password_hash = PasswordHasher().hash(BENCH_PASSWORD)
+        started = time.perf_counter()
+
+        for first in range(1, args.clients + 1, BATCH_SIZE):
+            last = min(first + BATCH_SIZE - 1, args.clients)
+            async with conn.transaction(), triggers_disabled(conn):
+                await conn.execute(
+                    SEED_BATCH,
+                    first, last, BENCH_DOMAIN, FIRST_NAMES, SURNAMES, password_hash, args.history,
+                )
+            print(f"clients {last}/{args.clients} ({time.perf_counter() - started:.0f}s)")
+
+        # Seeded history predates the analytics watermark, rebuild it all
+        await conn.execute("UPDATE rollup_watermarks SET open_from = NULL WHERE name = 'daily'")
+        await conn.execute('ANALYZE')
+        print(
+            f"seeded {args.clients} clients, {args.clients * args.history} memberships and payments "
+            f"in {time.perf_counter() - started:.0f}s"
+        )
+    finally:
+        await conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed benchmark data")
+    parser.add_argument('--dsn', default=default_dsn())
+    parser.add_argument('--clients', type=int, default=300_000)
+    parser.add_argument('--history', type=int, default=7, help="memberships (and payments) per client")
+    parser.add_argument('--reset', action='store_true', help="remove earlier benchmark data first")
+    asyncio.run(main(parser.parse_args()))
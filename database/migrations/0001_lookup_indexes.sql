@@ -0,0 +1,67 @@
+-- Indexes and constraints for the hot lookup columns
+
+-- login_post filters by email, register_post by phone_number OR email.
+-- Duplicate contacts may belong to different clients or trainers and are
+-- not merged automatically, the migration stops and lists them instead.
+DO $$
+DECLARE
+    v_duplicates TEXT;
+BEGIN
+    SELECT string_agg(value, ', ') INTO v_duplicates
+    FROM (
+        SELECT 'email ' || email AS value
+        FROM contacts GROUP BY email HAVING count(*) > 1
+        UNION ALL
+        SELECT 'phone ' || phone_number
+        FROM contacts GROUP BY phone_number HAVING count(*) > 1
+    ) AS d;
+
+    IF v_duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'contacts share an email or phone number, merge them before migrating: %', v_duplicates;
+    END IF;
+END;
+$$;
+
+CREATE UNIQUE INDEX contacts_email_key ON contacts (email);
+CREATE UNIQUE INDEX contacts_phone_number_key ON contacts (phone_number);
+
+-- clients are joined to contacts on every login and admin search
+CREATE INDEX clients_id_contact_idx ON clients (id_contact);
+
+-- One registration per client and group, the leading id_group also
+-- serves the capacity count in user_group_register_post
+DELETE FROM registered r
+USING registered d
+WHERE r.id_group = d.id_group
+  AND r.id_client = d.id_client
+  AND r.id_registered > d.id_registered;
+
+CREATE UNIQUE INDEX registered_group_client_key ON registered (id_group, id_client);
+CREATE INDEX registered_id_client_idx ON registered (id_client);
+
+-- At most one active membership per client, older duplicates left by
+-- concurrent purchases are cancelled first
+UPDATE memberships m
+SET membership_status = 'Cancelled'
+WHERE m.membership_status = 'Active'
+  AND EXISTS (
+      SELECT 1
+      FROM memberships n
+      WHERE n.id_client = m.id_client
+        AND n.membership_status = 'Active'
+        AND n.id_membership > m.id_membership
+  );
+
+CREATE UNIQUE INDEX memberships_one_active_key
+    ON memberships (id_client)
+    WHERE membership_status = 'Active';
+
+-- Membership history per client, newest first
+CREATE INDEX memberships_client_start_idx ON memberships (id_client, membership_start);
+
+-- Foreign keys checked when gyms or membership types are deleted
+CREATE INDEX memberships_id_gym_idx ON memberships (id_gym);
+CREATE INDEX memberships_id_membership_type_idx ON memberships (id_membership_type);
+CREATE INDEX groups_id_gym_idx ON groups (id_gym);
+
+CREATE INDEX payments_id_membership_idx ON payments (id_membership);
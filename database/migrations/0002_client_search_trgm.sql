@@ -0,0 +1,12 @@
+-- Trigram indexes for the admin client search, they serve ILIKE '%...%'
+-- and similarity() ranking on the joined clients/contacts tables
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX clients_name_trgm_idx ON clients USING gin (name gin_trgm_ops);
+CREATE INDEX clients_surname_trgm_idx ON clients USING gin (surname gin_trgm_ops);
+CREATE INDEX contacts_phone_number_trgm_idx ON contacts USING gin (phone_number gin_trgm_ops);
+CREATE INDEX contacts_email_trgm_idx ON contacts USING gin (email gin_trgm_ops);
+
+-- Keyset pagination order of the filtered listing
+CREATE INDEX clients_surname_name_id_idx ON clients (surname, name, id_client);
@@ -0,0 +1,50 @@
+-- Books a client into a group class in one round trip. The group row
+-- lock serialises concurrent bookings of the same class, so the
+-- capacity check cannot be overtaken; registered_group_client_key
+-- rejects duplicates.
+--
+-- Returns 'booked', 'duplicate', 'full' or 'missing'.
+
+CREATE OR REPLACE FUNCTION book_group(p_id_group INT, p_id_client INT)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_capacity INT;
+    v_taken INT;
+BEGIN
+    SELECT max_capacity INTO v_capacity
+    FROM groups
+    WHERE id_group = p_id_group
+    FOR NO KEY UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN 'missing';
+    END IF;
+
+    IF EXISTS (
+        SELECT 1 FROM registered
+        WHERE id_group = p_id_group AND id_client = p_id_client
+    ) THEN
+        RETURN 'duplicate';
+    END IF;
+
+    SELECT count(*) INTO v_taken
+    FROM registered
+    WHERE id_group = p_id_group;
+
+    IF v_taken >= v_capacity THEN
+        RETURN 'full';
+    END IF;
+
+    INSERT INTO registered (id_group, id_client)
+    VALUES (p_id_group, p_id_client)
+    ON CONFLICT (id_group, id_client) DO NOTHING;
+
+    IF NOT FOUND THEN
+        RETURN 'duplicate';
+    END IF;
+
+    RETURN 'booked';
+END;
+$$;
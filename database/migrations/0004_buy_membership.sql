@@ -0,0 +1,77 @@
+-- Validates and records a membership purchase in one round trip. The
+-- membership and its payment are inserted together, and
+-- memberships_one_active_key turns a concurrent second purchase into
+-- 'has_active' instead of a second active membership.
+--
+-- Returns 'bought', 'has_active' or 'missing'.
+
+CREATE OR REPLACE FUNCTION buy_membership(
+    p_id_client INT,
+    p_id_membership_type INT,
+    p_id_gym INT
+)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_type membership_types%ROWTYPE;
+    v_discount FLOAT;
+    v_id_membership INT;
+BEGIN
+    SELECT * INTO v_type
+    FROM membership_types
+    WHERE id_membership_type = p_id_membership_type;
+
+    IF NOT FOUND OR NOT EXISTS (SELECT 1 FROM gyms WHERE id_gym = p_id_gym) THEN
+        RETURN 'missing';
+    END IF;
+
+    SELECT discount INTO v_discount
+    FROM clients
+    WHERE id_client = p_id_client;
+
+    INSERT INTO memberships (
+        id_client,
+        id_membership_type,
+        id_gym,
+        membership_status,
+        membership_start,
+        membership_stop
+    )
+    VALUES (
+        p_id_client,
+        p_id_membership_type,
+        p_id_gym,
+        'Active',
+        CURRENT_DATE,
+        CURRENT_DATE + v_type.duration
+    )
+    ON CONFLICT (id_client) WHERE membership_status = 'Active' DO NOTHING
+    RETURNING id_membership INTO v_id_membership;
+
+    IF v_id_membership IS NULL THEN
+        RETURN 'has_active';
+    END IF;
+
+    INSERT INTO payments (
+        id_membership,
+        payment_status,
+        amount,
+        currency,
+        date_creation,
+        date_payment,
+        date_due_date
+    )
+    VALUES (
+        v_id_membership,
+        'Successful',
+        v_type.price * (1 - COALESCE(v_discount, 0) / 100),
+        v_type.currency,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP
+    );
+
+    RETURN 'bought';
+END;
+$$;
@@ -0,0 +1,12 @@
+-- Outcomes of state-changing POSTs by idempotency key. Rows with a NULL
+-- status are still being processed; expired rows are swept by the app.
+
+CREATE TABLE idempotency_keys (
+    key TEXT PRIMARY KEY,
+    status INT,
+    headers TEXT,
+    body BYTEA,
+    created_at TIMESTAMP NOT NULL DEFAULT LOCALTIMESTAMP
+);
+
+CREATE INDEX idempotency_keys_created_at_idx ON idempotency_keys (created_at);
@@ -0,0 +1,84 @@
+-- MONEY is locale dependent and awkward to compute with, amounts are
+-- stored as integer minor units (cents, halere) instead. The money to
+-- numeric cast does not depend on lc_monetary formatting.
+
+ALTER TABLE membership_types
+    ALTER COLUMN price TYPE BIGINT USING round(price::numeric * 100)::bigint;
+
+ALTER TABLE payments
+    ALTER COLUMN amount TYPE BIGINT USING round(amount::numeric * 100)::bigint;
+
+ALTER TABLE membership_types ADD CONSTRAINT membership_types_price_check CHECK (price >= 0);
+ALTER TABLE payments ADD CONSTRAINT payments_amount_check CHECK (amount >= 0);
+
+-- Same as 0004 apart from rounding the discounted price to minor units
+CREATE OR REPLACE FUNCTION buy_membership(
+    p_id_client INT,
+    p_id_membership_type INT,
+    p_id_gym INT
+)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_type membership_types%ROWTYPE;
+    v_discount FLOAT;
+    v_id_membership INT;
+BEGIN
+    SELECT * INTO v_type
+    FROM membership_types
+    WHERE id_membership_type = p_id_membership_type;
+
+    IF NOT FOUND OR NOT EXISTS (SELECT 1 FROM gyms WHERE id_gym = p_id_gym) THEN
+        RETURN 'missing';
+    END IF;
+
+    SELECT discount INTO v_discount
+    FROM clients
+    WHERE id_client = p_id_client;
+
+    INSERT INTO memberships (
+        id_client,
+        id_membership_type,
+        id_gym,
+        membership_status,
+        membership_start,
+        membership_stop
+    )
+    VALUES (
+        p_id_client,
+        p_id_membership_type,
+        p_id_gym,
+        'Active',
+        CURRENT_DATE,
+        CURRENT_DATE + v_type.duration
+    )
+    ON CONFLICT (id_client) WHERE membership_status = 'Active' DO NOTHING
+    RETURNING id_membership INTO v_id_membership;
+
+    IF v_id_membership IS NULL THEN
+        RETURN 'has_active';
+    END IF;
+
+    INSERT INTO payments (
+        id_membership,
+        payment_status,
+        amount,
+        currency,
+        date_creation,
+        date_payment,
+        date_due_date
+    )
+    VALUES (
+        v_id_membership,
+        'Successful',
+        round(v_type.price * (1 - COALESCE(v_discount, 0)::numeric / 100))::bigint,
+        v_type.currency,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP
+    );
+
+    RETURN 'bought';
+END;
+$$;
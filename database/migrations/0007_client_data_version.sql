@@ -0,0 +1,65 @@
+-- Per-client counter behind the user dashboard ETag. Any change to the
+-- data shown on the dashboard bumps it, so a conditional request is
+-- answered after reading this one column instead of loading the page.
+
+ALTER TABLE clients ADD COLUMN IF NOT EXISTS data_version BIGINT NOT NULL DEFAULT 0;
+
+-- Direct updates of the client row
+CREATE OR REPLACE FUNCTION touch_client_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF NEW.data_version = OLD.data_version THEN
+        NEW.data_version := OLD.data_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS clients_data_version ON clients;
+CREATE TRIGGER clients_data_version
+    BEFORE UPDATE ON clients
+    FOR EACH ROW EXECUTE FUNCTION touch_client_data_version();
+
+-- Rows owned by a client through id_client
+CREATE OR REPLACE FUNCTION bump_client_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE clients SET data_version = data_version + 1 WHERE id_client = OLD.id_client;
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.id_client IS DISTINCT FROM OLD.id_client) THEN
+        UPDATE clients SET data_version = data_version + 1 WHERE id_client = NEW.id_client;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS memberships_client_data_version ON memberships;
+CREATE TRIGGER memberships_client_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON memberships
+    FOR EACH ROW EXECUTE FUNCTION bump_client_data_version();
+
+DROP TRIGGER IF EXISTS registered_client_data_version ON registered;
+CREATE TRIGGER registered_client_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON registered
+    FOR EACH ROW EXECUTE FUNCTION bump_client_data_version();
+
+-- The dashboard shows the client's contact
+CREATE OR REPLACE FUNCTION bump_contact_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE clients SET data_version = data_version + 1 WHERE id_contact = NEW.id_contact;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS contacts_client_data_version ON contacts;
+CREATE TRIGGER contacts_client_data_version
+    AFTER UPDATE ON contacts
+    FOR EACH ROW EXECUTE FUNCTION bump_contact_data_version();
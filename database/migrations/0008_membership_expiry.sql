@@ -0,0 +1,90 @@
+-- Memberships run out on membership_stop. The expiry worker (expiry.py)
+-- moves them from 'Active' to 'Expired' in batches, so "is there an
+-- active membership" stays a lookup on memberships_one_active_key.
+
+ALTER TYPE membership_statuses ADD VALUE IF NOT EXISTS 'Expired';
+
+-- Drives the expiry worker, only the active rows are indexed
+CREATE INDEX memberships_active_stop_idx
+    ON memberships (membership_stop)
+    WHERE membership_status = 'Active';
+
+-- buy_membership from 0006, expiring the client's own overdue membership
+-- before checking for an active one
+CREATE OR REPLACE FUNCTION buy_membership(
+    p_id_client INT,
+    p_id_membership_type INT,
+    p_id_gym INT
+)
+RETURNS TEXT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_type membership_types%ROWTYPE;
+    v_discount FLOAT;
+    v_id_membership INT;
+BEGIN
+    SELECT * INTO v_type
+    FROM membership_types
+    WHERE id_membership_type = p_id_membership_type;
+
+    IF NOT FOUND OR NOT EXISTS (SELECT 1 FROM gyms WHERE id_gym = p_id_gym) THEN
+        RETURN 'missing';
+    END IF;
+
+    -- The expiry worker may not have run since the membership ran out
+    UPDATE memberships
+    SET membership_status = 'Expired'
+    WHERE id_client = p_id_client
+      AND membership_status = 'Active'
+      AND membership_stop <= CURRENT_DATE;
+
+    SELECT discount INTO v_discount
+    FROM clients
+    WHERE id_client = p_id_client;
+
+    INSERT INTO memberships (
+        id_client,
+        id_membership_type,
+        id_gym,
+        membership_status,
+        membership_start,
+        membership_stop
+    )
+    VALUES (
+        p_id_client,
+        p_id_membership_type,
+        p_id_gym,
+        'Active',
+        CURRENT_DATE,
+        CURRENT_DATE + v_type.duration
+    )
+    ON CONFLICT (id_client) WHERE membership_status = 'Active' DO NOTHING
+    RETURNING id_membership INTO v_id_membership;
+
+    IF v_id_membership IS NULL THEN
+        RETURN 'has_active';
+    END IF;
+
+    INSERT INTO payments (
+        id_membership,
+        payment_status,
+        amount,
+        currency,
+        date_creation,
+        date_payment,
+        date_due_date
+    )
+    VALUES (
+        v_id_membership,
+        'Successful',
+        round(v_type.price * (1 - COALESCE(v_discount, 0)::numeric / 100))::bigint,
+        v_type.currency,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP,
+        LOCALTIMESTAMP
+    );
+
+    RETURN 'bought';
+END;
+$$;
@@ -0,0 +1,103 @@
+-- Aggregates behind the admin analytics page, refreshed by analytics.py.
+--
+-- Payments and memberships are only ever added for the current day, so
+-- the daily rollups are rebuilt from the first day that can still change
+-- (the watermark) instead of from the whole history.
+
+CREATE TABLE revenue_daily (
+    day DATE NOT NULL,
+    id_gym INT NOT NULL,
+    id_membership_type INT NOT NULL,
+    currency PAYMENT_CURRENCY NOT NULL,
+    payments BIGINT NOT NULL,
+    -- Minor units, like payments.amount
+    amount BIGINT NOT NULL,
+    PRIMARY KEY (day, id_gym, id_membership_type, currency)
+);
+
+CREATE TABLE memberships_daily (
+    day DATE NOT NULL,
+    id_gym INT NOT NULL,
+    id_membership_type INT NOT NULL,
+    started BIGINT NOT NULL,
+    PRIMARY KEY (day, id_gym, id_membership_type)
+);
+
+-- Days before open_from are final, NULL rebuilds the whole history
+CREATE TABLE rollup_watermarks (
+    name TEXT PRIMARY KEY,
+    open_from DATE,
+    refreshed_at TIMESTAMP
+);
+
+INSERT INTO rollup_watermarks (name) VALUES ('daily');
+
+-- Only the open days are read on each refresh
+CREATE INDEX payments_date_payment_idx ON payments (date_payment);
+CREATE INDEX memberships_membership_start_idx ON memberships (membership_start);
+
+-- Current membership counts. Statuses change in place (expiry, cancel),
+-- so this is rebuilt rather than rolled up.
+CREATE MATERIALIZED VIEW membership_status_counts AS
+SELECT
+    id_gym,
+    id_membership_type,
+    membership_status,
+    count(*) AS members
+FROM memberships
+GROUP BY id_gym, id_membership_type, membership_status;
+
+-- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX membership_status_counts_key
+    ON membership_status_counts (id_gym, id_membership_type, membership_status);
+
+-- Rebuilds the open days of the daily rollups. Yesterday stays open, so
+-- a transaction that started before midnight is still counted.
+CREATE OR REPLACE FUNCTION refresh_daily_rollups()
+RETURNS INT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_from DATE;
+    v_rows INT;
+BEGIN
+    -- Serialises concurrent refreshes
+    SELECT open_from INTO v_from
+    FROM rollup_watermarks
+    WHERE name = 'daily'
+    FOR UPDATE;
+
+    IF v_from IS NULL THEN
+        v_from := COALESCE((SELECT min(date_payment)::date FROM payments), CURRENT_DATE);
+    END IF;
+
+    DELETE FROM revenue_daily WHERE day >= v_from;
+    INSERT INTO revenue_daily (day, id_gym, id_membership_type, currency, payments, amount)
+    SELECT
+        p.date_payment::date,
+        m.id_gym,
+        m.id_membership_type,
+        p.currency,
+        count(*),
+        sum(p.amount)
+    FROM payments AS p
+    JOIN memberships AS m ON m.id_membership = p.id_membership
+    WHERE p.payment_status = 'Successful'
+      AND p.date_payment >= v_from
+    GROUP BY 1, 2, 3, 4;
+    GET DIAGNOSTICS v_rows = ROW_COUNT;
+
+    DELETE FROM memberships_daily WHERE day >= v_from;
+    INSERT INTO memberships_daily (day, id_gym, id_membership_type, started)
+    SELECT membership_start, id_gym, id_membership_type, count(*)
+    FROM memberships
+    WHERE membership_start >= v_from
+    GROUP BY 1, 2, 3;
+
+    UPDATE rollup_watermarks
+    SET open_from = CURRENT_DATE - 1, refreshed_at = LOCALTIMESTAMP
+    WHERE name = 'daily';
+
+    RETURN v_rows;
+END;
+$$;
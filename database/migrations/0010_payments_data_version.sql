@@ -0,0 +1,24 @@
+-- The user dashboard shows the latest payment of each membership, so
+-- payments bump the owning client's data_version like memberships do.
+
+CREATE OR REPLACE FUNCTION bump_payment_client_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        UPDATE clients SET data_version = data_version + 1
+        WHERE id_client = (SELECT id_client FROM memberships WHERE id_membership = OLD.id_membership);
+    END IF;
+    IF TG_OP = 'INSERT' OR (TG_OP = 'UPDATE' AND NEW.id_membership IS DISTINCT FROM OLD.id_membership) THEN
+        UPDATE clients SET data_version = data_version + 1
+        WHERE id_client = (SELECT id_client FROM memberships WHERE id_membership = NEW.id_membership);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS payments_client_data_version ON payments;
+CREATE TRIGGER payments_client_data_version
+    AFTER INSERT OR UPDATE OR DELETE ON payments
+    FOR EACH ROW EXECUTE FUNCTION bump_payment_client_data_version();
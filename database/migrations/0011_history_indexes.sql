@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Keyset pages of the membership and payment history. Built concurrently,
+-- both tables take writes from every purchase. A build that was
+-- interrupted leaves an invalid index; run_migrations drops and rebuilds
+-- it before the old index goes.
+
+-- Read backwards: newest memberships of a client, ties broken by id
+CREATE INDEX CONCURRENTLY IF NOT EXISTS memberships_client_history_idx
+    ON memberships (id_client, membership_start, id_membership);
+DROP INDEX CONCURRENTLY IF EXISTS memberships_client_start_idx;
+
+-- Latest payment per membership (DISTINCT ON) and the payment pages
+CREATE INDEX CONCURRENTLY IF NOT EXISTS payments_membership_paid_idx
+    ON payments (id_membership, date_payment, id_payment);
+DROP INDEX CONCURRENTLY IF EXISTS payments_id_membership_idx;
@@ -0,0 +1,38 @@
+-- Shared version of the reference data behind the per-worker caches
+-- (membership types, gyms, groups and their trainers). Any change bumps
+-- it and notifies the workers on commit, also for writes made outside
+-- the app, so a worker can tell whether its copy is current.
+
+CREATE TABLE reference_data_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL
+);
+
+INSERT INTO reference_data_version (version) VALUES (0);
+
+CREATE OR REPLACE FUNCTION bump_reference_data_version()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE reference_data_version SET version = version + 1;
+    PERFORM pg_notify('reference_data', '');
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER membership_types_reference_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON membership_types
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reference_data_version();
+
+CREATE TRIGGER gyms_reference_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON gyms
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reference_data_version();
+
+CREATE TRIGGER groups_reference_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON groups
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reference_data_version();
+
+CREATE TRIGGER trainers_reference_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON trainers
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_reference_data_version();
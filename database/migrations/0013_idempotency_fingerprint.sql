@@ -0,0 +1,5 @@
+-- Hash of the request body the key was first used with, a reuse of the
+-- key with another body is rejected instead of replaying the outcome.
+-- Rows claimed before this migration have none and match any body.
+
+ALTER TABLE idempotency_keys ADD COLUMN fingerprint TEXT;
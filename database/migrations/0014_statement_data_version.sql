@@ -0,0 +1,121 @@
+-- The per-row triggers of 0007 and 0010 updated clients once for every
+-- membership, registration and payment row written: a checkout wrote the
+-- client twice and an expiry batch of 1000 memberships 1000 times.
+-- Statement triggers read the changed rows from transition tables and bump
+-- every affected client once. A client row this transaction already wrote
+-- is skipped, its data_version has changed for everyone reading after the
+-- commit.
+
+CREATE OR REPLACE FUNCTION bump_data_versions(p_ids INT[])
+RETURNS VOID
+LANGUAGE sql
+AS $$
+    UPDATE clients SET data_version = data_version + 1
+    WHERE id_client = ANY(p_ids)
+      AND xmin <> pg_current_xact_id()::xid;
+$$;
+
+-- Rows owned by a client through id_client
+CREATE OR REPLACE FUNCTION bump_client_data_versions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_data_versions(ARRAY(SELECT DISTINCT id_client FROM new_rows));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_data_versions(ARRAY(SELECT DISTINCT id_client FROM old_rows));
+    ELSE
+        PERFORM bump_data_versions(ARRAY(
+            SELECT id_client FROM old_rows UNION SELECT id_client FROM new_rows
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+-- Payments belong to the client through their membership
+CREATE OR REPLACE FUNCTION bump_payment_client_data_versions()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM bump_data_versions(ARRAY(
+            SELECT DISTINCT m.id_client FROM new_rows p JOIN memberships m USING (id_membership)
+        ));
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM bump_data_versions(ARRAY(
+            SELECT DISTINCT m.id_client FROM old_rows p JOIN memberships m USING (id_membership)
+        ));
+    ELSE
+        PERFORM bump_data_versions(ARRAY(
+            SELECT m.id_client
+            FROM (SELECT id_membership FROM old_rows UNION SELECT id_membership FROM new_rows) p
+            JOIN memberships m USING (id_membership)
+        ));
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS memberships_client_data_version ON memberships;
+DROP TRIGGER IF EXISTS registered_client_data_version ON registered;
+DROP TRIGGER IF EXISTS payments_client_data_version ON payments;
+DROP FUNCTION IF EXISTS bump_client_data_version();
+DROP FUNCTION IF EXISTS bump_payment_client_data_version();
+
+-- A trigger with transition tables handles a single event
+DROP TRIGGER IF EXISTS memberships_client_data_version_insert ON memberships;
+CREATE TRIGGER memberships_client_data_version_insert
+    AFTER INSERT ON memberships
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS memberships_client_data_version_update ON memberships;
+CREATE TRIGGER memberships_client_data_version_update
+    AFTER UPDATE ON memberships
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS memberships_client_data_version_delete ON memberships;
+CREATE TRIGGER memberships_client_data_version_delete
+    AFTER DELETE ON memberships
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS registered_client_data_version_insert ON registered;
+CREATE TRIGGER registered_client_data_version_insert
+    AFTER INSERT ON registered
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS registered_client_data_version_update ON registered;
+CREATE TRIGGER registered_client_data_version_update
+    AFTER UPDATE ON registered
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS registered_client_data_version_delete ON registered;
+CREATE TRIGGER registered_client_data_version_delete
+    AFTER DELETE ON registered
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_client_data_versions();
+
+DROP TRIGGER IF EXISTS payments_client_data_version_insert ON payments;
+CREATE TRIGGER payments_client_data_version_insert
+    AFTER INSERT ON payments
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_payment_client_data_versions();
+
+DROP TRIGGER IF EXISTS payments_client_data_version_update ON payments;
+CREATE TRIGGER payments_client_data_version_update
+    AFTER UPDATE ON payments
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_payment_client_data_versions();
+
+DROP TRIGGER IF EXISTS payments_client_data_version_delete ON payments;
+CREATE TRIGGER payments_client_data_version_delete
+    AFTER DELETE ON payments
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_payment_client_data_versions();